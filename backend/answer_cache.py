@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+
+class _CachedAnswer(NamedTuple):
+    vector: List[float]
+    answer: str
+    created_at: float
+
+
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def _numbers(text: str) -> List[str]:
+    """问题中出现的数字，数字不同的问题(例如 2+3 和 2+4)答案也不同"""
+    return _NUMBER_RE.findall(text)
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def context_key(*parts: str) -> str:
+    """上下文的哈希，parts 依次为回答类型、模型配置、检索到的内容等"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def chat_context_key(model: str, knowledge_text: str) -> Optional[str]:
+    """
+    聊天回答的缓存上下文，只由检索到的文件内容和模型配置决定。
+
+    对话历史每一轮都会变化，会话ID也因人而异，都不参与缓存键，这样同一问题在后续轮次
+    或其他会话中针对相同文件内容提问时才能命中。没有检索到内容时返回 None：
+    这类回答依赖当前时间或搜索结果，不缓存。
+    """
+    if not knowledge_text:
+        return None
+    return context_key("chat", model, knowledge_text)
+
+
+async def replay_chain(answer: str, chunk_chars: int = 16):
+    """把缓存的回答切成小段按流式输出，与调用大模型时的界面表现一致"""
+    for i in range(0, len(answer), chunk_chars):
+        yield answer[i:i + chunk_chars]
+        await asyncio.sleep(0)
+
+
+class AnswerCache:
+    """
+    语义回答缓存。
+
+    只有上下文哈希(检索到的内容和模型配置)完全相同时才会比较问题：
+    问题规范化后相同直接命中，否则比较问题嵌入向量的余弦相似度，超过 threshold 即命中。
+    短于 min_semantic_chars 的问题和所含数字不同的问题只按原文匹配，
+    避免 "2+3" 和 "2+4" 这类字面相近的问题互相命中。
+    条目超过 ttl_seconds 过期，总数超过 max_entries 时淘汰最久未使用的条目。
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        threshold: float = 0.95,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1000,
+        min_semantic_chars: int = 12
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.min_semantic_chars = min_semantic_chars
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], _CachedAnswer]" = OrderedDict()
+        self._by_context: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, question: str, context: str) -> Optional[str]:
+        """查找缓存的回答，未命中返回 None"""
+        normalized = _normalize(question)
+        with self._lock:
+            self._expire()
+            entry = self._touch((context, normalized))
+            numbers = _numbers(normalized)
+            candidates = [
+                q for q in self._by_context.get(context, ())
+                if len(q) >= self.min_semantic_chars and _numbers(q) == numbers
+            ] if len(normalized) >= self.min_semantic_chars else []
+        if entry is None and candidates:
+            vector = self.embeddings.embed_query(question)
+            with self._lock:
+                best = max(
+                    ((_cosine(vector, self._entries[(context, q)].vector), q)
+                     for q in candidates if (context, q) in self._entries),
+                    default=(0.0, None)
+                )
+                if best[0] >= self.threshold:
+                    entry = self._touch((context, best[1]))
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry.answer
+
+    def store(self, question: str, context: str, answer: str) -> None:
+        if not answer:
+            return
+        normalized = _normalize(question)
+        vector = self.embeddings.embed_query(question)
+        with self._lock:
+            self._entries[(context, normalized)] = _CachedAnswer(vector, answer, time.time())
+            self._entries.move_to_end((context, normalized))
+            self._by_context.setdefault(context, set()).add(normalized)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    async def alookup(self, question: str, context: str) -> Optional[str]:
+        """在线程中查找，计算问题嵌入时不阻塞事件循环"""
+        return await asyncio.to_thread(self.lookup, question, context)
+
+    async def astore(self, question: str, context: str, answer: str) -> None:
+        await asyncio.to_thread(self.store, question, context, answer)
+
+    def stats(self) -> Dict[str, float]:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _touch(self, key: Tuple[str, str]) -> Optional[_CachedAnswer]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _expire(self):
+        # 条目按使用顺序排列而不是创建顺序，需要完整扫描；条目数有上限，开销可控
+        deadline = time.time() - self.ttl_seconds
+        for key in [key for key, entry in self._entries.items() if entry.created_at < deadline]:
+            self._remove(key)
+
+    def _remove(self, key: Tuple[str, str]):
+        del self._entries[key]
+        questions = self._by_context.get(key[0])
+        if questions is not None:
+            questions.discard(key[1])
+            if not questions:
+                del self._by_context[key[0]]
@@ -0,0 +1,76 @@
+import threading
+from typing import Optional
+
+from backend.llm_setup import init_chat_client, init_llm
+from backend.qa_chain import create_chat_chain, create_conv_summary_chain, create_qa_chain
+from backend.tool_cache import ToolResultCache
+from config import config
+
+# 影响大模型、客户端和工具初始化的配置项
+_FINGERPRINT_FIELDS = (
+    "USE_CUSTOM_MODEL",
+    "OPENAI_API_KEY", "OPENAI_API_BASE", "OPENAI_MODEL_NAME",
+    "CUSTOM_MODEL_API_KEY", "CUSTOM_MODEL_API_BASE", "CUSTOM_MODEL_NAME",
+    "TEMPERATURE", "MAX_TOKENS", "TAVILY_API_KEY",
+)
+
+
+def config_fingerprint() -> tuple:
+    return tuple(getattr(config, field) for field in _FINGERPRINT_FIELDS)
+
+
+class ChainRegistry:
+    """
+    对话链注册表。
+
+    大模型、工具调用用的 AsyncOpenAI 客户端和各条链在第一次使用时创建一次，所有消息共用，
+    并复用传入的共享 HTTP 连接池。每次获取时比较相关配置项，配置变化(例如运行中修改了
+    config 的模型或密钥)时才重新创建；也可以调用 reset() 强制在下次使用时重建。
+    """
+
+    def __init__(self, http_client=None, http_async_client=None, tool_cache: Optional[ToolResultCache] = None):
+        self.http_client = http_client
+        self.http_async_client = http_async_client
+        # 搜索结果缓存不随链重建而清空
+        self.tool_cache = tool_cache
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._chains = {}
+        self.llm = None
+        self.client = None
+
+    def _build(self):
+        self.llm = init_llm(self.http_client, self.http_async_client)
+        self.client, model_name = init_chat_client(self.http_async_client)
+        self._chains = {
+            "chat": create_chat_chain(
+                self.llm, client=self.client, model_name=model_name, tool_cache=self.tool_cache
+            ),
+            "qa": create_qa_chain(self.llm),
+            "conv_summary": create_conv_summary_chain(self.llm),
+        }
+
+    def _ensure_built(self):
+        fingerprint = config_fingerprint()
+        if fingerprint != self._fingerprint:
+            if self._fingerprint is not None:
+                print("Chains: configuration changed, rebuilding chains")
+            self._build()
+            self._fingerprint = fingerprint
+
+    def reset(self):
+        """丢弃已创建的链和客户端，下次使用时按当前配置重建"""
+        with self._lock:
+            self._fingerprint = None
+            self._chains = {}
+
+    def get(self, name: str):
+        """按名称获取链：chat、qa 或 conv_summary"""
+        with self._lock:
+            self._ensure_built()
+            return self._chains[name]
+
+    def get_llm(self):
+        with self._lock:
+            self._ensure_built()
+            return self.llm
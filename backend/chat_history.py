@@ -1,80 +1,134 @@
+import threading
+from collections import OrderedDict
 from typing import List, Dict
 from datetime import datetime
-import json
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.documents import Document
+from backend.transcript_store import TranscriptStore
 
 class ChatHistoryManager:
-    def __init__(self, vector_store):
+    def __init__(
+        self,
+        vector_store,
+        transcript_store: TranscriptStore,
+        index_messages: bool = False,
+        max_cached_counts: int = 10000
+    ):
         self.vector_store = vector_store
-        
+        # 聊天记录保存在独立的记录存储中，不再经过嵌入模型
+        self.transcript_store = transcript_store
+        # 开启后在后台把消息写入向量存储，用于对历史消息做语义检索
+        self.index_messages = index_messages
+        self._indexer = ThreadPoolExecutor(max_workers=1) if index_messages else None
+        # 最近活跃会话的用户消息条数(LRU)，首次查询时从记录存储中统计，之后随保存递增；
+        # 被淘汰的会话再次查询时重新统计，统计走 (conversation_id, seq) 索引
+        self._user_counts: "OrderedDict[str, int]" = OrderedDict()
+        self.max_cached_counts = max(1, max_cached_counts)
+        self._counts_lock = threading.Lock()
+
+        if self.transcript_store.is_empty():
+            self._import_legacy_messages()
+
+    def _import_legacy_messages(self):
+        """一次性导入旧版本保存在向量存储中的聊天记录"""
+        try:
+            results = self.vector_store.get(
+                where={"type": {"$eq": "chat_message"}},
+                include=["metadatas", "documents"]
+            )
+        except Exception as e:
+            print(f"Error reading legacy chat messages: {e}")
+            return
+
+        if not results or not results['ids']:
+            return
+
+        messages = [
+            {
+                "conversation_id": metadata["conversation_id"],
+                "role": metadata["role"],
+                "content": doc,
+                "timestamp": metadata["timestamp"]
+            }
+            for doc, metadata in zip(results['documents'], results['metadatas'])
+        ]
+        self.transcript_store.extend(sorted(messages, key=lambda x: x["timestamp"]))
+        print(f"ChatHistory: imported {len(messages)} legacy messages")
+
     def save_message(self, conversation_id: str, role: str, content: str):
-        """保存聊天消息到向量存储"""
+        """保存聊天消息"""
+        timestamp = datetime.now().isoformat()  # ISO格式的时间戳字符串
+        conversation_id = str(conversation_id)  # 确保是字符串
+        # 写入和计数在同一把锁内完成，避免并发统计时重复计数
+        with self._counts_lock:
+            self.transcript_store.append(
+                conversation_id=conversation_id,
+                role=str(role),  # 确保是字符串
+                content=str(content),  # 确保内容是字符串
+                timestamp=timestamp
+            )
+            if role == "user" and conversation_id in self._user_counts:
+                self._user_counts[conversation_id] += 1
+                self._user_counts.move_to_end(conversation_id)
+
+        if self._indexer is not None:
+            self._indexer.submit(self._index_message, conversation_id, role, content, timestamp)
+
+    def _index_message(self, conversation_id: str, role: str, content: str, timestamp: str):
+        """把消息写入向量存储，在后台线程中执行"""
         metadata = {
-            "conversation_id": str(conversation_id),  # 确保是字符串
-            "role": str(role),  # 确保是字符串
-            "timestamp": datetime.now().isoformat(),  # ISO格式的时间戳字符串
+            "conversation_id": str(conversation_id),
+            "role": str(role),
+            "timestamp": timestamp,
             "type": "chat_message"
         }
-        
-        # 确保所有元数据值都是基本类型
-        for key, value in metadata.items():
-            if value is None:
-                metadata[key] = ""  # 将 None 转换为空字符串
-        
-        doc = Document(
-            page_content=str(content),  # 确保内容是字符串
-            metadata=metadata
-        )
-        
-        self.vector_store.add_documents([doc])
-        
+        try:
+            self.vector_store.add_documents([Document(page_content=str(content), metadata=metadata)])
+        except Exception as e:
+            print(f"Error indexing chat message: {e}")
+
+    def count_user_messages(self, conversation_id: str) -> int:
+        """会话中用户消息的条数，不需要读取历史记录"""
+        conversation_id = str(conversation_id)
+        with self._counts_lock:
+            count = self._user_counts.get(conversation_id)
+            if count is None:
+                count = self._user_counts[conversation_id] = self.transcript_store.count(conversation_id, role="user")
+                while len(self._user_counts) > self.max_cached_counts:
+                    self._user_counts.popitem(last=False)
+            else:
+                self._user_counts.move_to_end(conversation_id)
+            return count
+
+    def has_title(self, conversation_id: str) -> bool:
+        """会话是否已经自动生成过标题"""
+        return self.transcript_store.get_title(str(conversation_id)) is not None
+
+    def save_title(self, conversation_id: str, title: str):
+        self.transcript_store.set_title(str(conversation_id), title)
+
     def get_conversation_history(self, conversation_id: str) -> List[Dict]:
         """获取特定会话的历史记录"""
-        where_clause = {
-            "$and": [
-                {"conversation_id": {"$eq": conversation_id}},
-                {"type": {"$eq": "chat_message"}}
-            ]
-        }
-        
-        results = self.vector_store.get(
-            where=where_clause,
-            include=["metadatas", "documents"]
-        )
-        
-        if not results or not results['ids']:
-            return []
-            
-        messages = []
-        for doc, metadata in zip(results['documents'], results['metadatas']):
-            messages.append({
-                "role": metadata["role"],
-                "content": doc,
-                "timestamp": metadata["timestamp"]
-            })
-        
-        # 确保按时间戳排序
-        return sorted(messages, key=lambda x: x["timestamp"])
+        return self.transcript_store.history(conversation_id)
 
-    def get_recent_messages(self, conversation_id: str, limit: int = 5) -> str:
-        """获取最近的几条对话记录并格式化"""
+    def get_recent_lines(self, conversation_id: str, limit: int = 5) -> List[str]:
+        """获取最近的几条对话记录，每条格式化为一行"""
         try:
-            messages = self.get_conversation_history(conversation_id)
-            
-            # 获取最近的消息
-            recent_messages = messages[-limit:] if len(messages) > limit else messages
-            
-            # 格式化对话历史
-            formatted_history = []
-            for msg in recent_messages:
-                role = "用户" if msg["role"] == "user" else "助手"
-                formatted_history.append(f"{role}: {msg['content']}")
-            
-            return "\n".join(formatted_history)
+            recent_messages = self.transcript_store.tail(conversation_id, limit)
         except Exception as e:
             print(f"Error getting conversation history: {e}")
-            return ""
-        
+            return []
+
+        formatted_history = []
+        for msg in recent_messages:
+            role = "用户" if msg["role"] == "user" else "助手"
+            formatted_history.append(f"{role}: {msg['content']}")
+        return formatted_history
+
+    def get_recent_messages(self, conversation_id: str, limit: int = 5) -> str:
+        """获取最近的几条对话记录并格式化"""
+        return "\n".join(self.get_recent_lines(conversation_id, limit))
+
     def generate_conv_summary(self, conversation_id: str) -> str:
         """生成生成标题所需的对话内容"""
         conv_messages = self.get_conversation_history(conversation_id)
@@ -85,4 +139,4 @@ class ChatHistoryManager:
             elif message["role"] == "assistant":
                 conv += f"Assistant: {message['content']}\n"
 
-        return conv
\ No newline at end of file
+        return conv
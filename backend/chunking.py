@@ -0,0 +1,206 @@
+import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config import config
+
+# 中文没有空行时也能按句切分
+_CJK_SEPARATORS = ["。", "！", "？", "；", "……", "，", "、"]
+_DEFAULT_SEPARATORS = ["\n\n", "\n", *_CJK_SEPARATORS, ". ", " ", ""]
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+
+def _estimate_tokens(text: str) -> int:
+    """无法加载分词器时的估算：每个中日韩字符算一个 token，其余按约 4 个字符一个 token"""
+    cjk = len(_CJK_RE.findall(text))
+    other = sum(max(1, (len(word) + 3) // 4) for word in _WORD_RE.findall(_CJK_RE.sub(" ", text)))
+    return cjk + other
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding_name: str) -> Callable[[str], int]:
+    """返回计算 token 数的函数，tiktoken 不可用(例如离线无法下载词表)时退回估算"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        print(f"Chunking: tiktoken encoding {encoding_name} unavailable ({str(e)}), estimating tokens")
+        return _estimate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str) -> int:
+    """按嵌入模型分词器配置计算文本的 token 数"""
+    return get_token_counter(config.CHUNK_TOKEN_ENCODING)(text)
+
+
+class ChunkStats:
+    """记录一个文件切分出的文本块大小，用于在日志中输出分布"""
+
+    def __init__(self, chunk_tokens: int):
+        self.chunk_tokens = chunk_tokens
+        # 按块大小的 1/8 分桶，最后一个桶统计超出上限的块
+        self.bounds = [chunk_tokens * i // 8 for i in range(1, 9)]
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, tokens: int):
+        self.buckets[bisect_right(self.bounds, tokens - 1)] += 1
+        self.count += 1
+        self.total += tokens
+        self.max = max(self.max, tokens)
+
+    def summary(self) -> str:
+        if not self.count:
+            return "0 chunks"
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        histogram = " ".join(f"{label}:{n}" for label, n in zip(labels, self.buckets) if n)
+        return (
+            f"{self.count} chunks, avg {self.total // self.count} tokens, "
+            f"max {self.max}/{self.chunk_tokens}, histogram {histogram}"
+        )
+
+
+class Chunker:
+    """
+    按 token 数切分文本块，保证每块不超过嵌入模型的窗口。
+
+    逐页调用 split，全部页面处理完后调用 flush 取回剩余的文本块；
+    每个文本块的 token 数记录在 metadata["tokens"] 中。
+    """
+
+    separators = _DEFAULT_SEPARATORS
+    separators_are_regex = False
+
+    def __init__(self, chunk_tokens: int, overlap_tokens: int, counter: Callable[[str], int]):
+        self.chunk_tokens = chunk_tokens
+        self.counter = counter
+        self.stats = ChunkStats(chunk_tokens)
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_tokens,
+            chunk_overlap=min(overlap_tokens, chunk_tokens // 2),
+            length_function=counter,
+            separators=self.separators,
+            is_separator_regex=self.separators_are_regex,
+            keep_separator="end"
+        )
+
+    def split(self, page: Document) -> List[Document]:
+        return self._finish(self.splitter.split_documents([page]))
+
+    def flush(self) -> List[Document]:
+        return []
+
+    def _finish(self, chunks: List[Document]) -> List[Document]:
+        result = []
+        for chunk in chunks:
+            if not chunk.page_content.strip():
+                continue
+            tokens = self.counter(chunk.page_content)
+            chunk.metadata["tokens"] = tokens
+            self.stats.add(tokens)
+            result.append(chunk)
+        return result
+
+
+class MarkdownChunker(Chunker):
+    """Markdown 优先按标题、分隔线切分"""
+
+    # 用前瞻只切在标题、分隔线之前的换行上，标记留在下一块的开头
+    separators = [
+        r"\n(?=#{1,6} )",
+        r"\n(?=(?:\*\*\*+|---+|___+)\n)",
+        *(re.escape(separator) for separator in _DEFAULT_SEPARATORS)
+    ]
+    separators_are_regex = True
+
+
+class PDFChunker(Chunker):
+    """PDF 按页切分，文本块不跨页，并合并 PDF 提取时产生的断行"""
+
+    _HYPHEN_BREAK = re.compile(r"(\w)-\n(\w)")
+    _CJK_BREAK = re.compile(r"(?<=[一-鿿])\n(?=[一-鿿])")
+
+    def split(self, page: Document) -> List[Document]:
+        text = self._HYPHEN_BREAK.sub(r"\1\2", page.page_content)
+        page.page_content = self._CJK_BREAK.sub("", text)
+        return super().split(page)
+
+
+class CSVChunker(Chunker):
+    """CSV 每行是一页，把连续的行合并成不超过窗口的行组，单行过长时再按 token 切分"""
+
+    def __init__(self, chunk_tokens: int, overlap_tokens: int, counter: Callable[[str], int]):
+        super().__init__(chunk_tokens, overlap_tokens, counter)
+        self._rows: List[Document] = []
+        self._row_tokens = 0
+
+    def split(self, page: Document) -> List[Document]:
+        tokens = self.counter(page.page_content) + 1
+        if tokens > self.chunk_tokens:
+            return self.flush() + super().split(page)
+
+        chunks = []
+        if self._row_tokens + tokens > self.chunk_tokens:
+            chunks = self.flush()
+        self._rows.append(page)
+        self._row_tokens += tokens
+        return chunks
+
+    def flush(self) -> List[Document]:
+        if not self._rows:
+            return []
+        first, last = self._rows[0], self._rows[-1]
+        metadata = dict(first.metadata)
+        if "row" in last.metadata:
+            metadata["row_end"] = last.metadata["row"]
+        group = Document(page_content="\n".join(row.page_content for row in self._rows), metadata=metadata)
+        self._rows, self._row_tokens = [], 0
+        return self._finish([group])
+
+
+_CHUNKERS: Dict[str, type] = {
+    ".md": MarkdownChunker,
+    ".markdown": MarkdownChunker,
+    ".pdf": PDFChunker,
+    ".csv": CSVChunker,
+}
+
+
+def get_chunker(
+    file_path: str = "",
+    chunk_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None
+) -> Chunker:
+    """根据文件类型选择切分策略"""
+    extension = os.path.splitext(file_path)[1].lower()
+    chunker_class = _CHUNKERS.get(extension, Chunker)
+    return chunker_class(
+        chunk_tokens or config.CHUNK_TOKENS,
+        config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens,
+        get_token_counter(config.CHUNK_TOKEN_ENCODING)
+    )
+
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    """按来源文件的类型切分一组已加载的文档"""
+    chunks = []
+    chunkers: Dict[str, Chunker] = {}
+    for doc in documents:
+        source = str(doc.metadata.get("source", ""))
+        if source not in chunkers:
+            chunkers[source] = get_chunker(source)
+        chunks.extend(chunkers[source].split(doc))
+    for source, chunker in chunkers.items():
+        chunks.extend(chunker.flush())
+        print(f"Chunking: {os.path.basename(source) or 'documents'} {chunker.stats.summary()}")
+    return chunks
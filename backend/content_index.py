@@ -0,0 +1,107 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    file_hash TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    file_name TEXT,
+    PRIMARY KEY (file_hash, conversation_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_hash TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    vector_id TEXT NOT NULL,
+    PRIMARY KEY (chunk_hash, conversation_id)
+) WITHOUT ROWID;
+"""
+
+
+def chunk_sha256(text: str) -> str:
+    """文本块内容的 sha256"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def vector_id(chunk_hash: str, conversation_id: str) -> str:
+    """文本块在某个会话中的向量ID，同一会话重复入库时会覆盖而不是新增"""
+    return f"{chunk_hash}:{conversation_id}"
+
+
+class ContentIndex:
+    """
+    内容哈希索引，记录哪些文件、哪些文本块已经在哪些会话中入库。
+
+    已入库的文件再次关联到同一会话时可以跳过入库；已在其他会话中嵌入过的文本块
+    只需复制已有向量并关联到新会话，不再调用嵌入模型。
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def has_document(self, file_hash: str, conversation_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE file_hash = ? AND conversation_id = ?",
+                (file_hash, conversation_id)
+            ).fetchone()
+        return row is not None
+
+    def add_document(self, file_hash: str, conversation_id: str, file_name: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (file_hash, conversation_id, file_name) VALUES (?, ?, ?)",
+                (file_hash, conversation_id, file_name)
+            )
+
+    def linked_chunks(self, chunk_hashes: List[str], conversation_id: str) -> Set[str]:
+        """返回已经关联到该会话的文本块哈希"""
+        found = set()
+        with self._lock:
+            for batch in _batched(list(dict.fromkeys(chunk_hashes))):
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT chunk_hash FROM chunks WHERE conversation_id = ? AND chunk_hash IN ({placeholders})",
+                    (conversation_id, *batch)
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def find_vectors(self, chunk_hashes: List[str]) -> Dict[str, str]:
+        """为每个已入库过的文本块哈希返回任意一个已有的向量ID"""
+        found = {}
+        with self._lock:
+            for batch in _batched(list(dict.fromkeys(chunk_hashes))):
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT chunk_hash, vector_id FROM chunks WHERE chunk_hash IN ({placeholders})",
+                    batch
+                ).fetchall()
+                found.update((chunk_hash, vid) for chunk_hash, vid in rows)
+        return found
+
+    def add_chunks(self, entries: Iterable[Tuple[str, str, str]]) -> None:
+        """登记 (文本块哈希, 会话ID, 向量ID)"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_hash, conversation_id, vector_id) VALUES (?, ?, ?)",
+                list(entries)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _batched(items: List[str], size: int = 500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
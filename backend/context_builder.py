@@ -0,0 +1,154 @@
+import asyncio
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from backend.chunking import count_tokens
+from backend.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from backend.metrics import SIZE_BUCKETS, metrics
+from backend.text_utils import tokenize
+
+
+class BuiltContext(NamedTuple):
+    """打包好的提示词上下文，usage 为各部分使用的 token 数"""
+    question: str
+    chat_history: str
+    knowledge_text: str
+    documents: List[Document]
+    usage: Dict[str, int]
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextBuilder:
+    """
+    在固定的 token 预算内组装对话提示词的上下文。
+
+    问题、对话历史和检索到的文件内容共享同一个预算：问题总是完整保留；对话历史从最近
+    一条往前取，最多占用 history_tokens；剩余预算按检索排序贪心装入文本块。检索时多取
+    候选并用 MMR 保证多样性，再去掉内容几乎相同的文本块(例如重叠切分出的相同段落)。
+
+    提供 lexical_index 时先做 BM25 关键词检索，再与向量检索结果按倒数排名融合，
+    精确的文件名、编号等也能被检索到。关键词检索每命中一个文本块，向量检索就少取一个，
+    最少取 min_k 个：精确匹配已由关键词检索覆盖，向量检索只需补充语义相近的内容。
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        token_budget: int = 6000,
+        history_tokens: int = 1500,
+        k: int = 8,
+        fetch_k: int = 24,
+        min_k: int = 4,
+        lambda_mult: float = 0.5,
+        dedup_threshold: float = 0.85,
+        lexical_index: Optional[LexicalIndex] = None,
+        lexical_k: int = 8
+    ):
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.lexical_k = lexical_k
+        self.token_budget = token_budget
+        self.history_tokens = history_tokens
+        self.k = k
+        self.fetch_k = max(fetch_k, k)
+        self.min_k = max(1, min(min_k, k))
+        self.lambda_mult = lambda_mult
+        self.dedup_threshold = dedup_threshold
+
+    def vector_k(self, lexical_hits: int) -> Tuple[int, int]:
+        """关键词检索命中 lexical_hits 个文本块时向量检索的 (k, fetch_k)，候选数按同样比例缩小"""
+        k = max(self.min_k, self.k - lexical_hits)
+        return k, max(k, self.fetch_k * k // self.k)
+
+    def retrieve(self, question: str, conversation_id: str) -> List[Document]:
+        """检索会话中的候选文本块：先做 BM25 关键词检索，再按命中数缩小向量检索的 k，最后融合"""
+        lexical_docs = []
+        if self.lexical_index is not None:
+            with metrics.span("lexical_search"):
+                lexical_docs = self.lexical_index.search(question, conversation_id, k=self.lexical_k)
+        k, fetch_k = self.vector_k(len(lexical_docs))
+        with metrics.span("similarity_search"):
+            vector_docs = self.vector_store.max_marginal_relevance_search(
+                question,
+                k=k,
+                fetch_k=fetch_k,
+                lambda_mult=self.lambda_mult,
+                filter={"conversation_id": conversation_id}
+            )
+        if not lexical_docs:
+            return vector_docs
+        return reciprocal_rank_fusion([vector_docs, lexical_docs])
+
+    def pack(self, question: str, history_lines: List[str], candidates: List[Document]) -> BuiltContext:
+        """在预算内装入对话历史和候选文本块，candidates 按相关性从高到低排列"""
+        question_tokens = count_tokens(question)
+        remaining = max(0, self.token_budget - question_tokens)
+
+        # 对话历史从最近一条往前取，保持原有顺序
+        history, history_tokens = [], 0
+        history_budget = min(self.history_tokens, remaining)
+        for line in reversed(history_lines):
+            tokens = count_tokens(line) + 1
+            if history_tokens + tokens > history_budget:
+                break
+            history.append(line)
+            history_tokens += tokens
+        history.reverse()
+        remaining -= history_tokens
+
+        documents, knowledge_tokens = [], 0
+        seen_hashes, kept_terms = set(), []
+        for doc in candidates:
+            chunk_hash = doc.metadata.get("chunk_hash")
+            if chunk_hash and chunk_hash in seen_hashes:
+                continue
+            terms = set(tokenize(doc.page_content))
+            if any(_jaccard(terms, other) >= self.dedup_threshold for other in kept_terms):
+                continue
+            tokens = doc.metadata.get("tokens") or count_tokens(doc.page_content)
+            # 放不下的文本块跳过，后面更短的文本块仍有机会装入
+            if knowledge_tokens + tokens + 1 > remaining:
+                continue
+            documents.append(doc)
+            knowledge_tokens += tokens + 1
+            seen_hashes.add(chunk_hash)
+            kept_terms.append(terms)
+
+        usage = {
+            "question": question_tokens,
+            "history": history_tokens,
+            "knowledge": knowledge_tokens,
+            "total": question_tokens + history_tokens + knowledge_tokens,
+            "budget": self.token_budget,
+        }
+        print(
+            f"Context: question {question_tokens} tokens, "
+            f"history {history_tokens} tokens ({len(history)}/{len(history_lines)} messages), "
+            f"knowledge {knowledge_tokens} tokens ({len(documents)}/{len(candidates)} chunks), "
+            f"total {usage['total']}/{self.token_budget}"
+        )
+        return BuiltContext(
+            question=question,
+            chat_history="\n".join(history),
+            knowledge_text="\n".join(doc.page_content for doc in documents),
+            documents=documents,
+            usage=usage
+        )
+
+    def build(self, question: str, conversation_id: str, history_lines: List[str]) -> BuiltContext:
+        candidates = self.retrieve(question, conversation_id)
+        with metrics.span("prompt_build"):
+            context = self.pack(question, history_lines, candidates)
+        for part in ("question", "history", "knowledge", "total"):
+            metrics.observe("context_tokens", context.usage[part], buckets=SIZE_BUCKETS, part=part)
+        return context
+
+    async def abuild(self, question: str, conversation_id: str, history_lines: List[str]) -> BuiltContext:
+        """在线程中检索和计算 token，不阻塞事件循环"""
+        return await asyncio.to_thread(self.build, question, conversation_id, history_lines)
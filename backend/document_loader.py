@@ -5,19 +5,21 @@ from langchain_community.document_loaders import (
     TextLoader, 
     UnstructuredFileLoader
 )
-from langchain_text_splitters import CharacterTextSplitter
+from backend.chunking import get_chunker, split_documents
+from backend.html_extract import ExtractedPage, Section, extract_html
+from backend.metrics import metrics
+from langchain_core.documents import Document
 import os
 import mimetypes
 import shutil
+import hashlib
+import uuid
+import asyncio
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
 
 
-executor = ThreadPoolExecutor(max_workers=5) 
-
-
-def load_document(file_path: str):
-    """根据文件类型加载文档"""
+def get_loader(file_path: str):
+    """根据文件类型创建文档加载器"""
     file_extension = os.path.splitext(file_path)[1].lower()
     
     if file_extension == '.pdf':
@@ -42,20 +44,82 @@ def load_document(file_path: str):
         except:
             raise ValueError(f"不支持的文件类型: {file_extension}")
     
-    return loader.load()
+    return loader
 
-async def process_uploaded_file(element, vector_store, config, conversation_id):
+def load_document(file_path: str):
+    """根据文件类型加载文档"""
+    return get_loader(file_path).load()
+
+def lazy_load_document(file_path: str):
+    """逐页(逐行、逐段)读取文档，不一次性加载全部内容"""
+    return get_loader(file_path).lazy_load()
+
+def read_document(file_path: str, metadata: dict, prefix_chars: int, on_chunks=None) -> str:
+    """
+    逐页读取文档并切分，每页的文本块交给 on_chunks 回调，只保留前 prefix_chars 个字符。
+
+    内存中只保留当前一页的内容；on_chunks 为 None 时只读取前缀，读满即停止。
+    返回文档内容的前缀。
+    """
+    prefix_parts, prefix_len = [], 0
+    chunker = get_chunker(file_path)
+    for page in lazy_load_document(file_path):
+        if prefix_len < prefix_chars:
+            part = page.page_content[:prefix_chars - prefix_len]
+            prefix_parts.append(part)
+            prefix_len += len(part)
+        elif on_chunks is None:
+            break
+        if on_chunks is None:
+            continue
+
+        page.metadata.update(metadata)
+        chunks = chunker.split(page)
+        if chunks:
+            on_chunks(chunks)
+
+    if on_chunks is not None:
+        chunks = chunker.flush()
+        if chunks:
+            on_chunks(chunks)
+        print(f"Chunking: {os.path.basename(file_path)} {chunker.stats.summary()}")
+    return "".join(prefix_parts)
+
+def file_sha256(file_path: str) -> str:
+    """分块计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def save_upload(source_path: str, file_hash: str, file_name: str, upload_folder: str) -> str:
+    """以 内容哈希+扩展名 保存上传文件，已存在时直接复用"""
+    extension = os.path.splitext(file_name)[1].lower()
+    save_path = os.path.join(upload_folder, f"{file_hash}{extension}")
+    if not os.path.exists(save_path):
+        # 先复制到临时文件再重命名，避免并发上传同一文件时读到不完整的内容
+        temp_path = f"{save_path}.{uuid.uuid4().hex}.tmp"
+        # 使用 shutil.copy2 来保留文件元数据
+        shutil.copy2(source_path, temp_path)
+        os.replace(temp_path, save_path)
+    return save_path
+
+async def process_uploaded_file(element, pipeline, config, conversation_id, parser_pool):
     """
     处理上传的文件并添加到向量存储中。
 
     参数:
         element (cl.File): Chainlit文件对象
-        vector_store: 向量存储对象
+        pipeline (IngestionPipeline): 向量化入库流水线
         config: 配置对象
         conversation_id: 会话ID
+        parser_pool (ParserPool): 文档解析进程池
 
     返回:
-        tuple: (bool, str, str) - (是否成功, 消息, 文档内容)
+        tuple: (bool, str, str) - (是否成功, 消息, 文档内容的前 QA_CONTEXT_CHARS 个字符)
+
+    文件在解析进程池中逐页解析并提交后即返回，入库在后台进行，进度可以通过 pipeline.jobs 按会话查询。
     """
     try:
         # 确保上传目录存在
@@ -75,39 +139,131 @@ async def process_uploaded_file(element, vector_store, config, conversation_id):
         ]
         
         if mime_type in supported_mimes or element.name.endswith(('.csv', '.txt', '.md')):
-            # 保存文件
             file_name = element.name
-            save_path = os.path.join(config.UPLOAD_FOLDER, file_name)
-            
-            # 使用 shutil.copy2 来保留文件元数据
-            shutil.copy2(element.path, save_path)
-            
-            # 处理文档
-            documents = load_document(save_path)  # 使用保存后的文件路径
-            result_text = ""
-            for doc in documents:
-                result_text += doc.page_content
-                doc.metadata.update({   
+            # 先登记入库任务，解析期间同一会话的提问也能等待该文件
+            file_hash = await asyncio.to_thread(file_sha256, element.path)
+            job = pipeline.jobs.create(file_hash, conversation_id, file_name)
+            job.future.add_done_callback(lambda _: _log_index_result(file_name, job))
+            try:
+                # 按内容哈希保存文件，同名的不同文件不会互相覆盖，相同文件只保存一份
+                save_path = await asyncio.to_thread(
+                    save_upload, element.path, job.file_hash, file_name, config.UPLOAD_FOLDER
+                )
+                
+                metadata = {
                     "type": "document",
                     "file_name": file_name,
+                    "file_hash": job.file_hash,
                     "mime_type": mime_type,
                     "timestamp": datetime.now().isoformat(),
                     "conversation_id": conversation_id
-                })
+                }
+                # 该文件已在当前会话中入库时只读取问答所需的前缀，无需重复嵌入
+                already_indexed = (
+                    pipeline.content_index is not None
+                    and pipeline.content_index.has_document(job.file_hash, conversation_id)
+                )
+                # 在子进程中逐页解析，文本块提交到入库流水线，队列已满时解析随之等待
+                with metrics.span("document_parse"):
+                    result_text = await parser_pool.parse(
+                        save_path,  # 使用保存后的文件路径
+                        metadata,
+                        config.QA_CONTEXT_CHARS,
+                        None if already_indexed else lambda chunks: pipeline.feed(chunks, job)
+                    )
+                pipeline.finish(job)
+            except Exception as e:
+                job.fail(e)
+                raise
             
-            # 提交到线程池执行
-            future = executor.submit(add_documents_to_vector_store, documents, vector_store)
-            
-            return True, f"✅ 文件 {file_name} 已成功处理并添加到知识库", result_text
+            return True, f"✅ 文件 {file_name} 已解析，正在建立索引", result_text
         else:
             return False, f"❌ 不支持的文件类型：{mime_type}。请上传 PDF 或 Word 文档。", ""
             
     except Exception as e:
         return False, f"处理文件时出错：{str(e)}", ""
     
-def add_documents_to_vector_store(documents, vector_store):
-    """将文档添加到向量存储中"""
-    text_splitter = CharacterTextSplitter(chunk_size=1200, chunk_overlap=100)
-    texts = text_splitter.split_documents(documents)
-    vector_store.add_documents(texts)
-    print("VectorDB: File index complete...")
\ No newline at end of file
+def read_web_page(result, metadata: dict, on_chunks=None) -> str:
+    """
+    提取下载的网页正文，按小节切分后交给 on_chunks，返回正文全文。
+
+    每个小节作为一页切分，文本块的 metadata 中记录小节标题。
+    """
+    with open(result.path, 'rb') as f:
+        raw = f.read()
+    if result.kind == "html":
+        page = extract_html(raw)
+    else:
+        page = ExtractedPage("", [Section("", raw.decode('utf-8', errors='replace'))])
+
+    if on_chunks is not None:
+        chunker = get_chunker(result.url)
+        for section in page.sections:
+            text = f"{section.heading}\n{section.text}" if section.heading else section.text
+            chunks = chunker.split(Document(
+                page_content=text,
+                metadata={**metadata, "source": result.url, "section": section.heading}
+            ))
+            if chunks:
+                on_chunks(chunks)
+        print(f"Chunking: {result.url} {chunker.stats.summary()}")
+    return page.to_text()
+
+async def process_web_page(result, pipeline, conversation_id):
+    """
+    提取网页正文并添加到向量存储中，后续对话可以检索到网页内容而无需重新下载。
+
+    参数:
+        result (FetchResult): 下载结果
+        pipeline (IngestionPipeline): 向量化入库流水线
+        conversation_id: 会话ID
+
+    返回:
+        tuple: (bool, str, str) - (是否成功, 消息, 网页正文)
+    """
+    try:
+        page_hash = await asyncio.to_thread(file_sha256, result.path)
+        job = pipeline.jobs.create(page_hash, conversation_id, result.url)
+        job.future.add_done_callback(lambda _: _log_index_result(result.url, job))
+        try:
+            metadata = {
+                "type": "document",
+                "file_name": result.url,
+                "file_hash": page_hash,
+                "url": result.url,
+                "mime_type": "text/html" if result.kind == "html" else "text/plain",
+                "timestamp": datetime.now().isoformat(),
+                "conversation_id": conversation_id
+            }
+            # 内容未变的网页已在当前会话中入库时只提取正文
+            already_indexed = (
+                pipeline.content_index is not None
+                and pipeline.content_index.has_document(page_hash, conversation_id)
+            )
+            text = await asyncio.to_thread(
+                read_web_page,
+                result,
+                metadata,
+                None if already_indexed else lambda chunks: pipeline.feed(chunks, job)
+            )
+            pipeline.finish(job)
+        except Exception as e:
+            job.fail(e)
+            raise
+        
+        return True, f"✅ 网页 {result.url} 已解析，正在建立索引", text
+    except Exception as e:
+        return False, f"处理网页时出错：{str(e)}", ""
+
+def _log_index_result(file_name, job):
+    if job.error is None:
+        print(f"VectorDB: File index complete... {file_name} ({job.done_chunks}/{job.total_chunks} chunks)")
+    else:
+        print(f"VectorDB: File index failed... {file_name}: {str(job.error)}")
+
+def add_documents_to_vector_store(documents, pipeline):
+    """将文档添加到向量存储中，阻塞直到全部文本块入库"""
+    job = pipeline.submit(split_documents(documents))
+    job.wait()
+    print("VectorDB: File index complete...")
+    return job
@@ -0,0 +1,214 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def _encode(vector: List[float]) -> bytes:
+    return array('f', vector).tobytes()
+
+
+def _decode(blob: bytes) -> List[float]:
+    vector = array('f')
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCacheStore:
+    """
+    基于 SQLite 的向量持久化缓存，超过容量上限时按最近访问时间淘汰。
+
+    命中时只在内存中记录访问时间，累积到 access_flush_size 条、淘汰前或关闭时
+    才批量写回，读路径上不产生写事务。
+    """
+
+    def __init__(self, db_file: str, max_bytes: int, access_flush_size: int = 1024):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.access_flush_size = access_flush_size
+        self._lock = threading.Lock()
+        # 尚未写回的访问时间：key -> last_access
+        self._pending_access: Dict[str, float] = {}
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings (last_access);
+        """)
+        self._conn.commit()
+        self.total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # 分批查询，避免超过 SQLite 的参数个数限制
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update((key, _decode(blob)) for key, blob in rows)
+            if found:
+                now = time.time()
+                self._pending_access.update((key, now) for key in found)
+                if len(self._pending_access) >= self.access_flush_size:
+                    with self._conn:
+                        self._flush_access()
+        return found
+
+    def _flush_access(self):
+        """把内存中累积的访问时间批量写回数据库，调用方需持有锁并处于事务中"""
+        if not self._pending_access:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE key = ?",
+            [(now, key) for key, now in self._pending_access.items()]
+        )
+        self._pending_access.clear()
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, _encode(vector)) for key, vector in items.items()]
+        with self._lock, self._conn:
+            for key, blob in rows:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), now)
+                )
+                if cursor.rowcount:
+                    self.total_bytes += len(blob)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """淘汰最久未访问的条目，直到占用降到容量上限的 90%"""
+        # 先写回访问时间，避免淘汰刚命中的条目
+        self._flush_access()
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+            self.total_bytes -= sum(size for _, size in rows)
+
+    def close(self) -> None:
+        with self._lock:
+            with self._conn:
+                self._flush_access()
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带缓存的嵌入模型包装器。
+
+    缓存键为 模型名 + 用途(文档/查询) + 规范化文本的 sha256，先查进程内 LRU，
+    再查磁盘缓存，都未命中的文本才会调用底层嵌入模型。
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_name: str,
+        store: EmbeddingCacheStore,
+        lru_size: int = 4096
+    ):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.store = store
+        self.lru_size = lru_size
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        normalized = unicodedata.normalize("NFC", text).strip()
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def _lru_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+            return vector
+
+    def _lru_put(self, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            for key, vector in items.items():
+                self._lru[key] = vector
+                self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _embed(self, kind: str, texts: List[str], embed_fn) -> List[List[float]]:
+        keys = [self._key(kind, text) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+
+        for key in keys:
+            vector = self._lru_get(key)
+            if vector is not None:
+                vectors[key] = vector
+
+        disk_hits = self.store.get_many([key for key in dict.fromkeys(keys) if key not in vectors])
+        vectors.update(disk_hits)
+        self._lru_put(disk_hits)
+
+        # 同一批次中重复的文本只嵌入一次
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        if missing:
+            embedded = dict(zip(missing.keys(), embed_fn(list(missing.values()))))
+            self.store.put_many(embedded)
+            self._lru_put(embedded)
+            vectors.update(embedded)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("document", texts, self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text], lambda texts: [self.underlying.embed_query(texts[0])])[0]
+
+    def stats(self) -> Dict[str, float]:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._lru),
+                "disk_bytes": self.store.total_bytes,
+            }
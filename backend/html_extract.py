@@ -0,0 +1,187 @@
+import re
+from typing import List, NamedTuple, Optional
+
+import lxml.html
+from lxml import etree
+
+# 整体删除的标签：脚本、样式、导航、页脚、表单等与正文无关的内容
+# (header 常包含文章标题，不整体删除)
+_DROP_TAGS = (
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object",
+    "nav", "footer", "aside", "form", "button", "select", "input",
+)
+# class/id 中的某个名称由这些词组成时，元素视为模板内容(导航、侧栏、广告、评论等)
+_BOILERPLATE_WORDS = {
+    "nav", "navbar", "menu", "footer", "sidebar", "breadcrumb", "breadcrumbs", "comment", "comments",
+    "advert", "ad", "ads", "banner", "cookie", "share", "social", "related", "recommend", "popup",
+    "modal", "subscribe", "toolbar",
+}
+# 以这些词开头的名称描述页面状态(no-sidebar、has-comments)，不代表元素本身是模板内容
+_STATE_PREFIXES = {"no", "has", "with", "without", "is", "show", "hide", "enable", "disable"}
+_NAME_SPLIT_RE = re.compile(r"[-_]+")
+_HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+_BLOCKS = _HEADINGS | {
+    "p", "li", "pre", "blockquote", "td", "th", "dd", "dt", "figcaption", "caption",
+    "div", "section", "article", "main", "table", "ul", "ol", "dl", "tr",
+}
+_KEEP = {"html", "body", "main", "article"}
+_SPACE_RE = re.compile(r"\s+")
+
+
+class Section(NamedTuple):
+    """网页中一个标题下的正文"""
+    heading: str
+    text: str
+
+
+class ExtractedPage(NamedTuple):
+    title: str
+    sections: List[Section]
+
+    def to_text(self) -> str:
+        parts = [self.title] if self.title else []
+        for section in self.sections:
+            parts.append(f"{section.heading}\n{section.text}" if section.heading else section.text)
+        return "\n\n".join(parts)
+
+
+def _text(element) -> str:
+    return _SPACE_RE.sub(" ", element.text_content()).strip()
+
+
+def _is_boilerplate_name(name: str) -> bool:
+    parts = [part for part in _NAME_SPLIT_RE.split(name.lower()) if part]
+    if not parts or parts[0] in _STATE_PREFIXES:
+        return False
+    # side-bar、nav_menu 等拆开后按整词匹配，"".join 覆盖 side-bar 这类拆写
+    return any(part in _BOILERPLATE_WORDS for part in parts) or "".join(parts) in _BOILERPLATE_WORDS
+
+
+def _is_boilerplate(element) -> bool:
+    names = f"{element.get('class', '')} {element.get('id', '')} {element.get('role', '')}".split()
+    return any(_is_boilerplate_name(name) for name in names)
+
+
+class _Stats(NamedTuple):
+    """元素子树的文本长度、其中链接文本的长度和段落数"""
+    text: int
+    links: int
+    paragraphs: int
+
+
+def _subtree_stats(body) -> dict:
+    """自底向上一次遍历算出每个元素的 _Stats，避免逐个元素重复扫描子树"""
+    stats = {}
+    for element in reversed(list(body.iter())):
+        text = len((element.text or "").strip()) if isinstance(element.tag, str) else 0
+        links = paragraphs = 0
+        for child in element:
+            child_stats = stats.get(child)
+            if child_stats is not None:
+                text += child_stats.text
+                links += child_stats.links
+                paragraphs += child_stats.paragraphs + (child.tag == "p")
+            text += len((child.tail or "").strip())
+        if element.tag == "a":
+            links = text
+        stats[element] = _Stats(text, links, paragraphs)
+    return stats
+
+
+def _find_main(body):
+    """定位正文区域：优先 main/article 标签，否则选文本最多且链接密度低的块"""
+    stats = _subtree_stats(body)
+    for xpath in ("//main", "//*[@role='main']", "//article"):
+        found = body.xpath(xpath)
+        if found:
+            best = max(found, key=lambda el: stats[el].text)
+            if stats[best].text >= 200:
+                return best
+
+    best, best_score = body, 0.0
+    for element in body.iter("div", "section", "td"):
+        text_length, link_length, paragraphs = stats[element]
+        if text_length < 200:
+            continue
+        # 段落越多越可能是正文；链接密度高的多是导航或列表
+        score = text_length * (1 - link_length / text_length) * min(paragraphs + 1, 10) ** 0.5
+        if score > best_score:
+            best, best_score = element, score
+    # 只选到整个页面的一小部分时可能是误判，退回整个 body
+    return best if best_score and stats[best].text >= 0.25 * stats[body].text else body
+
+
+def _remove_boilerplate(root):
+    etree.strip_elements(root, *_DROP_TAGS, with_tail=False)
+    etree.strip_elements(root, etree.Comment, with_tail=False)
+    # main、article 及其祖先不因 class 删除，否则 <div class="site-nav-wrapper"><main> 会删掉正文
+    protected = set()
+    for element in root.xpath("//main | //article | //*[@role='main']"):
+        protected.update(element.iterancestors())
+        protected.add(element)
+    for element in list(root.iter()):
+        if not isinstance(element.tag, str) or element.tag in _KEEP or element in protected:
+            continue
+        if _is_boilerplate(element) and element.getparent() is not None:
+            element.drop_tree()
+
+
+def extract_html(raw: bytes, encoding: Optional[str] = None) -> ExtractedPage:
+    """
+    从 HTML 中提取标题和按小标题划分的正文段落。
+
+    删除脚本、导航、页脚、广告等模板内容，定位正文区域后按 h1~h6 划分小节，
+    块级元素(段落、列表项、表格单元等)的边界把文字分成段落，块之间的文字单独成段。
+    """
+    parser = lxml.html.HTMLParser(encoding=encoding, remove_comments=True)
+    root = lxml.html.document_fromstring(raw, parser=parser)
+    title = root.findtext(".//title") or ""
+    title = _SPACE_RE.sub(" ", title).strip()
+
+    _remove_boilerplate(root)
+    body = root.find("body")
+    if body is None:
+        body = root
+    main = _find_main(body)
+
+    sections, heading, paragraphs, pieces = [], "", [], []
+
+    def flush():
+        text = _SPACE_RE.sub(" ", "".join(pieces)).strip()
+        pieces.clear()
+        if text:
+            paragraphs.append(text)
+
+    # 一次遍历：块的开始和结束处断开段落，行内元素的文字和各元素的 tail 按原顺序拼接
+    for event, element in etree.iterwalk(main, events=("start", "end")):
+        is_tag = isinstance(element.tag, str)
+        if event == "start":
+            if not is_tag:
+                continue
+            if element.tag in _HEADINGS:
+                flush()
+                if paragraphs:
+                    sections.append(Section(heading, "\n".join(paragraphs)))
+                paragraphs = []
+            elif element.tag in _BLOCKS:
+                flush()
+            elif element.tag == "br":
+                pieces.append(" ")
+            pieces.append(element.text or "")
+            continue
+        if is_tag and element.tag in _HEADINGS:
+            heading = _SPACE_RE.sub(" ", "".join(pieces)).strip()
+            pieces.clear()
+        elif is_tag and element.tag in _BLOCKS:
+            flush()
+        if element is not main:
+            pieces.append(element.tail or "")
+    flush()
+    if paragraphs:
+        sections.append(Section(heading, "\n".join(paragraphs)))
+
+    if not sections:
+        text = _text(main)
+        if text:
+            sections.append(Section("", text))
+    return ExtractedPage(title, sections)
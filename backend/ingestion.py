@@ -0,0 +1,331 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from backend.content_index import ContentIndex, chunk_sha256, vector_id
+from backend.lexical_index import LexicalIndex
+from backend.metrics import SIZE_BUCKETS, metrics
+
+
+def _clean_metadata(metadata: dict) -> dict:
+    """Chroma 只接受字符串、数字和布尔类型的元数据，其余值丢弃"""
+    return {
+        key: value for key, value in metadata.items()
+        if isinstance(value, (str, int, float, bool))
+    }
+
+
+class IngestionJob:
+    """
+    一次入库任务，按 (文件哈希, 会话ID) 标识。
+
+    状态依次为 queued -> embedding -> done/failed，记录文本块进度；
+    所有批次完成后 future 返回任务本身，可以同步 wait() 或异步 await wait_async()。
+    """
+
+    QUEUED = "queued"
+    EMBEDDING = "embedding"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, file_hash: str = "", conversation_id: str = "", file_name: str = ""):
+        self.file_hash = file_hash
+        self.conversation_id = conversation_id
+        self.file_name = file_name
+        self.state = self.QUEUED
+        self.total_chunks = 0
+        self.done_chunks = 0
+        self.reused_chunks = 0
+        self.failed_batches = 0
+        self.error: Optional[BaseException] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.future: Future = Future()
+        self._pending_batches = 0
+        self._sealed = False
+        # 尚未凑满一个批次的文本块
+        self._buffer: List[Document] = []
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (self.DONE, self.FAILED)
+
+    def progress(self) -> str:
+        return f"{self.done_chunks}/{self.total_chunks}"
+
+    def _add_batch(self, size: int):
+        with self._lock:
+            self._pending_batches += 1
+            self.total_chunks += size
+
+    def _seal(self):
+        """所有批次都已提交"""
+        with self._lock:
+            self._sealed = True
+            self._maybe_finish()
+
+    def _batch_started(self):
+        with self._lock:
+            if self.state == self.QUEUED:
+                self.state = self.EMBEDDING
+
+    def _batch_done(self, size: int, error: Optional[BaseException] = None, reused: int = 0):
+        with self._lock:
+            self._pending_batches -= 1
+            if error is None:
+                self.done_chunks += size
+                self.reused_chunks += reused
+            else:
+                self.failed_batches += 1
+                self.error = error
+            self._maybe_finish()
+
+    def fail(self, error: BaseException):
+        """提交阶段出错(例如文档解析失败)时直接结束任务"""
+        with self._lock:
+            self.error = error
+            self._sealed = True
+            self._maybe_finish()
+
+    def _maybe_finish(self):
+        if not self._sealed or self._pending_batches or self.future.done():
+            return
+        self.finished_at = time.time()
+        if self.error is not None:
+            self.state = self.FAILED
+            self.future.set_exception(self.error)
+        else:
+            self.state = self.DONE
+            self.future.set_result(self)
+
+    def wait(self, timeout: Optional[float] = None) -> "IngestionJob":
+        """阻塞等待任务完成，失败时抛出最后一个批次的异常"""
+        return self.future.result(timeout)
+
+    async def wait_async(self, timeout: Optional[float] = None) -> bool:
+        """异步等待任务结束，返回是否在超时前结束(失败也算结束)"""
+        if self.future.done():
+            return True
+        done, _ = await asyncio.wait([asyncio.wrap_future(self.future)], timeout=timeout)
+        for future in done:
+            future.exception()  # 取出异常，避免未读取异常的警告
+        return bool(done)
+
+
+class JobRegistry:
+    """入库任务登记表，按 (文件哈希, 会话ID) 查找任务，结束的任务保留一段时间供查询状态"""
+
+    def __init__(self, retention_seconds: float = 600):
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[Tuple[str, str], IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def create(self, file_hash: str, conversation_id: str, file_name: str = "") -> IngestionJob:
+        job = IngestionJob(file_hash, conversation_id, file_name)
+        with self._lock:
+            self._prune()
+            self._jobs[(file_hash, conversation_id)] = job
+        return job
+
+    def get(self, file_hash: str, conversation_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get((file_hash, conversation_id))
+
+    def for_conversation(self, conversation_id: str, active_only: bool = False) -> List[IngestionJob]:
+        with self._lock:
+            return [
+                job for (_, conv_id), job in self._jobs.items()
+                if conv_id == conversation_id and not (active_only and job.finished)
+            ]
+
+    async def wait_for_conversation(self, conversation_id: str, timeout: float) -> bool:
+        """等待会话中进行中的入库任务，返回是否全部在超时前结束"""
+        jobs = self.for_conversation(conversation_id, active_only=True)
+        if not jobs:
+            return True
+        futures = [asyncio.wrap_future(job.future) for job in jobs]
+        done, pending = await asyncio.wait(futures, timeout=timeout)
+        for future in done:
+            future.exception()  # 取出异常，避免未读取异常的警告
+        return not pending
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            key for key, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.retention_seconds
+        ]
+        for key in expired:
+            del self._jobs[key]
+
+
+class IngestionPipeline:
+    """
+    向量化入库流水线。
+
+    文档块按 batch_size 分批放入有界队列，由 max_in_flight 个工作线程计算嵌入并把
+    向量直接写入 Chroma，所有用户共享同一个并发上限。失败的批次按指数退避重试；
+    队列满时 submit 会阻塞，从而对上传形成背压。
+
+    提供 content_index 时按文本块内容哈希去重：已关联到当前会话的文本块直接跳过，
+    在其他会话中嵌入过的文本块复制已有向量，只有新内容才会调用嵌入模型。
+    提供 lexical_index 时写入 Chroma 的文本块同时登记到关键词索引。
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        embeddings,
+        batch_size: int = 64,
+        max_in_flight: int = 4,
+        queue_size: int = 32,
+        max_retries: int = 3,
+        retry_backoff: float = 1.0,
+        content_index: Optional[ContentIndex] = None,
+        lexical_index: Optional[LexicalIndex] = None
+    ):
+        self.vector_store = vector_store
+        self.embeddings = embeddings
+        self.content_index = content_index
+        self.lexical_index = lexical_index
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.jobs = JobRegistry()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"ingestion-{i}", daemon=True)
+            for i in range(max(1, max_in_flight))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, documents: List[Document], job: Optional[IngestionJob] = None) -> IngestionJob:
+        """分批提交全部文档块并结束提交，队列满时阻塞等待"""
+        job = job or IngestionJob()
+        self.feed(documents, job)
+        self.finish(job)
+        return job
+
+    def feed(self, documents: List[Document], job: IngestionJob) -> None:
+        """
+        向任务追加文档块，可多次调用以边解析边入库。
+
+        凑满 batch_size 的部分立即入队，余下的留到下次调用或 finish 时提交；
+        队列满时阻塞等待。同一任务的 feed/finish 不能并发调用。
+        """
+        job._buffer.extend(documents)
+        while len(job._buffer) >= self.batch_size:
+            self._enqueue(job, job._buffer[:self.batch_size])
+            job._buffer = job._buffer[self.batch_size:]
+
+    def finish(self, job: IngestionJob) -> None:
+        """提交剩余的文档块，并标记任务的文档块已全部提交"""
+        if job._buffer:
+            self._enqueue(job, job._buffer)
+            job._buffer = []
+        if self.content_index is not None and job.file_hash:
+            job.future.add_done_callback(lambda _: self._record_document(job))
+        job._seal()
+
+    def _enqueue(self, job: IngestionJob, batch: List[Document]):
+        job._add_batch(len(batch))
+        self._queue.put((job, batch))
+
+    async def asubmit(self, documents: List[Document], job: Optional[IngestionJob] = None) -> IngestionJob:
+        """在线程中提交，队列满时挂起调用方而不阻塞事件循环"""
+        return await asyncio.to_thread(self.submit, documents, job)
+
+    def _worker(self):
+        while True:
+            job, batch = self._queue.get()
+            job._batch_started()
+            try:
+                reused = self._process_batch(batch)
+                job._batch_done(len(batch), reused=reused)
+                metrics.inc("ingested_chunks_total", len(batch))
+                metrics.inc("reused_chunks_total", reused)
+            except Exception as e:
+                print(f"VectorDB: batch of {len(batch)} chunks failed: {str(e)}")
+                job._batch_done(len(batch), e)
+            finally:
+                self._queue.task_done()
+
+    def _record_document(self, job: IngestionJob):
+        if job.error is None:
+            self.content_index.add_document(job.file_hash, job.conversation_id, job.file_name)
+
+    def _process_batch(self, batch: List[Document]) -> int:
+        """嵌入并写入一个批次，返回复用已有向量的文本块数量"""
+        conversation_id = str(batch[0].metadata.get("conversation_id", ""))
+        # 同一批次中内容相同的文本块只保留一个
+        pending: Dict[str, Document] = {}
+        for doc in batch:
+            chunk_hash = chunk_sha256(doc.page_content)
+            doc.metadata["chunk_hash"] = chunk_hash
+            pending.setdefault(chunk_hash, doc)
+
+        if self.content_index is not None:
+            for chunk_hash in self.content_index.linked_chunks(list(pending), conversation_id):
+                del pending[chunk_hash]
+        if not pending:
+            return len(batch)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = self._reuse_vectors(list(pending))
+                reused = len(vectors)
+                missing = [chunk_hash for chunk_hash in pending if chunk_hash not in vectors]
+                if missing:
+                    metrics.observe("embedding_batch_size", len(missing), buckets=SIZE_BUCKETS)
+                    with metrics.span("embedding_batch"):
+                        embedded = self.embeddings.embed_documents([pending[h].page_content for h in missing])
+                    vectors.update(zip(missing, embedded))
+                with metrics.span("vector_write"):
+                    self._write_batch(conversation_id, pending, vectors)
+                return reused + len(batch) - len(pending)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                print(f"VectorDB: batch failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _reuse_vectors(self, chunk_hashes: List[str]) -> Dict[str, List[float]]:
+        """从 Chroma 中取回其他会话已嵌入的文本块向量"""
+        if self.content_index is None:
+            return {}
+        existing = self.content_index.find_vectors(chunk_hashes)
+        if not existing:
+            return {}
+        result = self.vector_store._collection.get(
+            ids=list(set(existing.values())),
+            include=["embeddings"]
+        )
+        by_id = dict(zip(result["ids"], result["embeddings"]))
+        return {
+            chunk_hash: by_id[vid] for chunk_hash, vid in existing.items()
+            if vid in by_id
+        }
+
+    def _write_batch(self, conversation_id: str, docs: Dict[str, Document], vectors: Dict[str, List[float]]):
+        """把预先计算好的向量批量写入 Chroma，避免再次调用嵌入模型"""
+        ids = [vector_id(chunk_hash, conversation_id) for chunk_hash in docs]
+        self.vector_store._collection.upsert(
+            ids=ids,
+            embeddings=[vectors[chunk_hash] for chunk_hash in docs],
+            metadatas=[_clean_metadata(doc.metadata) for doc in docs.values()],
+            documents=[doc.page_content for doc in docs.values()],
+        )
+        if self.lexical_index is not None:
+            self.lexical_index.add(conversation_id, zip(ids, docs.values()))
+        if self.content_index is not None:
+            self.content_index.add_chunks(
+                (chunk_hash, conversation_id, vid) for chunk_hash, vid in zip(docs, ids)
+            )
@@ -0,0 +1,183 @@
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from langchain_core.documents import Document
+
+from backend.content_index import chunk_sha256
+from backend.text_utils import tokenize
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    vector_id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_docs_conversation ON docs (conversation_id);
+CREATE TABLE IF NOT EXISTS postings (
+    conversation_id TEXT NOT NULL,
+    term TEXT NOT NULL,
+    vector_id TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (conversation_id, term, vector_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_vector ON postings (vector_id);
+"""
+
+
+def fusion_key(doc: Document) -> str:
+    """融合排序时识别同一文本块的键"""
+    return doc.metadata.get("chunk_hash") or chunk_sha256(doc.page_content)
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[List[Document]],
+    key: Callable[[Document], str] = fusion_key,
+    k: int = 60
+) -> List[Document]:
+    """倒数排名融合：每个列表中排第 r 位的文本块得分 1/(k+r)，按总分从高到低返回"""
+    scores: Dict[str, float] = defaultdict(float)
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            doc_key = key(doc)
+            scores[doc_key] += 1.0 / (k + rank)
+            docs.setdefault(doc_key, doc)
+    return [docs[doc_key] for doc_key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class LexicalIndex:
+    """
+    基于 SQLite 倒排表的 BM25 关键词索引，与 Chroma 中的文本块一一对应。
+
+    分词使用 text_utils.tokenize，中日韩文字按单字加二元组切分，文件名、错误码、编号等
+    嵌入模型不擅长的精确词项也能命中。索引按会话划分，检索时只统计该会话的文档。
+    """
+
+    def __init__(self, db_file: str, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.5):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        # 出现在超过该比例文档中的词项区分度很低，检索时跳过以减少扫描的倒排项
+        self.max_df_ratio = max_df_ratio
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def add(self, conversation_id: str, entries: Iterable[Tuple[str, Document]]) -> None:
+        """登记 (向量ID, 文本块)，同一向量ID重复登记时覆盖"""
+        doc_rows, posting_rows, vector_ids = [], [], []
+        for vid, doc in entries:
+            counts = Counter(tokenize(doc.page_content))
+            vector_ids.append((vid,))
+            doc_rows.append((
+                vid, conversation_id, sum(counts.values()), doc.page_content,
+                json.dumps(doc.metadata, ensure_ascii=False, default=str)
+            ))
+            posting_rows.extend((conversation_id, term, vid, tf) for term, tf in counts.items())
+        if not doc_rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM postings WHERE vector_id = ?", vector_ids)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO docs (vector_id, conversation_id, length, content, metadata) "
+                "VALUES (?, ?, ?, ?, ?)",
+                doc_rows
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO postings (conversation_id, term, vector_id, tf) VALUES (?, ?, ?, ?)",
+                posting_rows
+            )
+
+    def search(self, query: str, conversation_id: str, k: int = 8) -> List[Document]:
+        """返回会话中 BM25 得分最高的 k 个文本块"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            total, avg_length = self._conn.execute(
+                "SELECT COUNT(*), AVG(length) FROM docs WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()
+            if not total:
+                return []
+            placeholders = ",".join("?" * len(terms))
+            df = dict(self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE conversation_id = ? AND term IN ({placeholders}) "
+                "GROUP BY term",
+                (conversation_id, *terms)
+            ).fetchall())
+            if not df:
+                return []
+            # 全部是高频词项时仍然要检索，否则只保留有区分度的词项
+            selective = [term for term in df if df[term] <= total * self.max_df_ratio] or list(df)
+            placeholders = ",".join("?" * len(selective))
+            rows = self._conn.execute(
+                f"SELECT p.vector_id, p.term, p.tf, d.length FROM postings p "
+                f"JOIN docs d ON d.vector_id = p.vector_id "
+                f"WHERE p.conversation_id = ? AND p.term IN ({placeholders})",
+                (conversation_id, *selective)
+            ).fetchall()
+
+            scores: Dict[str, float] = defaultdict(float)
+            avg_length = avg_length or 1.0
+            for vid, term, tf, length in rows:
+                idf = math.log(1 + (total - df[term] + 0.5) / (df[term] + 0.5))
+                norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[vid] += idf * tf * (self.k1 + 1) / norm
+
+            top = sorted(scores, key=scores.get, reverse=True)[:k]
+            if not top:
+                return []
+            placeholders = ",".join("?" * len(top))
+            found = {
+                vid: Document(page_content=content, metadata=json.loads(metadata), id=vid)
+                for vid, content, metadata in self._conn.execute(
+                    f"SELECT vector_id, content, metadata FROM docs WHERE vector_id IN ({placeholders})",
+                    top
+                ).fetchall()
+            }
+        return [found[vid] for vid in top if vid in found]
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM docs LIMIT 1").fetchone() is None
+
+    def rebuild_from(self, vector_store, page_size: int = 500) -> int:
+        """从 Chroma 中已有的文件文本块建立索引，用于升级前入库的数据，返回登记的文本块数量"""
+        count, offset = 0, 0
+        while True:
+            result = vector_store._collection.get(
+                where={"type": "document"},
+                include=["documents", "metadatas"],
+                limit=page_size,
+                offset=offset
+            )
+            if not result["ids"]:
+                break
+            by_conversation = defaultdict(list)
+            for vid, content, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+                metadata = metadata or {}
+                by_conversation[str(metadata.get("conversation_id", ""))].append(
+                    (vid, Document(page_content=content or "", metadata=metadata))
+                )
+            for conversation_id, entries in by_conversation.items():
+                self.add(conversation_id, entries)
+            count += len(result["ids"])
+            offset += page_size
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
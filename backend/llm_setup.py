@@ -1,29 +1,97 @@
+from typing import NamedTuple, Optional
+
+import httpx
+from openai import AsyncOpenAI
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_ollama import OllamaEmbeddings
 from langchain_chroma import Chroma
+from backend.embedding_cache import CachedEmbeddings, EmbeddingCacheStore
 from config import config
 
-def init_embeddings():
-    """获取嵌入模型实例"""
+class HTTPClients(NamedTuple):
+    """共享的 HTTP 连接池：显式创建的 transport，以及基于它们的同步和异步客户端"""
+    client: httpx.Client
+    async_client: httpx.AsyncClient
+    transport: httpx.HTTPTransport
+    async_transport: httpx.AsyncHTTPTransport
+    timeout: httpx.Timeout
+
+def init_http_clients() -> HTTPClients:
+    """
+    创建共享的 HTTP 连接池(同步和异步各一个)，大模型和嵌入模型接口复用长连接。
+
+    连接池由显式创建的 transport 持有，所有客户端(包括 ollama 自己创建的客户端)都传入
+    同一个 transport。安装了 h2 时启用 HTTP/2，多个请求复用同一个连接。
+    """
+    http2 = config.HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("HTTP: h2 is not installed, falling back to HTTP/1.1")
+            http2 = False
+    limits = httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(config.HTTP_TIMEOUT, connect=10.0)
+    transport = httpx.HTTPTransport(http2=http2, limits=limits)
+    async_transport = httpx.AsyncHTTPTransport(http2=http2, limits=limits)
+    return HTTPClients(
+        client=httpx.Client(transport=transport, timeout=timeout),
+        async_client=httpx.AsyncClient(transport=async_transport, timeout=timeout),
+        transport=transport,
+        async_transport=async_transport,
+        timeout=timeout
+    )
+
+def init_embeddings(http: Optional[HTTPClients] = None):
+    """获取嵌入模型实例，开启缓存时包装为带缓存的嵌入模型"""
+    embeddings = init_base_embeddings(http)
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return embeddings
+
+    provider = "ollama" if isinstance(embeddings, OllamaEmbeddings) else "openai"
+    return CachedEmbeddings(
+        embeddings,
+        model_name=f"{provider}:{config.EMBEDDING_MODEL}",
+        store=EmbeddingCacheStore(
+            config.EMBEDDING_CACHE_PATH,
+            max_bytes=config.EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+        ),
+        lru_size=config.EMBEDDING_CACHE_LRU_SIZE
+    )
+
+def init_base_embeddings(http: Optional[HTTPClients] = None):
+    """获取嵌入模型实例，使用传入的共享连接池"""
+    http_client = http.client if http else None
+    http_async_client = http.async_client if http else None
     if config.USE_CUSTOM_EMBEDDINGS:
         try:
+            # ollama 客户端总是自己创建 httpx 客户端，无法直接传入，
+            # 改为传入共享的 transport，请求仍走同一个连接池
             return OllamaEmbeddings(
                 base_url=config.EMBEDDING_MODEL_API_BASE,
-                model=config.EMBEDDING_MODEL
+                model=config.EMBEDDING_MODEL,
+                sync_client_kwargs={"transport": http.transport, "timeout": http.timeout} if http else {},
+                async_client_kwargs={"transport": http.async_transport, "timeout": http.timeout} if http else {}
             )
         except Exception as e:
             print(f"Failed to initialize Ollama embeddings: {str(e)}")
             # 如果 Ollama 初始化失败，回退到 OpenAI
-            return init_openai_embeddings()
+            return init_openai_embeddings(http_client, http_async_client)
     else:
-        return init_openai_embeddings()
+        return init_openai_embeddings(http_client, http_async_client)
 
-def init_openai_embeddings():
+def init_openai_embeddings(http_client=None, http_async_client=None):
     """初始化 OpenAI 嵌入模型"""
     return OpenAIEmbeddings(
         model=config.EMBEDDING_MODEL,
         openai_api_base=config.EMBEDDING_MODEL_API_BASE,
-        openai_api_key=config.EMBEDDING_MODEL_API_KEY
+        openai_api_key=config.EMBEDDING_MODEL_API_KEY,
+        http_client=http_client,
+        http_async_client=http_async_client
     )
 
 def init_vector_store(embeddings):
@@ -37,7 +105,15 @@ def init_vector_store(embeddings):
         collection_metadata={"hnsw:space": "cosine"}
     )
 
-def init_llm():
+def model_fingerprint() -> str:
+    """当前对话模型配置的标识，模型或生成参数变化时随之变化"""
+    if config.USE_CUSTOM_MODEL:
+        model, base = config.CUSTOM_MODEL_NAME, config.CUSTOM_MODEL_API_BASE
+    else:
+        model, base = config.OPENAI_MODEL_NAME, config.OPENAI_API_BASE
+    return f"{model}|{base}|{config.TEMPERATURE}|{config.MAX_TOKENS}"
+
+def init_llm(http_client=None, http_async_client=None):
     """初始化语言模型"""
     if config.USE_CUSTOM_MODEL:
         return ChatOpenAI(
@@ -45,7 +121,9 @@ def init_llm():
             openai_api_base=config.CUSTOM_MODEL_API_BASE,
             openai_api_key=config.CUSTOM_MODEL_API_KEY,
             temperature=config.TEMPERATURE,
-            max_tokens=config.MAX_TOKENS
+            max_tokens=config.MAX_TOKENS,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
     else:
         return ChatOpenAI(
@@ -53,5 +131,22 @@ def init_llm():
             openai_api_base=config.OPENAI_API_BASE,
             openai_api_key=config.OPENAI_API_KEY,
             temperature=config.TEMPERATURE,
-            max_tokens=config.MAX_TOKENS
+            max_tokens=config.MAX_TOKENS,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
+
+def init_chat_client(http_async_client=None):
+    """初始化工具调用使用的异步 OpenAI 客户端，返回 (客户端, 模型名)"""
+    if config.USE_CUSTOM_MODEL:
+        client = AsyncOpenAI(
+            api_key=config.CUSTOM_MODEL_API_KEY,
+            base_url=config.CUSTOM_MODEL_API_BASE,
+            http_client=http_async_client
+        )
+        return client, config.CUSTOM_MODEL_NAME
+    client = AsyncOpenAI(
+        api_key=config.OPENAI_API_KEY,
+        http_client=http_async_client
+    )
+    return client, config.OPENAI_MODEL_NAME
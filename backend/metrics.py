@@ -0,0 +1,228 @@
+import bisect
+import hmac
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import config
+
+# 耗时直方图的分桶上限(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 数量类直方图(token 数、批次大小)的分桶上限
+SIZE_BUCKETS = (1, 4, 16, 64, 256, 1024, 4096, 16384)
+
+_PREFIX = "ai4fs_"
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按分桶估算分位数，取所在桶的上限"""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _Span:
+    """记录一个阶段的耗时，出错时同时计入错误数"""
+
+    __slots__ = ("registry", "stage", "labels", "started")
+
+    def __init__(self, registry: "MetricsRegistry", stage: str, labels: Dict[str, object]):
+        self.registry = registry
+        self.stage = stage
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe("stage_seconds", time.perf_counter() - self.started, stage=self.stage, **self.labels)
+        if exc_type is not None:
+            self.registry.inc("stage_errors_total", stage=self.stage, **self.labels)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class MetricsRegistry:
+    """
+    进程内的指标登记表：各阶段耗时的直方图、计数器，以及从各缓存 stats() 读取的仪表值。
+
+    关闭时 span/observe/inc 直接返回，几乎没有开销。指标可以按 Prometheus 文本格式输出
+    (由 /metrics 接口返回)，或定期以 JSON 行的形式追加到文件。
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._gauges: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self._exporter: Optional[threading.Thread] = None
+
+    def span(self, stage: str, **labels):
+        """用 with 包住一个阶段，记录耗时到 stage_seconds{stage=...}"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, stage, labels)
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register_gauges(self, name: str, stats_fn: Callable[[], Dict[str, float]]):
+        """登记一组仪表值，导出时调用 stats_fn()，每个数值字段导出为 <name>_<字段>"""
+        self._gauges[name] = stats_fn
+
+    def _read_gauges(self) -> Dict[str, float]:
+        values = {}
+        for name, stats_fn in list(self._gauges.items()):
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                logger.warning("reading %s stats failed: %s", name, e)
+                continue
+            for field, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values[f"{name}_{field}"] = value
+        return values
+
+    def render_prometheus(self) -> str:
+        """按 Prometheus 文本格式输出全部指标"""
+        with self._lock:
+            histograms = sorted(
+                ((name, key, h.buckets, list(h.counts), h.sum, h.count) for (name, key), h in self._histograms.items()),
+                key=lambda item: item[:2]
+            )
+            counters = sorted(self._counters.items())
+
+        lines, declared = [], set()
+        for name, key, buckets, counts, total, count in histograms:
+            metric = _PREFIX + name
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} histogram")
+                declared.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_format_labels(key, ('le', repr(float(bound))))} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {total}")
+            lines.append(f"{metric}_count{_format_labels(key)} {count}")
+        for (name, key), value in counters:
+            metric = _PREFIX + name
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{metric}{_format_labels(key)} {value}")
+        for name, value in sorted(self._read_gauges().items()):
+            lines.append(f"# TYPE {_PREFIX}{name} gauge")
+            lines.append(f"{_PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        """当前指标的摘要：直方图给出次数、总和与估算的 p50/p95/p99"""
+        with self._lock:
+            histograms = {
+                name + _format_labels(key): {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for (name, key), h in self._histograms.items()
+            }
+            counters = {name + _format_labels(key): value for (name, key), value in self._counters.items()}
+        return {"timestamp": time.time(), "histograms": histograms, "counters": counters, "gauges": self._read_gauges()}
+
+    def start_file_exporter(self, path: str, interval: float = 60):
+        """每隔 interval 秒把 snapshot() 以一行 JSON 追加到 path"""
+        if not self.enabled or self._exporter is not None:
+            return
+
+        def export():
+            while True:
+                time.sleep(interval)
+                try:
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+                except OSError as e:
+                    logger.warning("writing %s failed: %s", path, e)
+
+        self._exporter = threading.Thread(target=export, name="metrics-exporter", daemon=True)
+        self._exporter.start()
+
+
+def scrape_allowed(authorization: Optional[str], client_host: Optional[str], token: str) -> bool:
+    """
+    /metrics 接口的访问控制：配置了 token 时要求请求头 Authorization: Bearer <token>，
+    否则只允许本机访问。
+    """
+    if token:
+        return hmac.compare_digest((authorization or "").encode("utf-8"), f"Bearer {token}".encode("utf-8"))
+    return client_host in ("127.0.0.1", "::1", "localhost")
+
+
+# 全局指标登记表，METRICS_ENABLED 为 false 时所有记录操作都是空操作
+metrics = MetricsRegistry(enabled=config.METRICS_ENABLED)
@@ -0,0 +1,294 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import pickle
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Deque, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from backend.document_loader import read_document
+
+
+def _init_worker(memory_limit_mb: int):
+    """子进程初始化：限制虚拟内存，超出时解析抛出 MemoryError 而不是拖垮整台机器"""
+    if memory_limit_mb <= 0:
+        return
+    try:
+        import resource
+    except ImportError:
+        # Windows 上没有 resource 模块，不做限制
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _worker_main(memory_limit_mb: int, tasks, results):
+    """
+    解析子进程的主循环：依次取出任务逐页解析，文本块以 ("chunks", 文本块) 交回主进程，
+    结束时交回 ("done", 前缀) 或 ("error", 异常)。收到 None 时退出。
+    """
+    _init_worker(memory_limit_mb)
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        file_path, metadata, prefix_chars, index = task
+        on_chunks = (lambda chunks: results.put(("chunks", chunks))) if index else None
+        try:
+            results.put(("done", read_document(file_path, metadata, prefix_chars, on_chunks)))
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                # 无法序列化的异常换成 RuntimeError，否则主进程收不到结果只能等到超时
+                e = RuntimeError(f"{type(e).__name__}: {str(e)}")
+            results.put(("error", e))
+
+
+class _Worker:
+    """一个解析子进程，以及与它通信的任务队列和有界结果队列"""
+
+    def __init__(self, context, memory_limit_mb: int, queue_size: int):
+        self.tasks = context.SimpleQueue()
+        self.results = context.Queue(maxsize=queue_size)
+        self.process = context.Process(
+            target=_worker_main,
+            args=(memory_limit_mb, self.tasks, self.results),
+            name="parser-worker",
+            daemon=True
+        )
+        self.process.start()
+        self.tasks_done = 0
+
+    def stop(self):
+        """空闲时正常退出"""
+        self.tasks.put(None)
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self):
+        """终止子进程，队列可能处于不一致状态，随子进程一起丢弃"""
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.results.cancel_join_thread()
+        self.results.close()
+
+
+class ParserPool:
+    """
+    文档解析进程池。
+
+    PDF、Word 等文档的解析是 CPU 密集型的，放在线程里仍会因 GIL 拖慢事件循环，
+    因此交给独立的子进程执行。子进程逐页切分文本块，经由有界队列交回主进程提交到
+    入库流水线，队列满时子进程等待，内存占用不会随文件大小增长。
+
+    每个任务独占一个子进程，超时或 on_chunks 出错时只终止该任务所在的子进程，
+    其他用户正在进行的解析不受影响；子进程处理 max_tasks_per_child 个文件后自动替换，
+    避免解析库的内存泄漏累积。workers 为 0 时在线程中解析。
+
+    子进程都在忙时，任务在事件循环中按先来后到排队，不占用线程；超时从拿到子进程后
+    开始计算，排队时间不计入。调用方取消或进程池关闭时排队的任务立即退出。
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 300,
+        memory_limit_mb: int = 4096,
+        max_tasks_per_child: int = 20,
+        queue_size: int = 8
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_child = max_tasks_per_child
+        self.queue_size = max(1, queue_size)
+        # spawn 方式启动的子进程不继承主进程的线程和连接，fork 在多线程进程中不安全
+        self._context = multiprocessing.get_context("spawn")
+        self._free_slots = max(1, workers)
+        # 等待子进程的任务：(事件循环, future)，按先来后到唤醒
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._idle: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    async def _acquire_slot(self):
+        """在事件循环中等待空闲的子进程名额，等待期间可以被取消"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("解析进程池已关闭")
+            if self._free_slots and not self._waiters:
+                self._free_slots -= 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # 名额已经交给了这个任务，转交给下一个
+            if waiter[1].done() and not waiter[1].cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._free_slots += 1
+                    return
+                loop, future = self._waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+                return
+            except RuntimeError:
+                # 等待者所在的事件循环已关闭，交给下一个
+                continue
+
+    def _grant(self, future: asyncio.Future):
+        if future.done():
+            # 等待的任务已被取消，名额交给下一个
+            self._release_slot()
+        else:
+            future.set_result(None)
+
+    def _acquire(self) -> _Worker:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("解析进程池已关闭")
+            if self._idle:
+                return self._idle.pop()
+        return _Worker(self._context, self.memory_limit_mb, self.queue_size)
+
+    def _release(self, worker: _Worker, healthy: bool):
+        """任务结束后归还子进程；出错、达到任务数上限或进程池已关闭时替换掉"""
+        if not healthy:
+            worker.kill()
+            return
+        worker.tasks_done += 1
+        with self._lock:
+            if not self._closed and worker.tasks_done < (self.max_tasks_per_child or float("inf")):
+                self._idle.append(worker)
+                return
+        worker.stop()
+
+    def _run(
+        self,
+        file_path: str,
+        metadata: dict,
+        prefix_chars: int,
+        on_chunks: Optional[Callable[[List[Document]], None]],
+        stop: threading.Event
+    ) -> str:
+        """
+        在线程中执行一个解析任务：把文本块转交给 on_chunks，直到子进程交回结果。
+        调用前已占用一个子进程名额，结束时归还。
+        """
+        try:
+            if stop.is_set():
+                raise RuntimeError("解析任务已取消")
+            worker = self._acquire()
+        except BaseException:
+            self._release_slot()
+            raise
+        # 从拿到子进程开始计时，排队时间不计入超时
+        deadline = time.monotonic() + self.timeout
+        healthy = False
+        try:
+            worker.tasks.put((file_path, metadata, prefix_chars, on_chunks is not None))
+            while True:
+                if stop.is_set():
+                    raise RuntimeError("解析任务已取消")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"Parser: {file_path} timed out after {self.timeout}s, killing worker {worker.process.pid}")
+                    raise TimeoutError(f"文档解析超时（{self.timeout} 秒）")
+                try:
+                    kind, value = worker.results.get(timeout=min(remaining, 0.5))
+                except queue.Empty:
+                    if not worker.process.is_alive():
+                        # 子进程被系统杀死(例如内存不足)
+                        raise BrokenProcessPool(f"解析进程意外退出（exit code {worker.process.exitcode}）")
+                    continue
+                if kind == "chunks":
+                    try:
+                        on_chunks(value)
+                    except Exception as e:
+                        # 子进程可能正阻塞在已满的队列上，终止它，只让这一个任务失败
+                        print(f"Parser: handling chunks of {file_path} failed: {str(e)}")
+                        raise
+                    continue
+                healthy = True
+                if kind == "error":
+                    raise value
+                return value
+        finally:
+            try:
+                self._release(worker, healthy)
+            finally:
+                self._release_slot()
+
+    @staticmethod
+    def _fail_waiter(future: asyncio.Future):
+        if not future.done():
+            future.set_exception(RuntimeError("解析进程池已关闭"))
+
+    async def parse(
+        self,
+        file_path: str,
+        metadata: dict,
+        prefix_chars: int,
+        on_chunks: Optional[Callable[[List[Document]], None]] = None
+    ) -> str:
+        """
+        解析文档，每页的文本块交给 on_chunks(在线程中调用，可以阻塞)，返回文档前缀。
+
+        on_chunks 为 None 时只读取前缀。超时抛出 TimeoutError，
+        子进程超出内存限制时抛出 MemoryError。
+        """
+        if self.workers <= 0:
+            return await asyncio.wait_for(
+                asyncio.to_thread(read_document, file_path, metadata, prefix_chars, on_chunks),
+                timeout=self.timeout
+            )
+
+        await self._acquire_slot()
+        stop = threading.Event()
+        loop = asyncio.get_running_loop()
+        # 与 asyncio.to_thread 相同，但调用方取消时不撤销线程任务：
+        # _run 总会执行并归还名额，看到 stop 后立即结束
+        future = loop.run_in_executor(None, functools.partial(
+            contextvars.copy_context().run, self._run, file_path, metadata, prefix_chars, on_chunks, stop
+        ))
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        try:
+            return await asyncio.shield(future)
+        finally:
+            # 调用方被取消时通知线程终止子进程
+            stop.set()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            waiters, self._waiters = list(self._waiters), deque()
+        # 排队中的任务立即失败
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(self._fail_waiter, future)
+            except RuntimeError:
+                pass
+        # 正在执行的任务结束后由 _release 退出对应的子进程
+        for worker in idle:
+            worker.stop()
@@ -5,7 +5,10 @@ from langchain_community.utilities import OpenWeatherMapAPIWrapper
 from langchain_core.utils.function_calling import convert_to_openai_function
 import json
 from config import config
-from openai import AsyncOpenAI
+from backend.llm_setup import init_chat_client
+from backend.tool_cache import ToolResultCache
+from backend.metrics import metrics
+from typing import Optional
 import asyncio
 from datetime import datetime
 
@@ -20,6 +23,52 @@ def generate_func_tools(tools):
         })
     return func_tools
 
+async def run_tool_call(call: dict, tool_map: dict, timeout: float, cache: Optional[ToolResultCache] = None):
+    """
+    执行一个工具调用，返回 (是否成功, 交给模型的结果文本)。
+
+    每个工具最多等待 timeout 秒；遇到速率限制时换用其他可用的搜索工具。
+    提供 cache 时相同的查询复用缓存的结果。
+    """
+    try:
+        function_args = json.loads(call["arguments"] or "{}")
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error: {str(e)}, tool_call_info: {call}")
+        return False, f"工具参数解析失败：{str(e)}"
+    
+    tool_name = call["name"]
+    candidates = [tool_name] + [name for name in tool_map if name != tool_name]
+    last_error = f"未找到工具 {tool_name}"
+    for name in candidates:
+        tool = tool_map.get(name)
+        if tool is None:
+            print(f"Tool not found: {name}")
+            continue
+        try:
+            with metrics.span("tool", tool=name):
+                if cache is None:
+                    tool_response = await asyncio.wait_for(tool.ainvoke(function_args), timeout=timeout)
+                else:
+                    tool_response = await asyncio.wait_for(
+                        cache.get_or_run(name, function_args, lambda: tool.ainvoke(function_args)),
+                        timeout=timeout
+                    )
+            metrics.inc("tool_calls_total", tool=name, outcome="ok")
+            return True, str(tool_response)
+        except asyncio.TimeoutError:
+            metrics.inc("tool_calls_total", tool=name, outcome="timeout")
+            last_error = f"{name} 超时（{timeout} 秒）"
+            print(f"Tool invocation timeout: {name}")
+            break
+        except Exception as e:
+            metrics.inc("tool_calls_total", tool=name, outcome="error")
+            last_error = str(e)
+            print(f"Tool invocation error: {name}: {str(e)}")
+            # 只有速率限制才尝试备选工具
+            if "rate" not in str(e).lower():
+                break
+    return False, f"工具调用失败：{last_error}"
+
 def create_qa_chain(llm):
     template = """基于以下已知信息，简洁和专业地回答用户的问题。
     如果无法从中得到答案，请说 "抱歉，我无法从文档中找到相关信息。"
@@ -44,8 +93,12 @@ def create_qa_chain(llm):
             
     return qa_chain
 
-def create_chat_chain(llm):
-    """创建支持工具调用的聊天链"""
+def create_chat_chain(llm, client=None, model_name=None, tool_cache=None):
+    """
+    创建支持工具调用的聊天链。
+
+    client 为共享的 AsyncOpenAI 客户端，不传时新建一个；tool_cache 为搜索结果缓存。
+    """
     template = """请以专业、友好的语气回答用户的问题。如果需要搜索相关信息，请使用搜索工具。当前时间为：{current_time}。
     
     最近的对话历史：
@@ -87,18 +140,9 @@ def create_chat_chain(llm):
         # 提供一个基础的回退方案
         return create_basic_chat_chain(llm)
     
-    if config.USE_CUSTOM_MODEL:
+    if client is None:
         # 使用异步 OpenAI 客户端
-        client = AsyncOpenAI(
-            api_key=config.CUSTOM_MODEL_API_KEY,
-            base_url=config.CUSTOM_MODEL_API_BASE,
-        )
-        model_name = config.CUSTOM_MODEL_NAME
-    else:
-        client = AsyncOpenAI(
-            api_key=config.OPENAI_API_KEY,
-        )
-        model_name = config.OPENAI_MODEL_NAME
+        client, model_name = init_chat_client()
     
     async def chat_chain_with_tools(inputs: dict):
         try:
@@ -114,7 +158,6 @@ def create_chat_chain(llm):
             }]
             
             complete_tool_calls = {}
-            failed_tools = set()  # 记录失败的工具
             
             response = await client.chat.completions.create(
                 model=model_name,
@@ -124,126 +167,74 @@ def create_chat_chain(llm):
                 stream=True,
             )
             
+            # 正文直接输出，工具调用的参数分多个片段到达，先按 index 拼接完整
             async for chunk in response:
-                if hasattr(chunk.choices[0].delta, 'tool_calls') and chunk.choices[0].delta.tool_calls:
-                    for tool_call in chunk.choices[0].delta.tool_calls:
-                        # 初始化或更新工具调用信息
-                        if tool_call.index not in complete_tool_calls:
-                            complete_tool_calls[tool_call.index] = {
-                                "id": tool_call.id,
-                                "name": tool_call.function.name if hasattr(tool_call.function, 'name') else None,
-                                "arguments": ""
-                            }
-                        
-                        if hasattr(tool_call.function, 'arguments'):
-                            complete_tool_calls[tool_call.index]["arguments"] += tool_call.function.arguments
-                            
-                        if complete_tool_calls[tool_call.index]["name"] and complete_tool_calls[tool_call.index]["arguments"]:
-                            try:
-                                tool_call_info = complete_tool_calls[tool_call.index]
-                                
-                                if not tool_call_info["arguments"].strip().endswith("}"):
-                                    continue
-                                    
-                                function_args = json.loads(tool_call_info["arguments"])
-                                tool_name = tool_call_info["name"]
-                                
-                                # 检查工具是否已经失败过
-                                if tool_name in failed_tools:
-                                    continue
-                                    
-                                print(f"Available tools: {list(tool_map.keys())}")
-                                print(f"Attempting to use tool: {tool_name}")
-                                tool = tool_map.get(tool_name)
-                                if tool is None:
-                                    print(f"Tool not found: {tool_name}")
-                                    continue
-                                    
-                                try:
-                                    print(f"The tool is {tool}")
-                                    tool_response = tool.invoke(function_args)
-                                    
-                                    # 工具调用成功，添加到消息历史
-                                    messages.append({
-                                        "role": "assistant",
-                                        "content": None,
-                                        "tool_calls": [{
-                                            "id": tool_call_info["id"],
-                                            "function": {
-                                                "name": tool_name,
-                                                "arguments": tool_call_info["arguments"]
-                                            },
-                                            "type": "function"
-                                        }]
-                                    })
-                                    messages.append({
-                                        "role": "tool",
-                                        "content": str(tool_response),
-                                        "tool_call_id": tool_call_info["id"]
-                                    })
-                                    
-                                except Exception as e:
-                                    print(f"Tool invocation error: {str(e)}")
-                                    failed_tools.add(tool_name)
-                                    
-                                    # 如果是速率限制错误，尝试使用其他工具
-                                    if "rate" in str(e).lower():
-                                        # 尝试使用备选工具
-                                        alternate_tool_name = next(
-                                            (name for name in tool_map.keys() 
-                                             if name != tool_name and name not in failed_tools), 
-                                            None
-                                        )
-                                        
-                                        if alternate_tool_name:
-                                            try:
-                                                alternate_tool = tool_map[alternate_tool_name]
-                                                tool_response = alternate_tool.invoke(function_args)
-                                                
-                                                messages.append({
-                                                    "role": "assistant",
-                                                    "content": None,
-                                                    "tool_calls": [{
-                                                        "id": tool_call_info["id"],
-                                                        "function": {
-                                                            "name": alternate_tool_name,
-                                                            "arguments": tool_call_info["arguments"]
-                                                        },
-                                                        "type": "function"
-                                                    }]
-                                                })
-                                                messages.append({
-                                                    "role": "tool",
-                                                    "content": str(tool_response),
-                                                    "tool_call_id": tool_call_info["id"]
-                                                })
-                                            except Exception as e2:
-                                                print(f"Alternate tool failed: {str(e2)}")
-                                                failed_tools.add(alternate_tool_name)
-                                                yield "抱歉，搜索服务暂时不可用，请稍后再试。"
-                                                continue
-                                        else:
-                                            yield "抱歉，所有搜索服务都暂时不可用，请稍后再试。"
-                                            continue
-                                
-                                # 获取最终响应
-                                final_response = await client.chat.completions.create(
-                                    model=model_name,
-                                    messages=messages,
-                                    temperature=0.7,
-                                    stream=True,
-                                )
-
-                                async for final_chunk in final_response:
-                                    if final_chunk.choices[0].delta.content:
-                                        yield final_chunk.choices[0].delta.content
-                                    
-                            except json.JSONDecodeError as e:
-                                print(f"JSON parsing error: {str(e)}, tool_call_info: {tool_call_info}")
-                                continue
-                else:
-                    if chunk.choices[0].delta.content:
-                        yield chunk.choices[0].delta.content
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if getattr(delta, 'tool_calls', None):
+                    for tool_call in delta.tool_calls:
+                        call = complete_tool_calls.setdefault(tool_call.index, {
+                            "id": None,
+                            "name": None,
+                            "arguments": ""
+                        })
+                        if tool_call.id:
+                            call["id"] = tool_call.id
+                        if tool_call.function is not None:
+                            if tool_call.function.name:
+                                call["name"] = tool_call.function.name
+                            if tool_call.function.arguments:
+                                call["arguments"] += tool_call.function.arguments
+                elif delta.content:
+                    yield delta.content
+            
+            if not complete_tool_calls:
+                return
+            
+            tool_calls = [complete_tool_calls[index] for index in sorted(complete_tool_calls)]
+            # 告知调用方回答依赖搜索结果，不能缓存
+            inputs["tools_used"] = [call["name"] for call in tool_calls]
+            print(f"Running tools concurrently: {[call['name'] for call in tool_calls]}")
+            # 所有工具调用并发执行，总耗时取决于最慢的一个
+            results = await asyncio.gather(*(
+                run_tool_call(call, tool_map, config.TOOL_TIMEOUT_SECONDS, tool_cache) for call in tool_calls
+            ))
+            if tool_cache is not None:
+                print(f"ToolCache: {tool_cache.stats()}")
+            if not any(success for success, _ in results):
+                yield "抱歉，所有搜索服务都暂时不可用，请稍后再试。"
+                return
+            
+            messages.append({
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": call["id"],
+                    "function": {
+                        "name": call["name"],
+                        "arguments": call["arguments"]
+                    },
+                    "type": "function"
+                } for call in tool_calls]
+            })
+            for call, (_, content) in zip(tool_calls, results):
+                messages.append({
+                    "role": "tool",
+                    "content": content,
+                    "tool_call_id": call["id"]
+                })
+            
+            # 所有工具结果一起交给模型，只请求一次最终回答
+            final_response = await client.chat.completions.create(
+                model=model_name,
+                messages=messages,
+                temperature=0.7,
+                stream=True,
+            )
+            async for final_chunk in final_response:
+                if final_chunk.choices and final_chunk.choices[0].delta.content:
+                    yield final_chunk.choices[0].delta.content
                     
         except Exception as e:
             print(f"Error in chat chain: {str(e)}")
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict
+
+
+class StreamStats:
+    """流式输出统计：发送的帧数、收到的 token 数和字节数"""
+
+    def __init__(self):
+        self.streams = 0
+        self.tokens = 0
+        self.frames = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def record(self, tokens: int, frames: int, size: int, seconds: float):
+        self.streams += 1
+        self.tokens += tokens
+        self.frames += frames
+        self.bytes += size
+        self.seconds += seconds
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "streams": self.streams,
+            "tokens": self.tokens,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "tokens_per_frame": self.tokens / self.frames if self.frames else 0.0,
+            "frames_per_second": self.frames / self.seconds if self.seconds else 0.0,
+            "bytes_per_second": self.bytes / self.seconds if self.seconds else 0.0,
+        }
+
+
+class TokenCoalescer:
+    """
+    把大模型逐 token 的输出合并成较大的帧再发送。
+
+    第一个非空 token 立即发出，不增加首 token 延迟；之后的 token 先缓存，
+    距缓存中第一个 token 超过 window 秒或累计超过 max_chars 个字符时合并发出。
+    等待下一个 token 期间窗口到期也会发出，生成停顿时已有内容不会被压着。
+    window 为 0 时逐 token 发出。
+    """
+
+    def __init__(self, tokens: AsyncIterator[str], window: float = 0.03, max_chars: int = 64):
+        self.tokens = tokens
+        self.window = window
+        self.max_chars = max_chars
+        self.token_count = 0
+        self.frame_count = 0
+        self.byte_count = 0
+        self.started = time.monotonic()
+        self.first_frame_at = None
+
+    def _frame(self, text: str) -> str:
+        self.frame_count += 1
+        self.byte_count += len(text.encode("utf-8"))
+        if self.first_frame_at is None:
+            self.first_frame_at = time.monotonic()
+        return text
+
+    async def __aiter__(self):
+        if self.window <= 0:
+            async for token in self.tokens:
+                self.token_count += 1
+                if token:
+                    yield self._frame(token)
+            return
+
+        loop = asyncio.get_running_loop()
+        iterator = self.tokens.__aiter__()
+        pending, size, deadline = [], 0, 0.0
+        next_token = None
+        try:
+            while True:
+                if next_token is None:
+                    next_token = asyncio.ensure_future(iterator.__anext__())
+                if pending:
+                    done, _ = await asyncio.wait({next_token}, timeout=max(0.0, deadline - loop.time()))
+                    if not done:
+                        # 窗口到期，下一个 token 还没到，先发出已缓存的内容
+                        yield self._frame("".join(pending))
+                        pending, size = [], 0
+                        continue
+                try:
+                    token = await next_token
+                except StopAsyncIteration:
+                    break
+                finally:
+                    if next_token.done():
+                        next_token = None
+                self.token_count += 1
+                if not token:
+                    continue
+                if self.first_frame_at is None:
+                    yield self._frame(token)
+                    continue
+                if not pending:
+                    deadline = loop.time() + self.window
+                pending.append(token)
+                size += len(token)
+                if size >= self.max_chars:
+                    yield self._frame("".join(pending))
+                    pending, size = [], 0
+            if pending:
+                yield self._frame("".join(pending))
+        finally:
+            if next_token is not None and not next_token.done():
+                next_token.cancel()
+
+    @property
+    def seconds(self) -> float:
+        return time.monotonic() - self.started
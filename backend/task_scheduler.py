@@ -0,0 +1,76 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+
+class TaskScheduler:
+    """
+    后台任务调度器，用于标题生成等不需要阻塞回复的工作。
+
+    任务放入有界队列，由 max_workers 个协程依次执行，所有会话共享这一并发上限；
+    同一个 key (例如 "title:<会话ID>") 的任务排队或执行期间，重复提交会被忽略。
+    队列已满时丢弃新任务，这类任务都可以稍后重做。
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 256):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(1, max_pending)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: Set[asyncio.Task] = set()
+        self._keys: Set[str] = set()
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def _ensure_workers(self):
+        # 在第一次提交时创建，保证队列和工作协程属于当前运行的事件循环
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+        while len(self._workers) < self.max_workers:
+            worker = asyncio.create_task(self._worker())
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+
+    def submit(self, key: str, task_fn: Callable[[], Awaitable]) -> bool:
+        """提交任务，返回是否已加入队列；需在事件循环中调用"""
+        if key in self._keys:
+            return False
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((key, task_fn))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"Scheduler: queue full, dropping task {key}")
+            return False
+        self._keys.add(key)
+        return True
+
+    async def _worker(self):
+        while True:
+            key, task_fn = await self._queue.get()
+            try:
+                await task_fn()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Scheduler: task {key} failed: {str(e)}")
+            finally:
+                self._keys.discard(key)
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def join(self):
+        """等待已提交的任务全部完成"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        for worker in list(self._workers):
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
@@ -0,0 +1,24 @@
+import re
+from typing import List
+
+# 连续的字母数字串或连续的中日韩文字
+_TOKEN_RE = re.compile(r"[0-9a-z_]+|[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]+")
+_CJK_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为检索用的词项。
+
+    英文和数字按单词切分并转为小写；中日韩文字没有空格分隔，按单字加相邻二元组切分，
+    这样单字查询和词语查询都能命中。
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        word = match.group()
+        if not _CJK_RE.match(word):
+            tokens.append(word)
+            continue
+        tokens.extend(word)
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
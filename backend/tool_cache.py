@@ -0,0 +1,80 @@
+import asyncio
+import json
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+def _normalize(value: Any) -> Any:
+    """规范化工具参数：字符串统一大小写和空白，字典按键排序"""
+    if isinstance(value, str):
+        return " ".join(unicodedata.normalize("NFKC", value).lower().split())
+    if isinstance(value, dict):
+        return {key: _normalize(value[key]) for key in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+class ToolResultCache:
+    """
+    搜索工具结果缓存。
+
+    按 工具名 + 规范化参数 缓存结果，超过 ttl_seconds 过期，条目数超过 max_entries 时
+    淘汰最久未使用的条目。相同查询正在执行时，后到的调用等待同一个结果而不是重复请求。
+    只在事件循环中使用，不需要加锁。
+    """
+
+    def __init__(self, ttl_seconds: float = 600, max_entries: int = 512):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(tool_name: str, args: dict) -> str:
+        return json.dumps([tool_name, _normalize(args)], ensure_ascii=False)
+
+    async def get_or_run(self, tool_name: str, args: dict, run: Callable[[], Awaitable[Any]]) -> Any:
+        """返回缓存的结果，未命中时执行 run()；调用方超时取消不会影响正在执行的请求"""
+        key = self.make_key(tool_name, args)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(run())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._on_done(key, done))
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # 失败的结果不缓存
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._entries[key] = (time.monotonic(), task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """缓存命中统计，coalesced 为合并到进行中请求的调用数"""
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / total if total else 0.0,
+            "entries": len(self._entries),
+        }
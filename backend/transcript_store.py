@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, seq);
+CREATE TABLE IF NOT EXISTS titles (
+    conversation_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL
+);
+"""
+
+
+class TranscriptStore:
+    """按会话追加写入的聊天记录存储，读取最近 N 条只扫描 N 行"""
+
+    def __init__(self, db_file: str):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def append(self, conversation_id: str, role: str, content: str, timestamp: str) -> None:
+        """追加一条消息"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO messages (conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                (conversation_id, role, content, timestamp)
+            )
+
+    def extend(self, messages: Iterable[Dict]) -> None:
+        """批量追加消息，每条消息包含 conversation_id/role/content/timestamp"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (conversation_id, role, content, timestamp) "
+                "VALUES (:conversation_id, :role, :content, :timestamp)",
+                list(messages)
+            )
+
+    def tail(self, conversation_id: str, limit: int) -> List[Dict]:
+        """按时间顺序返回会话最近的 limit 条消息"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content, timestamp FROM messages "
+                "WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?",
+                (conversation_id, limit)
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def history(self, conversation_id: str) -> List[Dict]:
+        """按时间顺序返回会话的全部消息"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content, timestamp FROM messages "
+                "WHERE conversation_id = ? ORDER BY seq",
+                (conversation_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, conversation_id: str, role: Optional[str] = None) -> int:
+        """统计会话中的消息条数，可只统计某个角色的消息"""
+        with self._lock:
+            if role is None:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT COUNT(*) FROM messages WHERE conversation_id = ? AND role = ?",
+                    (conversation_id, role)
+                ).fetchone()
+        return row[0]
+
+    def get_title(self, conversation_id: str) -> Optional[str]:
+        """会话自动生成的标题，尚未生成时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT title FROM titles WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_title(self, conversation_id: str, title: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO titles (conversation_id, title) VALUES (?, ?)",
+                (conversation_id, title)
+            )
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM messages LIMIT 1").fetchone() is None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import NamedTuple, Optional
+from urllib.parse import unquote, urlparse
+
+import httpx
+
+_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+# 判断内容类型前至少缓冲的字节数，第一个数据块可能只有几个字节
+_SNIFF_BYTES = 1024
+
+
+class FetchResult(NamedTuple):
+    """下载结果，内容保存在 path 指向的缓存文件中"""
+    url: str
+    kind: str  # pdf、html 或 text
+    content_type: str
+    path: str
+    size: int
+    from_cache: bool
+    truncated: bool
+
+    @property
+    def file_name(self) -> str:
+        """根据URL路径生成文件名，PDF 保证以 .pdf 结尾以便按类型解析"""
+        name = os.path.basename(unquote(urlparse(self.url).path)) or "document"
+        if self.kind == "pdf" and not name.lower().endswith(".pdf"):
+            name += ".pdf"
+        return name
+
+
+class FetchError(Exception):
+    pass
+
+
+def sniff_kind(content_type: str, head: bytes) -> Optional[str]:
+    """根据文件头和 Content-Type 判断内容类型，文件头优先，不支持的类型返回 None"""
+    stripped = head.lstrip().lower()
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if stripped.startswith((b"<!doctype html", b"<html", b"<head", b"<body")):
+        return "html"
+    if "application/pdf" in content_type:
+        return "pdf"
+    if "html" in content_type:
+        return "html"
+    if content_type.startswith("text/") or not content_type:
+        return "text"
+    return None
+
+
+class URLFetcher:
+    """
+    异步网页下载器。
+
+    共用一个带连接池的 httpx 客户端，流式下载并在超过 max_bytes 时停止(网页截断，PDF 报错)，
+    按文件头识别 PDF/HTML。timeout 限制每次读取的等待时间，total_timeout 限制整个下载的时间，
+    避免服务器缓慢地持续发送数据时一直占用连接。下载内容和 ETag/Last-Modified 保存在磁盘缓存中，再次访问同一
+    链接时发送条件请求，服务器返回 304 时直接使用缓存的内容。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 20 * 1024 * 1024,
+        timeout: float = 15,
+        total_timeout: float = 60,
+        max_connections: int = 20,
+        cache_max_bytes: int = 512 * 1024 * 1024
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self.total_timeout = total_timeout
+        self.client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={"User-Agent": _USER_AGENT}
+        )
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def _load_meta(self, meta_path: Path, body_path: Path) -> Optional[dict]:
+        if not (meta_path.exists() and body_path.exists()):
+            return None
+        try:
+            return json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    async def fetch(self, url: str) -> FetchResult:
+        """下载URL，返回缓存文件；网络或HTTP错误抛出 httpx 异常，内容不支持、过大或下载超时抛出 FetchError"""
+        try:
+            async with asyncio.timeout(self.total_timeout):
+                result = await self._download(url)
+        except TimeoutError:
+            raise FetchError(f"下载超时（{self.total_timeout:g} 秒）") from None
+        if not result.from_cache:
+            await asyncio.to_thread(self._evict)
+        return result
+
+    async def _download(self, url: str) -> FetchResult:
+        meta_path, body_path = self._paths(url)
+        meta = self._load_meta(meta_path, body_path)
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        async with self.client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and meta is not None:
+                os.utime(body_path)
+                print(f"URLFetcher: {url} not modified, using cached copy")
+                return FetchResult(
+                    url, meta["kind"], meta["content_type"], str(body_path),
+                    meta["size"], from_cache=True, truncated=meta["truncated"]
+                )
+            response.raise_for_status()
+
+            content_type = response.headers.get("content-type", "").lower()
+            temp_path = body_path.with_name(f"{body_path.name}.{uuid.uuid4().hex}.tmp")
+            size, truncated, kind, head = 0, False, None, b""
+
+            def write(f, block: bytes) -> bool:
+                """写入一块内容，达到大小上限时返回 False"""
+                nonlocal size, truncated
+                if size + len(block) > self.max_bytes:
+                    if kind == "pdf":
+                        raise FetchError(f"文件超过大小上限（{self.max_bytes // (1024 * 1024)} MB）")
+                    f.write(block[:self.max_bytes - size])
+                    size, truncated = self.max_bytes, True
+                    return False
+                f.write(block)
+                size += len(block)
+                return True
+
+            try:
+                with open(temp_path, "wb") as f:
+                    async for block in response.aiter_bytes():
+                        if kind is None:
+                            head += block
+                            if len(head) < _SNIFF_BYTES:
+                                continue
+                            kind = sniff_kind(content_type, head[:_SNIFF_BYTES])
+                            if kind is None:
+                                raise FetchError(f"不支持的内容类型：{content_type}")
+                            block, head = head, b""
+                        if not write(f, block):
+                            break
+                    if kind is None and head:
+                        # 整个响应不足 _SNIFF_BYTES 字节
+                        kind = sniff_kind(content_type, head)
+                        if kind is None:
+                            raise FetchError(f"不支持的内容类型：{content_type}")
+                        write(f, head)
+                os.replace(temp_path, body_path)
+            except BaseException:
+                temp_path.unlink(missing_ok=True)
+                raise
+
+        if kind is None:
+            raise FetchError("页面内容为空")
+        meta = {
+            "url": url,
+            "kind": kind,
+            "content_type": content_type,
+            "size": size,
+            "truncated": truncated,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "fetched_at": time.time(),
+        }
+        # 先写临时文件再原子替换，并发下载同一链接或中途崩溃时不会留下写了一半的元数据
+        temp_meta = meta_path.with_name(f"{meta_path.name}.{uuid.uuid4().hex}.tmp")
+        temp_meta.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(temp_meta, meta_path)
+        return FetchResult(url, kind, content_type, str(body_path), size, from_cache=False, truncated=truncated)
+
+    def _evict(self):
+        """缓存目录超过容量上限时删除最久未使用的内容，遍历目录较慢，在线程中调用"""
+        entries = []
+        for path in self.cache_dir.glob("*.body"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # 同时进行的另一次清理已经删除
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if total <= self.cache_max_bytes:
+            return
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.cache_max_bytes * 0.9:
+                break
+            total -= size
+            path.unlink(missing_ok=True)
+            path.with_suffix(".json").unlink(missing_ok=True)
+
+    async def aclose(self):
+        await self.client.aclose()
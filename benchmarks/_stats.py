@@ -0,0 +1,9 @@
+"""基准测试脚本共用的统计函数"""
+
+
+def percentile(samples, pct: float) -> float:
+    """最近秩法取第 pct 百分位数，没有样本时返回 0"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
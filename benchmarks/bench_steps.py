@@ -0,0 +1,93 @@
+"""
+对话步骤写入延迟基准：在同一个对话中连续写入步骤，统计不同对话长度下
+create_step / update_step 的单步延迟，用于确认延迟不随对话长度增长。
+
+用法（在项目根目录执行）:
+    python -m benchmarks.bench_steps [--steps 10000] [--window 1000]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from benchmarks._stats import percentile
+from frontend.storage import JSONStorage, SQLiteStorage
+
+
+def run(storage, total_steps: int, window: int):
+    """写入 total_steps 个步骤，每 window 个步骤输出一行统计，返回各窗口的统计结果"""
+    storage.create_user({"id": "admin", "identifier": "admin", "metadata": {}})
+    storage.upsert_thread(
+        "bench-thread",
+        {"id": "bench-thread", "createdAt": "2024-01-01T00:00:00+00:00", "userIdentifier": "admin"},
+        {"name": "benchmark"}
+    )
+
+    start_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    create_samples, update_samples, rows = [], [], []
+    for i in range(1, total_steps + 1):
+        step = {
+            "id": f"step-{i}",
+            "threadId": "bench-thread",
+            "type": "assistant_message" if i % 2 else "user_message",
+            "createdAt": (start_time + timedelta(milliseconds=i)).isoformat(),
+            "input": "",
+            "output": ""
+        }
+        t0 = time.perf_counter()
+        storage.create_step(step)
+        t1 = time.perf_counter()
+        storage.update_step("bench-thread", step["id"], {"output": f"第 {i} 条消息的回复内容"})
+        t2 = time.perf_counter()
+        create_samples.append(t1 - t0)
+        update_samples.append(t2 - t1)
+
+        if i % window == 0:
+            t0 = time.perf_counter()
+            storage.get_thread("bench-thread")
+            resume = time.perf_counter() - t0
+            rows.append({
+                "steps": i,
+                "create_p50_us": statistics.median(create_samples) * 1e6,
+                "create_p99_us": percentile(create_samples, 99) * 1e6,
+                "update_p50_us": statistics.median(update_samples) * 1e6,
+                "update_p99_us": percentile(update_samples, 99) * 1e6,
+                "get_thread_ms": resume * 1e3,
+            })
+            create_samples, update_samples = [], []
+    return rows
+
+
+def print_rows(name: str, rows):
+    print(f"\n== {name} ==")
+    print(f"{'steps':>8} {'create p50':>12} {'create p99':>12} {'update p50':>12} {'update p99':>12} {'get_thread':>12}")
+    for row in rows:
+        print(
+            f"{row['steps']:>8} {row['create_p50_us']:>10.1f}us {row['create_p99_us']:>10.1f}us "
+            f"{row['update_p50_us']:>10.1f}us {row['update_p99_us']:>10.1f}us {row['get_thread_ms']:>10.2f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话步骤写入延迟基准")
+    parser.add_argument("--steps", type=int, default=10000, help="写入的步骤总数")
+    parser.add_argument("--window", type=int, default=1000, help="每多少个步骤统计一次")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backends = {
+            "json": lambda: JSONStorage(str(Path(tmp_dir) / "user_session.json")),
+            "sqlite": lambda: SQLiteStorage(str(Path(tmp_dir) / "user_session.db")),
+        }
+        for name, factory in backends.items():
+            storage = factory()
+            try:
+                print_rows(name, run(storage, args.steps, args.window))
+            finally:
+                storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""
+离线基准测试套件：文档加载、向量入库、检索、对话记录和数据层。
+
+嵌入模型和聊天模型用 benchmarks.fakes 中的确定性替身代替，不访问网络；
+所有数据写在临时目录中。结果保存为 JSON，可作为基线与之后的结果比较，
+p50 变慢超过阈值的项目视为性能回退，退出码为 1。benchmarks/baseline.json 是用默认参数
+生成的参考结果(机器和版本信息记录在文件中)，在其他机器上比较时应先在该机器上重新生成基线。
+
+用法（在项目根目录执行）:
+    python -m benchmarks.bench_suite [--output bench.json]
+    python -m benchmarks.bench_suite --compare benchmarks/baseline.json [--threshold 0.2]
+    python -m benchmarks.bench_suite --only data_layer --steps 1000,10000,100000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from langchain_core.documents import Document
+
+from backend.chat_history import ChatHistoryManager
+from backend.content_index import ContentIndex
+from backend.context_builder import ContextBuilder
+from backend.document_loader import add_documents_to_vector_store, load_document, read_document
+from backend.ingestion import IngestionPipeline
+from backend.lexical_index import LexicalIndex
+from backend.llm_setup import init_vector_store
+from backend.qa_chain import create_qa_chain
+from backend.transcript_store import TranscriptStore
+from benchmarks._stats import percentile
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from config import config
+
+PARAGRAPH = (
+    "第{i}节 系统架构说明。前端基于 Chainlit 提供对话界面，后端负责文档解析、切分和向量化入库，"
+    "检索时结合向量相似度与 BM25 关键词得分，再按 token 预算组装上下文交给大模型生成回答。"
+    "Section {i}: the ingestion pipeline batches chunks, computes embeddings and writes vectors to Chroma."
+)
+
+
+def _summarize(samples: List[float], **extra) -> Dict:
+    row = {
+        "runs": len(samples),
+        "p50_ms": statistics.median(samples) * 1e3,
+        "p95_ms": percentile(samples, 95) * 1e3,
+        "min_ms": min(samples) * 1e3,
+    }
+    row.update(extra)
+    return row
+
+
+def measure(fn: Callable, repeat: int, **extra) -> Dict:
+    """执行 fn repeat 次，返回耗时统计；被测代码的日志输出被丢弃"""
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+    return _summarize(samples, **extra)
+
+
+# ---------- 测试文档 ----------
+
+def _write_pdf(path: Path, pages: int):
+    """生成每页一段英文文字的最小 PDF"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for i in range(pages):
+        lines = " ".join(
+            f"BT /F1 10 Tf 40 {760 - row * 14} Td (Page {i} line {row}: the ingestion pipeline batches chunks.) Tj ET"
+            for row in range(50)
+        )
+        objects.append(f"<< /Length {len(lines)} >>\nstream\n{lines}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(bytes(out))
+
+
+def _write_docx(path: Path, paragraphs: List[str]):
+    """生成只包含正文段落的最小 docx"""
+    body = "".join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in paragraphs)
+    with zipfile.ZipFile(path, "w") as docx:
+        docx.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'
+        )
+        docx.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="word/document.xml"/></Relationships>'
+        )
+        docx.writestr(
+            "word/document.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>'
+        )
+
+
+def make_documents(directory: Path, size: int) -> Dict[str, Path]:
+    """在 directory 中生成各格式的测试文档，size 为段落(行、页)数"""
+    paragraphs = [PARAGRAPH.format(i=i) for i in range(size)]
+    files = {
+        "txt": directory / "sample.txt",
+        "md": directory / "sample.md",
+        "csv": directory / "sample.csv",
+        "docx": directory / "sample.docx",
+        "pdf": directory / "sample.pdf",
+    }
+    files["txt"].write_text("\n\n".join(paragraphs), encoding="utf-8")
+    files["md"].write_text(
+        "\n\n".join(f"## 第{i}节\n\n{text}\n\n- 要点一\n- 要点二" for i, text in enumerate(paragraphs)),
+        encoding="utf-8"
+    )
+    files["csv"].write_text(
+        "id,title,content\n" + "\n".join(f'{i},第{i}节,"{text}"' for i, text in enumerate(paragraphs)),
+        encoding="utf-8"
+    )
+    _write_docx(files["docx"], paragraphs)
+    _write_pdf(files["pdf"], max(1, size // 10))
+    return files
+
+
+# ---------- 各组基准 ----------
+
+def bench_load_document(work_dir: Path, args) -> Dict[str, Dict]:
+    files = make_documents(work_dir, args.doc_size)
+    results = {}
+    for kind, path in files.items():
+        results[f"load_document.{kind}"] = measure(
+            lambda: load_document(str(path)), args.repeat, bytes=path.stat().st_size
+        )
+        results[f"read_document.{kind}"] = measure(
+            lambda: read_document(str(path), {"source": path.name}, 2000, on_chunks=lambda chunks: None),
+            args.repeat, bytes=path.stat().st_size
+        )
+    return results
+
+
+def _make_pipeline(work_dir: Path, vector_store, embeddings):
+    return IngestionPipeline(
+        vector_store,
+        embeddings,
+        batch_size=config.INGEST_BATCH_SIZE,
+        max_in_flight=config.INGEST_MAX_IN_FLIGHT,
+        queue_size=config.INGEST_QUEUE_SIZE,
+        content_index=ContentIndex(str(work_dir / "content_index.db")),
+        lexical_index=LexicalIndex(str(work_dir / "lexical_index.db"))
+    )
+
+
+def bench_vector_store(work_dir: Path, args) -> Dict[str, Dict]:
+    embeddings = FakeEmbeddings()
+    config.VECTOR_STORE_PATH = str(work_dir / "chroma_db")
+    vector_store = init_vector_store(embeddings)
+    pipeline = _make_pipeline(work_dir, vector_store, embeddings)
+    results = {}
+
+    # 每轮写入一个新会话，避免内容去重跳过嵌入
+    round_number = [0]
+
+    def ingest():
+        round_number[0] += 1
+        conversation_id = f"bench-{round_number[0]}"
+        documents = [
+            Document(
+                page_content=f"[{conversation_id}] " + PARAGRAPH.format(i=i),
+                metadata={"source": "bench.txt", "conversation_id": conversation_id}
+            )
+            for i in range(args.chunks)
+        ]
+        add_documents_to_vector_store(documents, pipeline)
+
+    results["add_documents_to_vector_store"] = measure(ingest, args.repeat, chunks=args.chunks)
+
+    builder = ContextBuilder(
+        vector_store,
+        token_budget=config.CONTEXT_TOKEN_BUDGET,
+        history_tokens=config.CONTEXT_HISTORY_TOKENS,
+        k=config.RETRIEVAL_K,
+        fetch_k=config.RETRIEVAL_FETCH_K,
+        min_k=config.RETRIEVAL_MIN_K,
+        lambda_mult=config.RETRIEVAL_MMR_LAMBDA,
+        dedup_threshold=config.CONTEXT_DEDUP_THRESHOLD,
+        lexical_index=pipeline.lexical_index,
+        lexical_k=config.LEXICAL_K
+    )
+    history = [f"user: 第{i}个问题\nassistant: 第{i}个回答" for i in range(10)]
+    question = "检索时如何结合 BM25 关键词得分？"
+    results["context_builder.build"] = measure(
+        lambda: builder.build(question, "bench-1", history), args.repeat * 5, chunks=args.chunks
+    )
+
+    qa_chain = create_qa_chain(FakeChatModel())
+
+    async def answer():
+        built = builder.build(question, "bench-1", history)
+        return "".join([chunk async for chunk in qa_chain({"context": built.knowledge_text, "question": question})])
+
+    results["qa_chain.answer"] = measure(lambda: asyncio.run(answer()), args.repeat * 5)
+    return results
+
+
+def bench_chat_history(work_dir: Path, args) -> Dict[str, Dict]:
+    store = TranscriptStore(str(work_dir / "chat_history.db"))
+    store.append("seed", "user", "seed", "2024-01-01T00:00:00")
+    manager = ChatHistoryManager(None, store)
+    results = {}
+    start_time = datetime(2024, 1, 1)
+    written = 0
+    for size in args.history:
+        store.extend(
+            {
+                "conversation_id": "bench",
+                "role": "user" if i % 2 else "assistant",
+                "content": f"第 {i} 条消息：" + PARAGRAPH.format(i=i)[:80],
+                "timestamp": (start_time + timedelta(seconds=i)).isoformat(),
+            }
+            for i in range(written, size)
+        )
+        written = size
+        results[f"get_recent_messages.{size}"] = measure(
+            lambda: manager.get_recent_messages("bench", limit=10), args.repeat * 20, messages=size
+        )
+    store.close()
+    return results
+
+
+def bench_data_layer(work_dir: Path, args) -> Dict[str, Dict]:
+    from chainlit.context import init_http_context
+    from chainlit.data.base import Pagination, ThreadFilter
+    from frontend.data_layer import AI4FSDataLayer
+    from frontend.storage import create_storage
+
+    async def run():
+        # HTTP 上下文中 queue_until_user_message 装饰的方法会立即执行
+        init_http_context()
+        results = {}
+        for backend, steps in itertools.product(args.backends, args.steps):
+            config.DATA_LAYER_BACKEND = backend
+            config.USER_SESSIONS_DB = str(work_dir / f"user_session_{steps}.db")
+            config.USER_SESSIONS_FILE = str(work_dir / f"user_session_{steps}.json")
+            layer = AI4FSDataLayer(create_storage(config))
+            layer.storage.create_user({"id": "admin", "identifier": "admin", "metadata": {}})
+
+            threads = max(1, steps // args.steps_per_thread)
+            for t in range(threads):
+                await layer.update_thread(f"thread-{t}", name=f"对话 {t}", user_id="admin")
+
+            start_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+            create_samples, update_samples = [], []
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(steps):
+                    step = {
+                        "id": f"step-{i}",
+                        "threadId": f"thread-{i % threads}",
+                        "type": "assistant_message" if i % 2 else "user_message",
+                        "createdAt": (start_time + timedelta(milliseconds=i)).isoformat(),
+                        "input": "",
+                        "output": "",
+                    }
+                    t0 = time.perf_counter()
+                    await layer.create_step(step)
+                    t1 = time.perf_counter()
+                    step["output"] = f"第 {i} 条消息的回复内容"
+                    await layer.update_step(step)
+                    t2 = time.perf_counter()
+                    create_samples.append(t1 - t0)
+                    update_samples.append(t2 - t1)
+
+            list_samples = []
+            for _ in range(args.repeat * 5):
+                t0 = time.perf_counter()
+                await layer.list_threads(Pagination(first=20), ThreadFilter(userId="admin"))
+                list_samples.append(time.perf_counter() - t0)
+
+            prefix = f"data_layer.{backend}"
+            results[f"{prefix}.create_step.{steps}"] = _summarize(create_samples, steps=steps)
+            results[f"{prefix}.update_step.{steps}"] = _summarize(update_samples, steps=steps)
+            results[f"{prefix}.list_threads.{steps}"] = _summarize(list_samples, steps=steps, threads=threads)
+            await layer.close()
+        return results
+
+    return asyncio.run(run())
+
+
+GROUPS = {
+    "load_document": bench_load_document,
+    "vector_store": bench_vector_store,
+    "chat_history": bench_chat_history,
+    "data_layer": bench_data_layer,
+}
+
+
+# ---------- 输出和比较 ----------
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def print_results(results: Dict[str, Dict]):
+    print(f"\n{'benchmark':<40} {'runs':>6} {'p50':>12} {'p95':>12} {'min':>12}")
+    for name, row in results.items():
+        print(
+            f"{name:<40} {row['runs']:>6} {row['p50_ms']:>10.3f}ms "
+            f"{row['p95_ms']:>10.3f}ms {row['min_ms']:>10.3f}ms"
+        )
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float, min_delta_ms: float) -> List[str]:
+    """逐项比较 p50，返回变慢超过 threshold 且绝对差值超过 min_delta_ms 的项目"""
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, row in results.items():
+        if name not in baseline:
+            print(f"{name:<40} {'-':>12} {row['p50_ms']:>10.3f}ms {'new':>8}")
+            continue
+        before = baseline[name]["p50_ms"]
+        change = (row["p50_ms"] - before) / before if before else 0.0
+        flag = ""
+        # 亚毫秒级的项目抖动较大，绝对差值太小的不算回退
+        if change > threshold and row["p50_ms"] - before > min_delta_ms:
+            regressions.append(name)
+            flag = "  << 回退"
+        print(f"{name:<40} {before:>10.3f}ms {row['p50_ms']:>10.3f}ms {change:>+7.0%}{flag}")
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试套件")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"要运行的组，逗号分隔：{','.join(GROUPS)}")
+    parser.add_argument("--repeat", type=int, default=5, help="每项的基本重复次数")
+    parser.add_argument("--doc-size", type=int, default=200, help="测试文档的段落数")
+    parser.add_argument("--chunks", type=int, default=256, help="每次入库的文本块数")
+    parser.add_argument("--history", type=_int_list, default=[100, 1000, 10000, 100000], help="对话记录条数")
+    parser.add_argument("--steps", type=_int_list, default=[1000, 10000, 100000], help="数据层步骤数")
+    parser.add_argument(
+        "--backends", type=lambda value: value.split(","), default=[config.DATA_LAYER_BACKEND],
+        help="数据层存储后端，逗号分隔：json,sqlite"
+    )
+    parser.add_argument("--steps-per-thread", type=int, default=100, help="每个对话的步骤数")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 变慢超过该比例视为回退")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="p50 变慢不超过该毫秒数时不视为回退")
+    args = parser.parse_args()
+
+    groups = [name for name in args.only.split(",") if name]
+    unknown = [name for name in groups if name not in GROUPS]
+    if unknown:
+        parser.error(f"未知的基准组：{', '.join(unknown)}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in groups:
+            work_dir = Path(tmp_dir) / name
+            work_dir.mkdir()
+            print(f"== {name} ==", flush=True)
+            t0 = time.perf_counter()
+            results.update(GROUPS[name](work_dir, args))
+            print(f"   {time.perf_counter() - t0:.1f}s", flush=True)
+
+    print_results(results)
+    if args.output:
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已保存到 {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} 项性能回退：{', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
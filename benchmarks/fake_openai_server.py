@@ -0,0 +1,197 @@
+"""
+负载测试用的本地模型服务：兼容 OpenAI 的对话和嵌入接口，以及 Ollama 的嵌入接口。
+
+首 token 延迟、输出速度和回答长度可以配置；请求带有工具定义且问题中包含触发词时
+返回工具调用，收到工具结果后再输出最终回答。嵌入向量由 benchmarks.fakes.FakeEmbeddings 生成。
+
+用法（在项目根目录执行）:
+    python -m benchmarks.fake_openai_server [--port 8911] [--latency-ms 300] [--tokens-per-second 50]
+
+应用中设置 CUSTOM_MODEL_API_BASE=http://127.0.0.1:8911/v1，
+EMBEDDING_MODEL_API_BASE=http://127.0.0.1:8911 (Ollama) 或 http://127.0.0.1:8911/v1 (OpenAI)。
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.fakes import FakeEmbeddings
+
+ANSWER_TOKENS = ["根据", "已知", "信息", "，", "系统", "由", "前端", "、", "检索", "和", "生成", "三", "部分", "组成", "。"]
+_QUESTION_RE = re.compile(r"(?:当前问题|问题)[：:]\s*(.+)", re.S)
+
+
+@dataclass
+class ServerOptions:
+    latency_ms: float = 300
+    tokens_per_second: float = 50
+    answer_tokens: int = 120
+    tool_trigger: str = "搜索"
+    embedding_latency_ms: float = 20
+    embedding_size: int = 256
+
+
+def _question(messages) -> str:
+    """取出提示词中的用户问题，找不到时返回最后一条用户消息"""
+    for message in reversed(messages):
+        if message.get("role") == "user" and isinstance(message.get("content"), str):
+            match = _QUESTION_RE.search(message["content"])
+            return (match.group(1) if match else message["content"]).strip()
+    return ""
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def create_app(options: ServerOptions) -> FastAPI:
+    app = FastAPI()
+    embeddings = FakeEmbeddings(options.embedding_size)
+    stats = {"chat": 0, "tool_calls": 0, "embeddings": 0, "active": 0}
+
+    def wants_tool(body: dict) -> bool:
+        messages = body.get("messages", [])
+        return (
+            bool(body.get("tools"))
+            and not any(message.get("role") == "tool" for message in messages)
+            and options.tool_trigger in _question(messages)
+        )
+
+    def answer_tokens():
+        return [ANSWER_TOKENS[i % len(ANSWER_TOKENS)] for i in range(options.answer_tokens)]
+
+    async def stream_answer(completion_id: str, model: str):
+        stats["active"] += 1
+        try:
+            await asyncio.sleep(options.latency_ms / 1000)
+            yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+            interval = 1 / options.tokens_per_second if options.tokens_per_second > 0 else 0
+            for token in answer_tokens():
+                yield _chunk(completion_id, model, {"content": token})
+                if interval:
+                    await asyncio.sleep(interval)
+            yield _chunk(completion_id, model, {}, "stop")
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["active"] -= 1
+
+    async def stream_tool_call(completion_id: str, model: str, body: dict):
+        await asyncio.sleep(options.latency_ms / 1000)
+        name = body["tools"][0]["function"]["name"]
+        arguments = json.dumps({"query": _question(body["messages"])[:100]}, ensure_ascii=False)
+        yield _chunk(completion_id, model, {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "index": 0,
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": name, "arguments": ""},
+            }],
+        })
+        # 参数分两段发送，和真实接口一样需要客户端拼接
+        half = len(arguments) // 2
+        for part in (arguments[:half], arguments[half:]):
+            yield _chunk(completion_id, model, {"tool_calls": [{"index": 0, "function": {"arguments": part}}]})
+        yield _chunk(completion_id, model, {}, "tool_calls")
+        yield "data: [DONE]\n\n"
+
+    @app.get("/health")
+    async def health():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        stats["chat"] += 1
+        if body.get("stream"):
+            if wants_tool(body):
+                stats["tool_calls"] += 1
+                generator = stream_tool_call(completion_id, model, body)
+            else:
+                generator = stream_answer(completion_id, model)
+            return StreamingResponse(generator, media_type="text/event-stream")
+
+        # 非流式请求(例如生成标题)：等待生成完整回答的时间后一次返回
+        duration = options.latency_ms / 1000
+        if options.tokens_per_second > 0:
+            duration += options.answer_tokens / options.tokens_per_second
+        await asyncio.sleep(duration)
+        content = "".join(answer_tokens())
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": options.answer_tokens, "total_tokens": options.answer_tokens},
+        }
+
+    def embed_inputs(inputs) -> list:
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        # OpenAI 客户端可能发送 token 编号数组，按其字符串形式生成向量
+        texts = [item if isinstance(item, str) else json.dumps(item) for item in inputs]
+        stats["embeddings"] += len(texts)
+        return embeddings.embed_documents(texts)
+
+    @app.post("/v1/embeddings")
+    async def openai_embeddings(request: Request):
+        body = await request.json()
+        await asyncio.sleep(options.embedding_latency_ms / 1000)
+        vectors = embed_inputs(body.get("input", []))
+        return {
+            "object": "list",
+            "model": body.get("model", "fake-embedding"),
+            "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.post("/api/embed")
+    async def ollama_embed(request: Request):
+        body = await request.json()
+        await asyncio.sleep(options.embedding_latency_ms / 1000)
+        return JSONResponse({"model": body.get("model", "fake-embedding"), "embeddings": embed_inputs(body.get("input", []))})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="兼容 OpenAI 接口的本地模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8911)
+    parser.add_argument("--latency-ms", type=float, default=300, help="首 token 延迟(毫秒)")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="输出速度，0 为不限速")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="每个回答的 token 数")
+    parser.add_argument("--tool-trigger", default="搜索", help="问题中包含该词时返回工具调用")
+    parser.add_argument("--embedding-latency-ms", type=float, default=20, help="每次嵌入请求的延迟(毫秒)")
+    args = parser.parse_args()
+
+    options = ServerOptions(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        tool_trigger=args.tool_trigger,
+        embedding_latency_ms=args.embedding_latency_ms
+    )
+    uvicorn.run(create_app(options), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+基准测试用的离线替身：确定性的嵌入模型和聊天模型，不访问网络，
+结果只取决于输入文本，便于不同版本之间比较。
+"""
+import hashlib
+import math
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    把文本的字符二元组哈希到固定维度并归一化。
+
+    相同文本得到相同向量，字面相近的文本余弦相似度也较高，
+    MMR 检索和回答缓存的相似度判断因此仍有意义。
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        text = text.lower()
+        for i in range(max(1, len(text) - 1)):
+            digest = hashlib.blake2b(text[i:i + 2].encode("utf-8"), digest_size=4).digest()
+            vector[int.from_bytes(digest, "little") % self.size] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """总是返回同一段回答的聊天模型，流式输出时按字切分"""
+
+    answer: str = "根据已知信息，这份文档主要介绍了系统的整体架构、数据流程和部署方式。"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        for char in self.answer:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=char))
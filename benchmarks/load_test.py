@@ -0,0 +1,515 @@
+"""
+端到端并发负载测试：模拟 N 个会话同时调用 MessageProcessor.process_message，
+统计首 token 延迟(TTFT)、完整回答耗时和事件循环延迟，用于确定单个进程能支撑的并发会话数。
+
+大模型和嵌入模型指向 benchmarks.fake_openai_server 启动的本地服务；界面消息换成只记录
+时间的替身，搜索工具换成固定延迟的本地工具。每个会话按比例混合普通对话、上传文件和
+需要搜索的提问。所有数据写在临时目录中。
+
+事件循环延迟的最大值主要来自两处，--trace-stalls 可以列出每次停顿时事件循环和其他线程所在的位置：
+- Chroma 的 Rust 客户端在 upsert/query 期间持有 GIL，入库线程写入一批文本块时事件循环随之停顿
+  几十到一百多毫秒，停顿长度随 INGEST_BATCH_SIZE 增长；
+- 完整的垃圾回收会暂停所有线程，需要遍历启动时加载的全部模块和模型对象(32 个会话时约 220ms)；
+  --gc-freeze 在初始化后调用 gc.freeze() 把它们移出回收范围，可对比开启前后的停顿(约 15ms)。
+测量前每种轮次先预热一次，首次请求时的延迟导入和建立连接不计入结果。
+
+用法（在项目根目录执行）:
+    python -m benchmarks.load_test [--concurrency 1,8,32] [--turns 4] [--mix chat=6,file=2,tool=2]
+    python -m benchmarks.load_test --server-url http://127.0.0.1:8911   # 使用已启动的模型服务
+    python -m benchmarks.load_test --concurrency 32 --trace-stalls 50  # 列出超过 50ms 的停顿
+    python -m benchmarks.load_test --concurrency 32 --trace-stalls 50 --gc-freeze
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import gc
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib.request
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from unittest import mock
+
+from benchmarks._stats import percentile
+
+# 当前正在处理的轮次，界面消息替身据此记录首 token 时间
+_current_turn: contextvars.ContextVar = contextvars.ContextVar("current_turn", default=None)
+
+
+@dataclass
+class TurnResult:
+    kind: str
+    started: float
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def ttft(self) -> Optional[float]:
+        return self.first_token - self.started if self.first_token is not None else None
+
+    @property
+    def latency(self) -> Optional[float]:
+        return self.finished - self.started if self.finished is not None else None
+
+
+class RecordingMessage:
+    """代替 cl.Message：不发送到界面，只记录当前轮次收到第一个 token 的时间"""
+
+    def __init__(self, content: str = "", elements=None, **kwargs):
+        self.content = content
+        self.elements = elements or []
+
+    async def send(self):
+        return self
+
+    async def update(self):
+        return True
+
+    async def stream_token(self, token: str, is_sequence: bool = False):
+        turn = _current_turn.get()
+        if turn is not None and turn.first_token is None and token:
+            turn.first_token = time.perf_counter()
+
+
+@dataclass
+class LocalFile:
+    """代替 cl.File"""
+    name: str
+    path: str
+
+
+class UserSession:
+    """代替 cl.user_session，负载测试不使用会话设置"""
+
+    def get(self, key, default=None):
+        return default
+
+
+@dataclass
+class LagMonitor:
+    """定时休眠并记录实际唤醒时间与预期的偏差，即事件循环的延迟"""
+    interval: float = 0.01
+    samples: List[float] = field(default_factory=list)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+
+class StallWatchdog:
+    """
+    找出阻塞事件循环的代码：事件循环每 interval 秒更新一次心跳，监视线程发现心跳超过
+    threshold 秒没有更新时，抓取事件循环线程当时的调用栈，记录阻塞时长和所在位置。
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.005):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: List[Dict] = []
+        self._beat = time.monotonic()
+        self._stopped = threading.Event()
+        self._loop = None
+        self._thread_id = None
+        self._current: Optional[Dict] = None
+
+    def _heartbeat(self):
+        now = time.monotonic()
+        if self._current is not None:
+            self._current["seconds"] = now - self._current.pop("_started")
+            self.stalls.append(self._current)
+            self._current = None
+        self._beat = now
+        if not self._stopped.is_set():
+            self._loop.call_later(self.interval, self._heartbeat)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            if self._current is None and time.monotonic() - beat > self.threshold:
+                frames = sys._current_frames()
+                frame = frames.pop(self._thread_id, None)
+                frames.pop(threading.get_ident(), None)
+                if frame is None:
+                    continue
+                # 同一时刻在运行的其他线程：事件循环线程未必在执行耗时操作，也可能在等待 GIL
+                busy = [self._describe(traceback.extract_stack(other)) for other in frames.values()]
+                self._current = {
+                    "_started": beat,
+                    "where": self._describe(traceback.extract_stack(frame)),
+                    "busy_threads": [where for where in busy if not self._idle(where)],
+                }
+
+    @staticmethod
+    def _describe(stack) -> List[str]:
+        """调用栈中项目代码的最内层几帧，以及最内层的一帧(通常是第三方库或标准库)"""
+        root = str(Path(__file__).resolve().parent.parent)
+        frames = [f"{Path(f.filename).name}:{f.lineno} {f.name}" for f in stack
+                  if f.filename.startswith(root) and "/benchmarks/" not in f.filename]
+        innermost = stack[-1]
+        return frames[-3:] + [f"{innermost.filename.rsplit('site-packages/', 1)[-1]}:{innermost.lineno} {innermost.name}"]
+
+    @staticmethod
+    def _idle(where: List[str]) -> bool:
+        innermost = where[-1]
+        return any(name in innermost for name in ("threading.py", "queue.py", "selectors.py", " _worker", "_recv"))
+
+    def _on_gc(self, phase: str, info: Dict):
+        # 垃圾回收期间所有线程都停顿，调用栈看起来落在任意位置，单独统计
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+        elif self._gc_started is not None:
+            self.gc_pauses.append((info["generation"], time.perf_counter() - self._gc_started))
+            self._gc_started = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._gc_started = None
+        self.gc_pauses: List[tuple] = []
+        gc.callbacks.append(self._on_gc)
+        self._loop.call_soon(self._heartbeat)
+        threading.Thread(target=self._watch, name="stall-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        gc.callbacks.remove(self._on_gc)
+
+    def gc_summary(self) -> Dict:
+        pauses = [seconds for _, seconds in self.gc_pauses]
+        full = [seconds for generation, seconds in self.gc_pauses if generation == 2]
+        return {
+            "count": len(pauses),
+            "total_ms": sum(pauses) * 1e3,
+            "max_ms": max(pauses, default=0.0) * 1e3,
+            "full_count": len(full),
+            "full_max_ms": max(full, default=0.0) * 1e3,
+        }
+
+    def top(self, count: int = 5) -> List[Dict]:
+        return sorted(self.stalls, key=lambda stall: stall["seconds"], reverse=True)[:count]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"模型服务 {url} 未能启动")
+
+
+def _configure_environment(server_url: str, data_dir: Path, args):
+    """在导入项目模块之前设置环境变量，使配置指向本地模型服务和临时目录"""
+    os.environ.update({
+        "ANONYMIZED_TELEMETRY": "False",
+        "USE_CUSTOM_MODEL": "true",
+        "CUSTOM_MODEL_API_BASE": f"{server_url}/v1",
+        "CUSTOM_MODEL_API_KEY": "fake",
+        "CUSTOM_MODEL_NAME": "fake-model",
+        "USE_CUSTOM_EMBEDDINGS": "true",
+        "EMBEDDING_MODEL_API_BASE": server_url,
+        "EMBEDDING_MODEL": "fake-embedding",
+        "TAVILY_API_KEY": "",
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "VECTOR_STORE_PATH": str(data_dir / "chroma_db"),
+        "CONTENT_INDEX_DB": str(data_dir / "content_index.db"),
+        "LEXICAL_INDEX_DB": str(data_dir / "lexical_index.db"),
+        "EMBEDDING_CACHE_PATH": str(data_dir / "embedding_cache.db"),
+        "CHAT_HISTORY_DB": str(data_dir / "chat_history.db"),
+        "UPLOAD_FOLDER": str(data_dir / "uploads"),
+        "URL_CACHE_DIR": str(data_dir / "url_cache"),
+        "USER_SESSIONS_FILE": str(data_dir / "user_session.json"),
+        "USER_SESSIONS_DB": str(data_dir / "user_session.db"),
+    })
+
+
+def _make_search_tool(latency: float):
+    """固定延迟的本地搜索工具，名称与 DuckDuckGo 搜索工具一致"""
+    from langchain_core.tools import BaseTool
+    from pydantic import BaseModel
+
+    class SearchInput(BaseModel):
+        query: str
+
+    class LocalSearchTool(BaseTool):
+        name: str = "duckduckgo_results_json"
+        description: str = "搜索互联网，返回相关网页的标题、链接和摘要"
+        args_schema: type = SearchInput
+        max_results: int = 2
+
+        def _run(self, query: str) -> str:
+            time.sleep(latency)
+            return self._results(query)
+
+        async def _arun(self, query: str) -> str:
+            await asyncio.sleep(latency)
+            return self._results(query)
+
+        def _results(self, query: str) -> str:
+            return json.dumps([
+                {"title": f"{query} - 结果 {i}", "link": f"https://example.com/{i}", "snippet": f"关于 {query} 的摘要 {i}"}
+                for i in range(self.max_results)
+            ], ensure_ascii=False)
+
+    return LocalSearchTool
+
+
+def _write_upload(directory: Path, conversation: int, turn: int) -> LocalFile:
+    path = directory / f"notes_{conversation}_{turn}.md"
+    sections = [
+        f"## 第{i}节\n\n会话 {conversation} 的第 {turn} 份文档，第 {i} 节介绍系统的部署方式、"
+        f"数据流程和监控指标。Deployment notes {conversation}-{turn}-{i}."
+        for i in range(40)
+    ]
+    path.write_text("\n\n".join(sections), encoding="utf-8")
+    return LocalFile(name=path.name, path=str(path))
+
+
+async def run_conversation(
+    conversation: int,
+    turns: int,
+    kinds: List[str],
+    think_time: float,
+    upload_dir: Path,
+    results: List[TurnResult],
+    prefix: str = ""
+):
+    from frontend.msg_handle import _UNCACHEABLE_PREFIXES, GlobalComponents, MessageProcessor
+
+    conversation_id = f"load-{conversation}-{time.time_ns()}"
+    for turn in range(turns):
+        kind = kinds[(conversation + turn) % len(kinds)]
+        if kind == "file":
+            message = RecordingMessage(content="总结一下这份文档", elements=[_write_upload(upload_dir, conversation, turn)])
+        elif kind == "tool":
+            message = RecordingMessage(content=f"{prefix}请搜索第 {turn} 个问题相关的最新资料")
+        else:
+            message = RecordingMessage(content=f"{prefix}第 {turn} 个问题：系统由哪几部分组成？")
+
+        result = TurnResult(kind, time.perf_counter())
+        token = _current_turn.set(result)
+        try:
+            # 与 app.main 相同：先保存提问，回答完成后保存回答
+            GlobalComponents.chat_history.save_message(conversation_id, "user", message.content)
+            response = await MessageProcessor.process_message(message, conversation_id)
+            GlobalComponents.chat_history.save_message(conversation_id, "assistant", response)
+            if response.startswith(_UNCACHEABLE_PREFIXES + ("文件处理失败",)):
+                result.error = response[:80]
+        except Exception as e:
+            result.error = str(e)
+        finally:
+            result.finished = time.perf_counter()
+            _current_turn.reset(token)
+        results.append(result)
+        if think_time:
+            await asyncio.sleep(random.uniform(0, 2 * think_time))
+
+
+async def run_round(concurrency: int, args, upload_dir: Path) -> Dict:
+    watchdog = None
+    if args.trace_stalls:
+        watchdog = StallWatchdog(args.trace_stalls / 1000)
+        watchdog.start()
+    monitor = LagMonitor()
+    monitor_task = asyncio.create_task(monitor.run())
+    results: List[TurnResult] = []
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) if args.quiet else contextlib.nullcontext():
+            await asyncio.gather(*(
+                run_conversation(i, args.turns, args.kinds, args.think_time, upload_dir, results)
+                for i in range(concurrency)
+            ))
+    finally:
+        elapsed = time.perf_counter() - started
+        monitor_task.cancel()
+        if watchdog is not None:
+            watchdog.stop()
+    report = summarize(concurrency, results, monitor.samples, elapsed)
+    if watchdog is not None:
+        report["stalls"] = watchdog.top()
+        report["gc"] = watchdog.gc_summary()
+    return report
+
+
+def _latency_stats(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": percentile(values, 50) * 1e3,
+        "p95_ms": percentile(values, 95) * 1e3,
+        "p99_ms": percentile(values, 99) * 1e3,
+    }
+
+
+def summarize(concurrency: int, results: List[TurnResult], lag_samples: List[float], elapsed: float) -> Dict:
+    report = {
+        "concurrency": concurrency,
+        "turns": len(results),
+        "errors": sum(1 for result in results if result.error),
+        "turns_per_second": len(results) / elapsed if elapsed else 0.0,
+        "loop_lag": dict(_latency_stats(lag_samples), max_ms=max(lag_samples, default=0.0) * 1e3),
+        "kinds": {},
+    }
+    for kind in sorted({result.kind for result in results}) + ["all"]:
+        selected = [result for result in results if kind == "all" or result.kind == kind]
+        ok = [result for result in selected if not result.error]
+        report["kinds"][kind] = {
+            "turns": len(selected),
+            "errors": len(selected) - len(ok),
+            "ttft": _latency_stats([result.ttft for result in ok if result.ttft is not None]),
+            "latency": _latency_stats([result.latency for result in ok]),
+        }
+    errors = [result.error for result in results if result.error]
+    if errors:
+        report["first_error"] = errors[0]
+    return report
+
+
+def print_report(reports: List[Dict]):
+    print(
+        f"\n{'sessions':>8} {'kind':>6} {'turns':>6} {'err':>4} "
+        f"{'ttft p50':>10} {'ttft p95':>10} {'ttft p99':>10} {'total p50':>10} {'total p95':>10} {'total p99':>10}"
+    )
+    for report in reports:
+        for kind, row in report["kinds"].items():
+            ttft, latency = row["ttft"], row["latency"]
+            print(
+                f"{report['concurrency']:>8} {kind:>6} {row['turns']:>6} {row['errors']:>4} "
+                f"{ttft['p50_ms']:>8.0f}ms {ttft['p95_ms']:>8.0f}ms {ttft['p99_ms']:>8.0f}ms "
+                f"{latency['p50_ms']:>8.0f}ms {latency['p95_ms']:>8.0f}ms {latency['p99_ms']:>8.0f}ms"
+            )
+        lag = report["loop_lag"]
+        print(
+            f"{'':>8} 事件循环延迟 p50 {lag['p50_ms']:.1f}ms p95 {lag['p95_ms']:.1f}ms "
+            f"p99 {lag['p99_ms']:.1f}ms max {lag['max_ms']:.1f}ms，{report['turns_per_second']:.1f} 轮/秒"
+        )
+        if "gc" in report:
+            gc_stats = report["gc"]
+            print(
+                f"{'':>8} 垃圾回收 {gc_stats['count']} 次共 {gc_stats['total_ms']:.0f}ms，"
+                f"最长 {gc_stats['max_ms']:.0f}ms；完整回收 {gc_stats['full_count']} 次，最长 {gc_stats['full_max_ms']:.0f}ms"
+            )
+        for stall in report.get("stalls", []):
+            print(f"{'':>8} 阻塞 {stall['seconds'] * 1e3:.0f}ms：{' <- '.join(reversed(stall['where']))}")
+            for where in stall["busy_threads"]:
+                print(f"{'':>10} 同时运行的线程：{' <- '.join(reversed(where))}")
+        if report.get("first_error"):
+            print(f"{'':>8} 首个错误：{report['first_error']}")
+
+
+def _parse_mix(value: str) -> List[str]:
+    """chat=6,file=2,tool=2 -> 按比例交错排列的轮次类型"""
+    kinds = []
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ("chat", "file", "tool"):
+            raise argparse.ArgumentTypeError(f"未知的轮次类型：{name}")
+        kinds.extend([name] * int(weight or 1))
+    random.Random(0).shuffle(kinds)
+    return kinds
+
+
+async def main_async(args, upload_dir: Path) -> List[Dict]:
+    from backend import qa_chain
+    from frontend import msg_handle
+    from frontend.msg_handle import GlobalComponents, init_everything
+
+    fake_cl = SimpleNamespace(Message=RecordingMessage, File=LocalFile, user_session=UserSession())
+    with mock.patch.object(qa_chain, "DuckDuckGoSearchResults", _make_search_tool(args.tool_latency_ms / 1000)), \
+            mock.patch.object(msg_handle, "cl", fake_cl):
+        with contextlib.redirect_stdout(io.StringIO()):
+            init_everything()
+        if args.gc_freeze:
+            gc.collect()
+            gc.freeze()
+
+        reports = []
+        try:
+            # 预热：每种轮次执行一次，首次请求时的延迟导入和建立连接不计入结果；
+            # 使用单独的会话编号和提问，不会让之后的轮次命中缓存
+            print("== 预热 ==", flush=True)
+            with contextlib.redirect_stdout(io.StringIO()):
+                await run_conversation(-1, 3, ["chat", "file", "tool"], 0, upload_dir, [], prefix="预热 ")
+            for concurrency in args.concurrency:
+                print(f"== {concurrency} 个并发会话 ==", flush=True)
+                reports.append(await run_round(concurrency, args, upload_dir))
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                await GlobalComponents.shutdown()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端并发负载测试")
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 32],
+                        help="并发会话数，逗号分隔时依次测试")
+    parser.add_argument("--turns", type=int, default=4, help="每个会话的轮数")
+    parser.add_argument("--mix", type=_parse_mix, default="chat=6,file=2,tool=2", dest="kinds",
+                        help="轮次类型及比例：chat 普通对话、file 上传文件、tool 需要搜索")
+    parser.add_argument("--think-time", type=float, default=0.5, help="两轮之间的平均间隔秒数")
+    parser.add_argument("--tool-latency-ms", type=float, default=300, help="搜索工具的延迟(毫秒)")
+    parser.add_argument("--answer-cache", action="store_true", help="开启回答缓存(默认关闭)")
+    parser.add_argument("--server-url", help="已启动的模型服务地址，不指定时自动启动")
+    parser.add_argument("--server-args", default="", help="自动启动模型服务时的参数，例如 \"--latency-ms 500\"")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--verbose", dest="quiet", action="store_false", help="显示应用日志")
+    parser.add_argument("--trace-stalls", type=float, default=0, metavar="MS",
+                        help="列出单次阻塞事件循环超过 MS 毫秒的代码位置")
+    parser.add_argument("--gc-freeze", action="store_true",
+                        help="初始化后调用 gc.freeze()，启动时创建的对象不再参与垃圾回收")
+    args = parser.parse_args()
+
+    server = None
+    server_url = args.server_url
+    if server_url is None:
+        port = _free_port()
+        server_url = f"http://127.0.0.1:{port}"
+        # 模型服务放在独立进程中，不占用被测进程的 CPU 和事件循环
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(port), *args.server_args.split()]
+        )
+    try:
+        _wait_for_server(server_url)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_dir = Path(tmp_dir)
+            upload_dir = data_dir / "client_files"
+            upload_dir.mkdir()
+            _configure_environment(server_url, data_dir, args)
+            reports = asyncio.run(main_async(args, upload_dir))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print_report(reports)
+    if args.output:
+        Path(args.output).write_text(json.dumps(reports, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,22 +22,138 @@ class Config:
     
     USE_CUSTOM_EMBEDDINGS = os.getenv("USE_CUSTOM_EMBEDDINGS", "false").lower() == "true"
 
+    # 嵌入向量缓存配置
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.db")
+    EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", 512))
+    EMBEDDING_CACHE_LRU_SIZE = int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", 4096))
+
     # 模型选择
     USE_CUSTOM_MODEL = os.getenv("USE_CUSTOM_MODEL", "false").lower() == "true"
 
+    # 大模型和嵌入模型接口共用的 HTTP 连接池配置
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+    # 空闲连接保持的秒数和请求超时秒数
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 120))
+
     # 其他可选配置
     MAX_TOKENS = int(os.getenv("MAX_TOKENS", 1000))
     TEMPERATURE = float(os.getenv("TEMPERATURE", 0.7))
 
+    # 文件或网页问答时放入提示词的最大字符数
+    QA_CONTEXT_CHARS = int(os.getenv("QA_CONTEXT_CHARS", 28672))
+
+    # 对话提示词的 token 预算，问题、对话历史和检索到的文件内容共用
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 6000))
+    # 对话历史最多占用的 token 数和读取的消息条数
+    CONTEXT_HISTORY_TOKENS = int(os.getenv("CONTEXT_HISTORY_TOKENS", 1500))
+    CONTEXT_HISTORY_MESSAGES = int(os.getenv("CONTEXT_HISTORY_MESSAGES", 10))
+    # 内容相似度(词项 Jaccard)超过该值的文本块视为重复
+    CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.85))
+    # 向量检索配置：先取 RETRIEVAL_FETCH_K 个候选，再用 MMR 选出 RETRIEVAL_K 个
+    RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", 8))
+    RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", 24))
+    # 关键词检索每命中一个文本块，向量检索少取一个，最少取 RETRIEVAL_MIN_K 个
+    RETRIEVAL_MIN_K = int(os.getenv("RETRIEVAL_MIN_K", 4))
+    # MMR 相关性与多样性的权衡，1 为只看相关性
+    RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", 0.5))
+    # BM25 关键词检索取回的文本块数量，与向量检索结果按倒数排名融合
+    LEXICAL_K = int(os.getenv("LEXICAL_K", 8))
+
+    # 回答缓存：上下文相同且问题相似度超过阈值时直接返回缓存的回答
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+    # 缓存条目的有效秒数和最大条目数
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+
+    # 流式输出合并窗口：相邻 token 合并后再发送，间隔毫秒数或累计字符数先到者触发，0 为逐 token 发送
+    STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", 30))
+    STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", 64))
+
+    # 性能指标：记录各阶段耗时、token 数和缓存命中率
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    # 是否在 Chainlit 服务上提供 /metrics 接口；设置了令牌时需带 Authorization: Bearer <令牌>，否则只允许本机访问
+    METRICS_ENDPOINT_ENABLED = os.getenv("METRICS_ENDPOINT_ENABLED", "false").lower() == "true"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+    # 指标快照文件(JSON 行)，为空时不写文件；写入间隔秒数
+    METRICS_EXPORT_FILE = os.getenv("METRICS_EXPORT_FILE", "")
+    METRICS_EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", 60))
+
     # 文件上传路径
     UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "./data/uploads")
 
+    # 网页下载配置：缓存目录、单个网页或文件的大小上限(MB)、每次读取和整个下载的超时秒数、缓存目录容量上限(MB)
+    URL_CACHE_DIR = os.getenv("URL_CACHE_DIR", "./data/url_cache")
+    URL_MAX_MB = int(os.getenv("URL_MAX_MB", 20))
+    URL_FETCH_TIMEOUT = float(os.getenv("URL_FETCH_TIMEOUT", 15))
+    URL_FETCH_TOTAL_TIMEOUT = float(os.getenv("URL_FETCH_TOTAL_TIMEOUT", 60))
+    URL_CACHE_MAX_MB = int(os.getenv("URL_CACHE_MAX_MB", 512))
+
     # 向量存储路径
     VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./data/chroma_db")
+
+    # 文件和文本块内容哈希索引，用于入库去重
+    CONTENT_INDEX_DB = os.getenv("CONTENT_INDEX_DB", "./data/content_index.db")
+    # BM25 关键词索引文件
+    LEXICAL_INDEX_DB = os.getenv("LEXICAL_INDEX_DB", "./data/lexical_index.db")
+
+    # 文本块切分配置：每块的最大 token 数(不超过嵌入模型的上下文窗口)和相邻块的重叠 token 数
+    CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 512))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 64))
+    # 计算 token 数使用的 tiktoken 编码，无法加载时按字符数估算
+    CHUNK_TOKEN_ENCODING = os.getenv("CHUNK_TOKEN_ENCODING", "cl100k_base")
+
+    # 文档入库流水线配置
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+    INGEST_MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", 4))
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 32))
+    INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", 3))
+    INGEST_RETRY_BACKOFF = float(os.getenv("INGEST_RETRY_BACKOFF", 1.0))
+    # 提问时等待同一会话中正在入库的文件的最长秒数
+    INGEST_WAIT_SECONDS = float(os.getenv("INGEST_WAIT_SECONDS", 5))
+
+    # 文档解析进程池配置，进程数为 0 时在线程中解析
+    PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", 2))
+    # 单个文件解析的超时秒数
+    PARSER_TIMEOUT = float(os.getenv("PARSER_TIMEOUT", 300))
+    # 解析子进程的内存上限(MB)，0 表示不限制
+    PARSER_MAX_MEMORY_MB = int(os.getenv("PARSER_MAX_MEMORY_MB", 4096))
+    # 解析子进程处理多少个文件后重启
+    PARSER_MAX_TASKS_PER_CHILD = int(os.getenv("PARSER_MAX_TASKS_PER_CHILD", 20))
     
     # 用户会话文件
     USER_SESSIONS_FILE = os.getenv("USER_SESSIONS_FILE", "./data/user_session.json")
-    
+
+    # 数据层存储后端: json 或 sqlite
+    DATA_LAYER_BACKEND = os.getenv("DATA_LAYER_BACKEND", "json").lower()
+    # sqlite 后端的数据库文件
+    USER_SESSIONS_DB = os.getenv("USER_SESSIONS_DB", "./data/user_session.db")
+    # json 后端的写回策略：最多间隔多少毫秒或累计多少次修改写回一次文件
+    JSON_FLUSH_INTERVAL_MS = int(os.getenv("JSON_FLUSH_INTERVAL_MS", 500))
+    JSON_FLUSH_MAX_MUTATIONS = int(os.getenv("JSON_FLUSH_MAX_MUTATIONS", 50))
+
+    # 聊天记录存储文件
+    CHAT_HISTORY_DB = os.getenv("CHAT_HISTORY_DB", "./data/chat_history.db")
+    # 是否在后台把聊天消息写入向量存储，用于语义检索历史消息
+    INDEX_CHAT_HISTORY = os.getenv("INDEX_CHAT_HISTORY", "false").lower() == "true"
+
+    # 单个搜索工具调用的超时秒数
+    TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", 15))
+    # 搜索工具结果缓存：相同查询在有效期内直接复用结果
+    TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+    TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", 600))
+    TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", 512))
+
+    # 后台任务(标题生成等)的并发数和队列长度
+    BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", 2))
+    BACKGROUND_QUEUE_SIZE = int(os.getenv("BACKGROUND_QUEUE_SIZE", 256))
+    # 第几条用户消息后生成会话标题
+    TITLE_AFTER_MESSAGES = int(os.getenv("TITLE_AFTER_MESSAGES", 3))
+
     # Tavily API密钥
     TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", None)
 
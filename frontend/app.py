@@ -1,17 +1,22 @@
+import asyncio
 import os
 import sys
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import chainlit as cl
+from chainlit.input_widget import Switch
 from chainlit.types import ThreadDict
 from dotenv import load_dotenv
-from backend.qa_chain import create_conv_summary_chain
 from config import config
 from typing import Optional
 import chainlit.data as cl_data
+from chainlit.server import app
+from fastapi import HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from backend.metrics import metrics, scrape_allowed
 from frontend.data_layer import AI4FSDataLayer
-from frontend.msg_handle import MessageProcessor, init_everything
+from frontend.msg_handle import GlobalComponents, MessageProcessor, init_everything
 
 
 # 加载环境变量
@@ -21,15 +26,43 @@ llm, chat_history = init_everything()
 # 设置自定义数据层
 cl_data._data_layer = AI4FSDataLayer()
 
+if metrics.enabled and config.METRICS_ENDPOINT_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint(request: Request):
+        """Prometheus 文本格式的性能指标"""
+        client_host = request.client.host if request.client else None
+        if not scrape_allowed(request.headers.get("authorization"), client_host, config.METRICS_TOKEN):
+            raise HTTPException(status_code=401)
+        return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    # Chainlit 注册了匹配所有路径的前端页面路由，按路径找到 /metrics 移到最前面
+    metrics_route = next(route for route in app.router.routes if getattr(route, "path", None) == "/metrics")
+    app.router.routes.remove(metrics_route)
+    app.router.routes.insert(0, metrics_route)
+
 first_msg = True
-title_generated = False
+
+
+async def generate_title(conversation_id: str, thread_id: str):
+    """根据对话内容生成会话标题"""
+    conversations = await asyncio.to_thread(chat_history.generate_conv_summary, conversation_id)
+    conv_summary_chain = GlobalComponents.chains.get("conv_summary")
+    if conv_summary_chain is None:
+        print("conv_summary_chain is None")
+        return
+    title = await conv_summary_chain.ainvoke({"chat_history": conversations})
+    await cl_data._data_layer.update_thread(thread_id, name=title)
+    # 标题写入后才记为已生成，任务被丢弃或失败时下一条消息会重新提交
+    await asyncio.to_thread(chat_history.save_title, conversation_id, title)
 
 @cl.on_chat_start
 async def start():
     try:       
         # 如果没有会话或会话已过期，创建新会话，采用cl.context.session.thread_id作为thread的key
         await cl.Message(content="正在开启新的会话...").send()
-        await cl.ChatSettings(defaults={"model": config.CUSTOM_MODEL_NAME}).send()
+        await cl.ChatSettings([
+            Switch(id="bypass_answer_cache", label="不使用缓存的回答", initial=False)
+        ]).send()
         
     except Exception as e:
         print(f"初始化会话时出错: {str(e)}")
@@ -55,19 +88,16 @@ async def main(message: cl.Message):
             content=full_response
         )
         
-        global title_generated
-        # 如果还没有生成标题，则生成标题
-        if not title_generated:
-            message_history = chat_history.get_conversation_history(conversation_id)
-            if len([msg for msg in message_history if msg["role"] == "user"]) >= 3:
-                conversations = chat_history.generate_conv_summary(conversation_id)
-                conv_summary_chain = create_conv_summary_chain(llm)
-                if conv_summary_chain is not None:
-                    title = conv_summary_chain.invoke({"chat_history": conversations})
-                    await cl_data._data_layer.update_thread(message.thread_id, name=title)
-                    title_generated = True
-                else:
-                    print("conv_summary_chain is None")
+        # 第 TITLE_AFTER_MESSAGES 条用户消息起在后台生成标题，不阻塞回复；
+        # 同一会话的任务按 key 去重，生成成功前每条消息都会尝试提交
+        if (
+            chat_history.count_user_messages(conversation_id) >= config.TITLE_AFTER_MESSAGES
+            and not chat_history.has_title(conversation_id)
+        ):
+            GlobalComponents.scheduler.submit(
+                f"title:{conversation_id}",
+                lambda: generate_title(conversation_id, message.thread_id)
+            )
             
     except Exception as e:
         print(f"on message error: {str(e)}")
@@ -80,6 +110,11 @@ async def on_chat_resume(thread: ThreadDict):
     print(f"resume {thread['id']}")
 
 
+@cl.on_app_shutdown
+async def shutdown():
+    await GlobalComponents.shutdown()
+
+
 @cl.password_auth_callback
 def auth_callback(username: str, password: str) -> Optional[cl.User]:
     if (username, password) == ("admin", "admin"):
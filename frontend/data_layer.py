@@ -1,72 +1,25 @@
 import chainlit.data as cl_data
 from typing import Dict, List, Optional, Any
-import json
 from chainlit.types import ThreadDict, Feedback, PageInfo
 from chainlit.user import UserDict, PersistedUser
 from chainlit.element import ElementDict
 from chainlit.step import StepDict
 from chainlit.data.base import Pagination, ThreadFilter, PaginatedResponse
 from chainlit.data.utils import queue_until_user_message
-from pathlib import Path
-from datetime import datetime, timezone
 from config import config
-
-# 打印调试信息的开关
-DEBUG_MODE = False
-
-# 添加获取UTC时间的函数
-def utc_now() -> str:
-    """获取当前UTC时间并格式化为ISO格式字符串"""
-    return datetime.now(timezone.utc).isoformat()
-
-def debug_log(message: str) -> None:
-    """调试日志打印函数"""
-    if DEBUG_MODE:
-        print(f"[DEBUG] {message}")
+from backend.metrics import metrics
+from frontend.storage import BaseStorage, create_storage
+from frontend.storage.base import ThreadQuery, debug_log, utc_now
 
 class AI4FSDataLayer(cl_data.BaseDataLayer):
-    def __init__(self):
+    def __init__(self, storage: Optional[BaseStorage] = None):
         debug_log("初始化 AI4FSDataLayer")
-        # 设置数据存储文件路径
-        self.data_file = Path(config.USER_SESSIONS_FILE)
-        self.data_file.parent.mkdir(parents=True, exist_ok=True)
-        if not self.data_file.exists():
-            self._init_data_file()
-    
-    def _init_data_file(self):
-        debug_log("初始化数据文件结构")
-        # 初始化数据文件结构
-        initial_data = {
-            "users": {},
-            "threads": {},
-            "delete_threads": []
-        }
-        self._save_data(initial_data)
-    
-    def _load_data(self):
-        debug_log(f"加载数据文件: {self.data_file}")
-        # 读取数据文件
-        if not self.data_file.exists():
-            debug_log("数据文件不存在,创建新文件")
-            return self._init_data_file()
-        try:
-            with open(self.data_file, 'r') as f:
-                data = json.load(f)
-                debug_log("数据文件加载成功")
-                return data
-        except:
-            debug_log("数据文件加载失败,重新初始化")
-            return self._init_data_file()
-    
-    def _save_data(self, data):
-        # 保存数据到文件
-        with open(self.data_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        # 存储后端可插拔，默认按配置选择 JSON 文件或 SQLite
+        self.storage = storage or create_storage(config)
 
     async def get_user(self, identifier: str) -> Optional[PersistedUser]:
         debug_log(f"获取用户信息: {identifier}")
-        data = self._load_data()
-        user = data["users"].get(identifier)
+        user = self.storage.get_user(identifier)
         if user:
             debug_log("用户存在,返回用户信息")
             return PersistedUser(
@@ -79,7 +32,6 @@ class AI4FSDataLayer(cl_data.BaseDataLayer):
         return None
 
     async def create_user(self, user: UserDict) -> Optional[PersistedUser]:
-        data = self._load_data()
         current_time = utc_now()
         
         persisted_user = PersistedUser(
@@ -89,31 +41,20 @@ class AI4FSDataLayer(cl_data.BaseDataLayer):
             createdAt=current_time
         )
         
-        data["users"][user.identifier] = {
+        self.storage.create_user({
             "id": user.identifier,
             "identifier": user.identifier,
             "metadata": user.metadata,
             "createdAt": current_time
-        }
-        self._save_data(data)
+        })
         return persisted_user
 
     async def delete_thread(self, thread_id: str) -> None:
-        data = self._load_data()
-        thread = data["threads"].pop(thread_id, None)
-        debug_log(f"test delete_thread {thread}")
-        data["delete_threads"].append(thread_id)
-        self._save_data(data)
+        debug_log(f"删除对话: {thread_id}")
+        self.storage.delete_thread(thread_id)
         
     async def get_thread(self, thread_id: str) -> Optional[ThreadDict]:
-        data = self._load_data()
-        thread = data["threads"].get(thread_id) or None
-        if not thread:
-            return None
-        
-        steps = thread.get("steps", [])
-        thread['steps'] = sorted(steps, key=lambda x: x['createdAt'])
-        return thread
+        return self.storage.get_thread(thread_id)
         
     async def update_thread(
         self,
@@ -124,20 +65,18 @@ class AI4FSDataLayer(cl_data.BaseDataLayer):
         tags: Optional[List[str]] = None
     ) -> None:
         debug_log(f"更新对话: {thread_id}")
-        data = self._load_data()
         
         # 检查是否在已删除列表中
-        if thread_id in data["delete_threads"]:
+        if self.storage.is_thread_deleted(thread_id):
             debug_log(f"对话 {thread_id} 已被删除")
             return None
             
         # 注意：userIdentity必须是登录账户，且必须设置，否则不能从历史聊天记录中恢复继续聊天
-        admin_user = list(data["users"].values())[0]
-        thread = data["threads"].setdefault(thread_id, {
+        defaults = {
             "id": thread_id,
             "createdAt": utc_now(),
-            "userIdentifier": admin_user.get("identifier")
-        })
+            "userIdentifier": self.storage.get_default_user_identifier()
+        }
         
         updates = {
             "name": name,
@@ -147,22 +86,21 @@ class AI4FSDataLayer(cl_data.BaseDataLayer):
         }
         
         # 只更新非None的值
-        thread.update({k: v for k, v in updates.items() if v is not None})
-        
-        self._save_data(data)
+        with metrics.span("data_layer_write", op="update_thread"):
+            self.storage.upsert_thread(
+                thread_id,
+                defaults,
+                {k: v for k, v in updates.items() if v is not None}
+            )
         debug_log("对话更新完成")
 
     @cl_data.queue_until_user_message()
     async def create_step(self, step: StepDict) -> None:
-        datas = self._load_data()
-        thread = datas["threads"].get(step["threadId"]) or None
-        
-        if not thread:
+        with metrics.span("data_layer_write", op="create_step"):
+            created = self.storage.create_step(step)
+        if not created:
             debug_log(f"create_step: thread {step['threadId']} 不存在")
-            return None
-        
-        thread.setdefault("steps", []).append(step)
-        self._save_data(datas)
+        return None
     
     @queue_until_user_message()
     async def delete_step(self, step_id: str) -> None:
@@ -180,55 +118,29 @@ class AI4FSDataLayer(cl_data.BaseDataLayer):
         pass
         
     async def get_thread_author(self, thread_id: str) -> Optional[str]:
-        data = self._load_data()
-        thread = data["threads"].get(thread_id) or {}
-        return thread.get("userIdentifier") if thread else None
+        return self.storage.get_thread_author(thread_id)
         
     async def list_threads(
         self,
         pagination: Pagination,
         thread_filter: Optional[ThreadFilter] = None
     ) -> PaginatedResponse[ThreadDict]:
-        data = self._load_data()
-        
-        threads = data.get("threads") or None
-        if not threads:
-            return PaginatedResponse(
-                data=[],
-                pageInfo=PageInfo(
-                    hasNextPage=False,
-                    startCursor=None,
-                    endCursor=None
-                )
-            )
-
-        threads_list = list(threads.values())
-        # 获取分页参数
-        page_size = pagination.first
-        current_cursor = pagination.cursor 
-        # 如果有游标，找到开始位置
-        start = 0
-        if current_cursor:
-            try:
-                start = int(current_cursor) + 1  # 从游标的下一个位置开始
-            except ValueError:
-                start = 0
-        # 计算结束位置
-        end = start + page_size
-        # 获取当前页的数据
-        paginated_threads = threads_list[start:end]
-        # 判断是否还有下一页
-        has_next = len(threads_list) > end
-        # 设置游标信息
-        start_cursor = str(start) if paginated_threads else None
-        end_cursor = str(end - 1) if paginated_threads else None
+        # 游标为上一页最后一条对话的 (最近活动时间, 对话ID)，对话增删不会导致翻页错位
+        query = ThreadQuery(
+            limit=pagination.first,
+            cursor=pagination.cursor,
+            user_identifier=thread_filter.userId if thread_filter else None,
+            search=thread_filter.search if thread_filter else None,
+            feedback=thread_filter.feedback if thread_filter else None
+        )
+        page = self.storage.list_threads(query)
         
         return PaginatedResponse(
-            data=paginated_threads,
+            data=page.threads,
             pageInfo=PageInfo(
-                hasNextPage=has_next,
-                startCursor=start_cursor,
-                endCursor=end_cursor
+                hasNextPage=page.has_next,
+                startCursor=page.start_cursor,
+                endCursor=page.end_cursor
             )
         )
     
@@ -237,33 +149,17 @@ class AI4FSDataLayer(cl_data.BaseDataLayer):
         step_id = step.get("id")
         thread_id = step.get("threadId")
         
-        data = self._load_data()
-        # 使用链式获取,简化多层判断
-        thread = data.get("threads", {}).get(thread_id)
-        if not thread:
-            debug_log("test update_step: thread不存在")
-            return None
-        
-        steps = thread.get("steps", [])
-        if not steps:
-            debug_log("test update_step: steps不存在")
-            return None
-            
-        target_step = next((step for step in steps if step["id"] == step_id), None)
-        if not target_step:
-            return None
-
         # 使用step更新target_step，重点是要更新input或output
-        target_step.update({
-            "input": step.get("input"),
-            "output": step.get("output"),
-            "metadata": step.get("metadata"),
-            "feedback": step.get("feedback"),
-            "start_time": step.get("start_time"),
-            "end_time": step.get("end_time"),
-            "error": step.get("error")
-        })
-        self._save_data(data)
+        with metrics.span("data_layer_write", op="update_step"):
+            self.storage.update_step(thread_id, step_id, {
+                "input": step.get("input"),
+                "output": step.get("output"),
+                "metadata": step.get("metadata"),
+                "feedback": step.get("feedback"),
+                "start_time": step.get("start_time"),
+                "end_time": step.get("end_time"),
+                "error": step.get("error")
+            })
         return None
 
     async def upsert_feedback(self, feedback: Feedback) -> None:
@@ -272,5 +168,13 @@ class AI4FSDataLayer(cl_data.BaseDataLayer):
     async def delete_feedback(self, message_id: str) -> None:
         pass
 
+    async def get_favorite_steps(self, user_id: str) -> List[StepDict]:
+        # 不支持收藏消息
+        return []
+
+    async def close(self) -> None:
+        # 关闭时写回存储后端中尚未落盘的数据
+        self.storage.close()
+
     async def build_debug_url(self, conversation_id: str) -> str:
         return f"/debug/{conversation_id}"
@@ -1,66 +1,224 @@
 import chainlit as cl
 from typing import Optional, Tuple
-from backend.qa_chain import create_qa_chain, create_chat_chain
-from backend.document_loader import process_uploaded_file
+from backend.chain_registry import ChainRegistry
+from backend.tool_cache import ToolResultCache
+from backend.task_scheduler import TaskScheduler
+from backend.document_loader import process_uploaded_file, process_web_page
 from config import config
 from backend.chat_history import ChatHistoryManager
-from backend.llm_setup import init_embeddings, init_vector_store, init_llm
+from backend.transcript_store import TranscriptStore
+from backend.ingestion import IngestionPipeline
+from backend.content_index import ContentIndex
+from backend.parser_pool import ParserPool
+from backend.context_builder import ContextBuilder
+from backend.lexical_index import LexicalIndex
+from backend.url_fetcher import FetchResult, URLFetcher
+from backend.llm_setup import init_embeddings, init_vector_store, init_http_clients, model_fingerprint
+from backend.answer_cache import AnswerCache, chat_context_key, context_key, replay_chain
+from backend.stream_coalescer import StreamStats, TokenCoalescer
+from backend.metrics import SIZE_BUCKETS, metrics
 import re
-import requests
-from bs4 import BeautifulSoup
-import tempfile
-import os
+import asyncio
+import threading
+
+# 后台任务的引用，防止任务在结束前被回收
+_background_tasks = set()
+
+# 所有会话的流式输出统计
+stream_stats = StreamStats()
+
+# 以这些内容开头的回答是出错提示，不写入回答缓存
+_UNCACHEABLE_PREFIXES = ("处理您的问题时出错", "抱歉，搜索服务暂时不可用", "抱歉，所有搜索服务都暂时不可用")
+
+def start_background_task(coro):
+    """启动后台任务并保留引用，直到任务结束"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
 
 # 全局变量
 class GlobalComponents:
+    http_client = None
+    http_async_client = None
+    chains = None
     embeddings = None
     vector_store = None
     llm = None
     chat_history = None
+    ingestion = None
+    parser_pool = None
+    context_builder = None
+    answer_cache = None
+    url_fetcher = None
+    scheduler = None
 
     @classmethod
     def init(cls):
         """初始化所有全局组件"""
-        cls.embeddings = init_embeddings()
+        # 大模型和嵌入模型接口共用同一组 HTTP 连接池
+        http = init_http_clients()
+        cls.http_client, cls.http_async_client = http.client, http.async_client
+        cls.embeddings = init_embeddings(http)
         cls.vector_store = init_vector_store(cls.embeddings)
-        cls.llm = init_llm()
-        cls.chat_history = ChatHistoryManager(cls.vector_store)
+        lexical_index = LexicalIndex(config.LEXICAL_INDEX_DB)
+        if lexical_index.is_empty():
+            # 为升级前入库的文件建立关键词索引，在后台进行不影响启动
+            threading.Thread(
+                target=cls._rebuild_lexical_index, args=(lexical_index,), daemon=True
+            ).start()
+        cls.ingestion = IngestionPipeline(
+            cls.vector_store,
+            cls.embeddings,
+            batch_size=config.INGEST_BATCH_SIZE,
+            max_in_flight=config.INGEST_MAX_IN_FLIGHT,
+            queue_size=config.INGEST_QUEUE_SIZE,
+            max_retries=config.INGEST_MAX_RETRIES,
+            retry_backoff=config.INGEST_RETRY_BACKOFF,
+            content_index=ContentIndex(config.CONTENT_INDEX_DB),
+            lexical_index=lexical_index
+        )
+        cls.parser_pool = ParserPool(
+            workers=config.PARSER_WORKERS,
+            timeout=config.PARSER_TIMEOUT,
+            memory_limit_mb=config.PARSER_MAX_MEMORY_MB,
+            max_tasks_per_child=config.PARSER_MAX_TASKS_PER_CHILD
+        )
+        cls.context_builder = ContextBuilder(
+            cls.vector_store,
+            token_budget=config.CONTEXT_TOKEN_BUDGET,
+            history_tokens=config.CONTEXT_HISTORY_TOKENS,
+            k=config.RETRIEVAL_K,
+            fetch_k=config.RETRIEVAL_FETCH_K,
+            min_k=config.RETRIEVAL_MIN_K,
+            lambda_mult=config.RETRIEVAL_MMR_LAMBDA,
+            dedup_threshold=config.CONTEXT_DEDUP_THRESHOLD,
+            lexical_index=lexical_index,
+            lexical_k=config.LEXICAL_K
+        )
+        if config.ANSWER_CACHE_ENABLED:
+            cls.answer_cache = AnswerCache(
+                cls.embeddings,
+                threshold=config.ANSWER_CACHE_THRESHOLD,
+                ttl_seconds=config.ANSWER_CACHE_TTL,
+                max_entries=config.ANSWER_CACHE_MAX_ENTRIES
+            )
+        tool_cache = None
+        if config.TOOL_CACHE_ENABLED:
+            tool_cache = ToolResultCache(
+                ttl_seconds=config.TOOL_CACHE_TTL,
+                max_entries=config.TOOL_CACHE_MAX_ENTRIES
+            )
+        cls.chains = ChainRegistry(cls.http_client, cls.http_async_client, tool_cache)
+        cls.llm = cls.chains.get_llm()
+        cls.url_fetcher = URLFetcher(
+            config.URL_CACHE_DIR,
+            max_bytes=config.URL_MAX_MB * 1024 * 1024,
+            timeout=config.URL_FETCH_TIMEOUT,
+            total_timeout=config.URL_FETCH_TOTAL_TIMEOUT,
+            cache_max_bytes=config.URL_CACHE_MAX_MB * 1024 * 1024
+        )
+        cls.scheduler = TaskScheduler(
+            max_workers=config.BACKGROUND_WORKERS,
+            max_pending=config.BACKGROUND_QUEUE_SIZE
+        )
+        cls.chat_history = ChatHistoryManager(
+            cls.vector_store,
+            TranscriptStore(config.CHAT_HISTORY_DB),
+            index_messages=config.INDEX_CHAT_HISTORY
+        )
+        cls._register_metrics(tool_cache)
         return cls.llm, cls.chat_history
 
+    @classmethod
+    def _register_metrics(cls, tool_cache):
+        """把各缓存和队列的 stats() 登记为指标"""
+        if not metrics.enabled:
+            return
+        metrics.register_gauges("stream", stream_stats.stats)
+        metrics.register_gauges("scheduler", cls.scheduler.stats)
+        if cls.answer_cache is not None:
+            metrics.register_gauges("answer_cache", cls.answer_cache.stats)
+        if tool_cache is not None:
+            metrics.register_gauges("tool_cache", tool_cache.stats)
+        if hasattr(cls.embeddings, "stats"):
+            metrics.register_gauges("embedding_cache", cls.embeddings.stats)
+        if config.METRICS_EXPORT_FILE:
+            metrics.start_file_exporter(config.METRICS_EXPORT_FILE, config.METRICS_EXPORT_INTERVAL)
+
+    @classmethod
+    async def shutdown(cls):
+        """应用退出时关闭后台任务、解析进程和网络连接"""
+        if cls.scheduler is not None:
+            await cls.scheduler.close()
+        if cls.parser_pool is not None:
+            await asyncio.to_thread(cls.parser_pool.close)
+        if cls.url_fetcher is not None:
+            await cls.url_fetcher.aclose()
+        if hasattr(cls.embeddings, "store"):
+            # 写回尚未落盘的缓存访问时间
+            await asyncio.to_thread(cls.embeddings.store.close)
+        if cls.http_async_client is not None:
+            await cls.http_async_client.aclose()
+        if cls.http_client is not None:
+            cls.http_client.close()
+
+    @classmethod
+    def _rebuild_lexical_index(cls, lexical_index):
+        try:
+            count = lexical_index.rebuild_from(cls.vector_store)
+            if count:
+                print(f"VectorDB: lexical index rebuilt from {count} existing chunks")
+        except Exception as e:
+            print(f"VectorDB: lexical index rebuild failed: {str(e)}")
+
 class MessageProcessor:
     @staticmethod
     async def process_message(message: cl.Message, conversation_id: str) -> str:
         """处理用户消息的主入口"""
         if message.elements:
-            return await FileHandler.handle_file_message(message, conversation_id)
+            with metrics.span("process_message", kind="file"):
+                return await FileHandler.handle_file_message(message, conversation_id)
         
         url = URLHandler.extract_url(message.content)
         if url:
-            return await URLHandler.handle_url_message(message, conversation_id, url)
+            with metrics.span("process_message", kind="url"):
+                return await URLHandler.handle_url_message(message, conversation_id, url)
             
-        return await MessageProcessor.handle_chat_message(message, conversation_id)
+        with metrics.span("process_message", kind="chat"):
+            return await MessageProcessor.handle_chat_message(message, conversation_id)
 
     @staticmethod
     async def handle_chat_message(message: cl.Message, conversation_id: str) -> str:
         """处理普通对话消息"""
-        chain = create_chat_chain(GlobalComponents.llm)
-        chat_history_text = GlobalComponents.chat_history.get_recent_messages(conversation_id)
-        
-        text_docs = GlobalComponents.vector_store.similarity_search(
-            message.content,
-            filter={"conversation_id": conversation_id},
-            k=5
+        chain = GlobalComponents.chains.get("chat")
+        # 同一会话中刚上传的文件可能还在建立索引，短暂等待以免检索不到
+        if not await GlobalComponents.ingestion.jobs.wait_for_conversation(
+            conversation_id, timeout=config.INGEST_WAIT_SECONDS
+        ):
+            print(f"VectorDB: conversation {conversation_id} still indexing, searching partial index")
+        with metrics.span("history_fetch"):
+            history_lines = GlobalComponents.chat_history.get_recent_lines(
+                conversation_id, limit=config.CONTEXT_HISTORY_MESSAGES + 1
+            )
+        # 当前问题在处理前已保存，位于历史末尾；提示词中单独给出问题，不再重复
+        if history_lines and history_lines[-1] == f"用户: {message.content}":
+            history_lines.pop()
+        # 在 token 预算内组装对话历史和检索到的文件内容
+        context = await GlobalComponents.context_builder.abuild(
+            message.content, conversation_id, history_lines
         )
-        knowledge_text = "\n".join([doc.page_content for doc in text_docs]) if text_docs else ""
         
         inputs = {
             "inputs": {
-                "question": message.content,
-                "chat_history": chat_history_text,
-                "knowledge_text": knowledge_text,
+                "question": context.question,
+                "chat_history": context.chat_history,
+                "knowledge_text": context.knowledge_text,
             }
         }
-        return await StreamHandler.stream_response(chain, inputs)
+        # 只缓存基于文件内容的回答，相同内容上的相同问题跨轮次、跨会话共享
+        cache_context = chat_context_key(model_fingerprint(), context.knowledge_text)
+        return await StreamHandler.stream_cached_response(chain, inputs, cache_context, name="chat")
 
 class FileHandler:
     @staticmethod
@@ -71,9 +229,10 @@ class FileHandler:
             if isinstance(element, cl.File):
                 success, msg, file_text = await process_uploaded_file(
                     element, 
-                    GlobalComponents.vector_store,
+                    GlobalComponents.ingestion,
                     config,
-                    conversation_id
+                    conversation_id,
+                    GlobalComponents.parser_pool
                 )
                 await cl.Message(content=msg).send()
                 if success:
@@ -82,15 +241,44 @@ class FileHandler:
         
         if not result_text:
             return "文件处理失败"
+        
+        start_background_task(FileHandler.report_index_progress(conversation_id))
             
-        chain = create_qa_chain(GlobalComponents.llm)
+        chain = GlobalComponents.chains.get("qa")
         inputs = {
             "inputs": {
                 "question": message.content,
-                "context": result_text[:28672]
+                "context": result_text[:config.QA_CONTEXT_CHARS]
             }
         } 
-        return await StreamHandler.stream_response(chain, inputs)
+        cache_context = context_key("qa", model_fingerprint(), inputs["inputs"]["context"])
+        return await StreamHandler.stream_cached_response(chain, inputs, cache_context, name="qa")
+
+    @staticmethod
+    async def report_index_progress(conversation_id: str, interval: float = 1.0):
+        """在界面上显示会话中文件的索引进度，直到全部完成"""
+        jobs = GlobalComponents.ingestion.jobs.for_conversation(conversation_id, active_only=True)
+        if not jobs:
+            return
+        
+        progress_msg = cl.Message(content=FileHandler._format_progress(jobs))
+        await progress_msg.send()
+        while not all(job.finished for job in jobs):
+            await asyncio.sleep(interval)
+            progress_msg.content = FileHandler._format_progress(jobs)
+            await progress_msg.update()
+
+    @staticmethod
+    def _format_progress(jobs) -> str:
+        lines = []
+        for job in jobs:
+            if job.state == job.DONE:
+                lines.append(f"✅ {job.file_name} 索引完成（{job.total_chunks} 个文本块）")
+            elif job.state == job.FAILED:
+                lines.append(f"❌ {job.file_name} 索引失败：{str(job.error)}")
+            else:
+                lines.append(f"⏳ {job.file_name} 正在建立索引：{job.progress()}")
+        return "\n".join(lines)
 
 class URLHandler:
     @staticmethod
@@ -107,24 +295,22 @@ class URLHandler:
         await status_msg.send()
         
         try:
-            if url.lower().endswith('.pdf'):
-                url_content = await URLHandler._handle_pdf_url(url, conversation_id)
-            else:
-                url_content = await URLHandler._fetch_url_content(url)
+            url_content = await URLHandler._fetch_url_content(url, conversation_id)
                 
             if isinstance(url_content, str) and url_content.startswith("获取URL内容时出错"):
                 status_msg.content = url_content
                 await status_msg.update()
                 return await MessageProcessor.handle_chat_message(message, conversation_id)
                 
-            chain = create_qa_chain(GlobalComponents.llm)
+            chain = GlobalComponents.chains.get("qa")
             inputs = {
                 "inputs": {
                     "question": message.content,
-                    "context": url_content[:28672]
+                    "context": url_content[:config.QA_CONTEXT_CHARS]
                 }
             }
-            return await StreamHandler.stream_response(chain, inputs)
+            cache_context = context_key("qa", model_fingerprint(), inputs["inputs"]["context"])
+            return await StreamHandler.stream_cached_response(chain, inputs, cache_context, name="qa")
             
         except Exception as e:
             status_msg.content = f"处理URL时出错: {str(e)}"
@@ -132,63 +318,97 @@ class URLHandler:
             return await MessageProcessor.handle_chat_message(message, conversation_id)
 
     @staticmethod
-    async def _handle_pdf_url(url: str, conversation_id: str) -> str:
-        """处理PDF URL"""
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-            temp_file.write(response.content)
-            temp_path = temp_file.name
-            
-        try:
-            success, _, content = await process_uploaded_file(
-                cl.File(name=os.path.basename(url), path=temp_path),
-                GlobalComponents.vector_store,
-                config,
-                conversation_id
-            )
-            return content if success else "PDF处理失败"
-        finally:
-            os.unlink(temp_path)
+    async def _handle_pdf_url(result: FetchResult, conversation_id: str) -> str:
+        """处理PDF URL，下载的文件按上传文件的流程解析和入库"""
+        success, _, content = await process_uploaded_file(
+            cl.File(name=result.file_name, path=result.path),
+            GlobalComponents.ingestion,
+            config,
+            conversation_id,
+            GlobalComponents.parser_pool
+        )
+        return content if success else "PDF处理失败"
 
     @staticmethod
-    async def _fetch_url_content(url: str) -> str:
-        """获取URL内容"""
+    async def _fetch_url_content(url: str, conversation_id: str) -> str:
+        """获取URL内容，按实际内容类型而不是URL后缀区分PDF和网页"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            for script in soup(["script", "style"]):
-                script.decompose()
-                
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            return ' '.join(chunk for chunk in chunks if chunk)
+            with metrics.span("url_fetch"):
+                result = await GlobalComponents.url_fetcher.fetch(url)
+            if result.kind == "pdf":
+                content = await URLHandler._handle_pdf_url(result, conversation_id)
+            else:
+                # 网页正文按小节切分入库，后续对话可以检索到
+                success, msg, content = await process_web_page(
+                    result, GlobalComponents.ingestion, conversation_id
+                )
+                if not success:
+                    return f"获取URL内容时出错: {msg}"
+            start_background_task(FileHandler.report_index_progress(conversation_id))
+            return content
             
         except Exception as e:
             return f"获取URL内容时出错: {str(e)}"
 
 class StreamHandler:
     @staticmethod
-    async def stream_response(chain, inputs: dict) -> str:
-        """统一处理流式响应"""
+    async def stream_response(chain, inputs: dict, name: str = "chat") -> str:
+        """统一处理流式响应，name 为指标中区分链的标签"""
         msg = cl.Message(content="")
         await msg.send()
         
-        full_response = ""
-        async for chunk in chain(**inputs):
-            await msg.stream_token(chunk)
-            full_response += chunk
+        # 合并相邻 token 再发送，减少 websocket 帧数；首个 token 立即发送
+        coalescer = TokenCoalescer(
+            chain(**inputs),
+            window=config.STREAM_FLUSH_MS / 1000,
+            max_chars=config.STREAM_FLUSH_CHARS
+        )
+        parts = []
+        async for frame in coalescer:
+            await msg.stream_token(frame)
+            parts.append(frame)
+        full_response = "".join(parts)
             
         msg.content = full_response
         await msg.update()
         
+        seconds = coalescer.seconds
+        stream_stats.record(coalescer.token_count, coalescer.frame_count, coalescer.byte_count, seconds)
+        if coalescer.first_frame_at is not None:
+            metrics.observe("llm_ttft_seconds", coalescer.first_frame_at - coalescer.started, chain=name)
+        metrics.observe("llm_seconds", seconds, chain=name)
+        metrics.observe("llm_output_tokens", coalescer.token_count, buckets=SIZE_BUCKETS, chain=name)
+        metrics.inc("llm_output_tokens_total", coalescer.token_count, chain=name)
+        print(
+            f"Stream: {coalescer.token_count} tokens in {coalescer.frame_count} frames, "
+            f"{coalescer.byte_count} bytes in {seconds:.2f}s"
+        )
+        return full_response
+
+    @staticmethod
+    async def stream_cached_response(chain, inputs: dict, cache_context: Optional[str], name: str = "chat") -> str:
+        """
+        相同上下文中问过相似的问题时按流式回放缓存的回答，否则调用 chain 并缓存回答。
+
+        cache_context 为上下文哈希，为 None 时不使用缓存；会话设置中开启 bypass_answer_cache
+        时也不使用缓存。回答过程中调用了工具(chain 在 inputs 中设置 tools_used)时不缓存。
+        """
+        cache = GlobalComponents.answer_cache
+        settings = cl.user_session.get("chat_settings") or {}
+        if cache is None or cache_context is None or settings.get("bypass_answer_cache"):
+            return await StreamHandler.stream_response(chain, inputs, name)
+        
+        question = inputs["inputs"]["question"]
+        answer = await cache.alookup(question, cache_context)
+        if answer is not None:
+            print(f"AnswerCache: hit, replaying {len(answer)} chars")
+            return await StreamHandler.stream_response(lambda **_: replay_chain(answer), inputs, "answer_cache")
+        
+        full_response = await StreamHandler.stream_response(chain, inputs, name)
+        if inputs["inputs"].get("tools_used"):
+            print(f"AnswerCache: answer used {inputs['inputs']['tools_used']}, not caching")
+        elif full_response and not full_response.startswith(_UNCACHEABLE_PREFIXES):
+            await cache.astore(question, cache_context, full_response)
         return full_response
 
 # 导出初始化函数
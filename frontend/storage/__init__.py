@@ -0,0 +1,19 @@
+from frontend.storage.base import BaseStorage
+from frontend.storage.json_storage import JSONStorage
+from frontend.storage.sqlite_storage import SQLiteStorage
+
+
+def create_storage(config) -> BaseStorage:
+    """根据配置创建数据层存储后端"""
+    if config.DATA_LAYER_BACKEND == "sqlite":
+        return SQLiteStorage(config.USER_SESSIONS_DB)
+    if config.DATA_LAYER_BACKEND == "json":
+        return JSONStorage(
+            config.USER_SESSIONS_FILE,
+            flush_interval_ms=config.JSON_FLUSH_INTERVAL_MS,
+            flush_max_mutations=config.JSON_FLUSH_MAX_MUTATIONS
+        )
+    raise ValueError(f"不支持的数据层存储后端: {config.DATA_LAYER_BACKEND}")
+
+
+__all__ = ["BaseStorage", "JSONStorage", "SQLiteStorage", "create_storage"]
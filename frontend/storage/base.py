@@ -0,0 +1,116 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from backend.text_utils import tokenize
+
+# 打印调试信息的开关
+DEBUG_MODE = False
+
+# 添加获取UTC时间的函数
+def utc_now() -> str:
+    """获取当前UTC时间并格式化为ISO格式字符串"""
+    return datetime.now(timezone.utc).isoformat()
+
+def debug_log(message: str) -> None:
+    """调试日志打印函数"""
+    if DEBUG_MODE:
+        print(f"[DEBUG] {message}")
+
+
+class ThreadQuery(NamedTuple):
+    """对话列表查询条件，cursor 为上一页最后一条的键集游标"""
+    limit: int
+    cursor: Optional[str] = None
+    user_identifier: Optional[str] = None
+    search: Optional[str] = None
+    feedback: Optional[int] = None
+
+
+class ThreadPage(NamedTuple):
+    """一页对话及其首尾游标"""
+    threads: List[Dict]
+    start_cursor: Optional[str]
+    end_cursor: Optional[str]
+    has_next: bool
+
+
+def encode_cursor(last_activity: str, thread_id: str) -> str:
+    """用 (最近活动时间, 对话ID) 组成键集游标，对话增删不会影响已有游标的位置"""
+    return f"{last_activity}|{thread_id}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    """解析键集游标，无法识别的游标(如旧版的整数游标)视为从头开始"""
+    if not cursor or "|" not in cursor:
+        return None
+    last_activity, thread_id = cursor.rsplit("|", 1)
+    return last_activity, thread_id
+
+
+def search_terms(*texts) -> Set[str]:
+    """提取对话名称和步骤文本中的检索词项"""
+    terms = set()
+    for text in texts:
+        if isinstance(text, str) and text:
+            terms.update(tokenize(text))
+    return terms
+
+
+def feedback_value(step: Dict) -> Optional[int]:
+    """取出步骤上的反馈值"""
+    feedback = step.get("feedback")
+    if isinstance(feedback, dict):
+        return feedback.get("value")
+    return None
+
+
+class BaseStorage(ABC):
+    """数据层存储后端接口，AI4FSDataLayer 只通过它读写用户、对话和步骤"""
+
+    @abstractmethod
+    def get_user(self, identifier: str) -> Optional[Dict]:
+        """按标识获取用户记录"""
+
+    @abstractmethod
+    def create_user(self, user: Dict) -> None:
+        """新增或覆盖用户记录"""
+
+    @abstractmethod
+    def get_default_user_identifier(self) -> Optional[str]:
+        """获取最早创建的用户标识，作为对话的默认归属"""
+
+    @abstractmethod
+    def is_thread_deleted(self, thread_id: str) -> bool:
+        """对话是否已被删除"""
+
+    @abstractmethod
+    def delete_thread(self, thread_id: str) -> None:
+        """删除对话并记录到已删除列表"""
+
+    @abstractmethod
+    def get_thread(self, thread_id: str) -> Optional[Dict]:
+        """获取对话及其按创建时间排序的步骤"""
+
+    @abstractmethod
+    def get_thread_author(self, thread_id: str) -> Optional[str]:
+        """获取对话所属的用户标识"""
+
+    @abstractmethod
+    def upsert_thread(self, thread_id: str, defaults: Dict, updates: Dict) -> None:
+        """对话不存在时用 defaults 创建，再写入 updates 中的字段"""
+
+    @abstractmethod
+    def create_step(self, step: Dict) -> bool:
+        """向对话追加步骤，对话不存在时返回 False"""
+
+    @abstractmethod
+    def update_step(self, thread_id: str, step_id: str, updates: Dict) -> bool:
+        """更新已有步骤的字段，找不到步骤时返回 False"""
+
+    @abstractmethod
+    def list_threads(self, query: ThreadQuery) -> ThreadPage:
+        """按最近活动时间倒序分页列出符合条件的对话"""
+
+    def close(self) -> None:
+        """释放底层资源"""
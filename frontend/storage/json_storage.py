@@ -0,0 +1,269 @@
+import atexit
+import json
+import os
+import threading
+from bisect import insort
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from frontend.storage.base import (
+    BaseStorage,
+    ThreadPage,
+    ThreadQuery,
+    debug_log,
+    encode_cursor,
+    feedback_value,
+    search_terms,
+)
+from frontend.storage.thread_index import ThreadIndex
+
+
+def _step_order(step: Dict) -> str:
+    return step.get("createdAt") or ""
+
+
+class JSONStorage(BaseStorage):
+    """
+    单个 JSON 文件存储。
+
+    文档只在启动时读取一次并常驻内存，修改后标记为脏数据，按时间窗口或修改次数
+    合并写回磁盘。写回先写临时文件再原子重命名，进程退出时会写回未落盘的修改。
+    对话列表的排序、检索和反馈过滤由加载时构建的 ThreadIndex 维护；每个对话的步骤
+    在插入时保持按创建时间有序，并按步骤ID建立索引，恢复和更新对话不再排序或线性查找。
+    """
+
+    def __init__(
+        self,
+        data_file: str,
+        flush_interval_ms: int = 500,
+        flush_max_mutations: int = 50
+    ):
+        # 设置数据存储文件路径
+        self.data_file = Path(data_file)
+        self.data_file.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_mutations = max(1, flush_max_mutations)
+
+        # _lock 保护内存文档，_flush_lock 保证写回按顺序进行
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._dirty_count = 0
+        self._flush_timer: Optional[threading.Timer] = None
+
+        self._data = self._load_data()
+        self._index = ThreadIndex()
+        # thread_id -> {step_id: 步骤}
+        self._steps_by_id: Dict[str, Dict[str, Dict]] = {}
+        for thread in self._data["threads"].values():
+            thread["steps"] = sorted(thread.get("steps", []), key=_step_order)
+            self._steps_by_id[thread["id"]] = {step["id"]: step for step in thread["steps"]}
+            self._index_thread(thread)
+        atexit.register(self.flush)
+
+    def _init_data_file(self):
+        debug_log("初始化数据文件结构")
+        # 初始化数据文件结构
+        initial_data = {
+            "users": {},
+            "threads": {},
+            "delete_threads": []
+        }
+        self._write_file(self._dumps(initial_data))
+        return initial_data
+
+    def _load_data(self):
+        debug_log(f"加载数据文件: {self.data_file}")
+        # 读取数据文件
+        if not self.data_file.exists():
+            debug_log("数据文件不存在,创建新文件")
+            return self._init_data_file()
+        try:
+            with open(self.data_file, 'r') as f:
+                data = json.load(f)
+                debug_log("数据文件加载成功")
+                return data
+        except (OSError, ValueError) as e:
+            # 损坏的文件另存一份再重新初始化，避免历史记录被直接覆盖
+            backup = self.data_file.with_name(
+                f"{self.data_file.name}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            )
+            os.replace(self.data_file, backup)
+            print(f"数据文件 {self.data_file} 加载失败({e})，已备份到 {backup} 并重新初始化")
+            return self._init_data_file()
+
+    def _dumps(self, data) -> str:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+    def _write_file(self, text: str):
+        # 先写临时文件并落盘，再原子替换，避免写到一半崩溃导致文件被截断
+        temp_file = self.data_file.with_name(f"{self.data_file.name}.tmp")
+        with open(temp_file, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.data_file)
+
+    def _mark_dirty(self):
+        """记录一次修改，在时间窗口结束或修改次数达到上限时由后台线程写回"""
+        self._dirty_count += 1
+        if self._dirty_count >= self.flush_max_mutations:
+            self._schedule_flush(0)
+        elif self._flush_timer is None:
+            self._schedule_flush(self.flush_interval)
+
+    def _schedule_flush(self, delay: float):
+        if self._flush_timer is not None:
+            if delay:
+                return
+            self._flush_timer.cancel()
+        self._flush_timer = threading.Timer(delay, self.flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def flush(self) -> None:
+        """将未落盘的修改写回文件"""
+        with self._flush_lock:
+            with self._lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                if not self._dirty_count:
+                    return
+                # 在锁内序列化出快照，写文件时不阻塞其他修改
+                text = self._dumps(self._data)
+                self._dirty_count = 0
+            self._write_file(text)
+            debug_log(f"数据文件已写回: {self.data_file}")
+
+    def _index_thread(self, thread: Dict):
+        thread_id = thread["id"]
+        user_identifier = thread.get("userIdentifier")
+        self._index.touch(thread_id, user_identifier, thread.get("createdAt"))
+        self._index.add_terms(thread_id, search_terms(thread.get("name")))
+        for step in thread.get("steps", []):
+            self._index_step(thread_id, user_identifier, step)
+
+    def _index_step(self, thread_id: str, user_identifier: Optional[str], step: Dict):
+        self._index.touch(thread_id, user_identifier, step.get("createdAt"))
+        self._index.add_terms(thread_id, search_terms(step.get("input"), step.get("output")))
+        self._index.set_feedback(thread_id, step["id"], feedback_value(step))
+
+    def get_user(self, identifier: str) -> Optional[Dict]:
+        with self._lock:
+            return self._data["users"].get(identifier)
+
+    def create_user(self, user: Dict) -> None:
+        with self._lock:
+            self._data["users"][user["identifier"]] = user
+            self._mark_dirty()
+
+    def get_default_user_identifier(self) -> Optional[str]:
+        with self._lock:
+            user = next(iter(self._data["users"].values()), None)
+            return user.get("identifier") if user else None
+
+    def is_thread_deleted(self, thread_id: str) -> bool:
+        with self._lock:
+            return thread_id in self._data["delete_threads"]
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            thread = self._data["threads"].pop(thread_id, None)
+            debug_log(f"test delete_thread {thread}")
+            self._index.remove(thread_id)
+            self._steps_by_id.pop(thread_id, None)
+            self._data["delete_threads"].append(thread_id)
+            self._mark_dirty()
+
+    def get_thread(self, thread_id: str) -> Optional[Dict]:
+        with self._lock:
+            thread = self._data["threads"].get(thread_id) or None
+            if not thread:
+                return None
+
+            # 步骤在写入时已保持有序，这里只需复制列表
+            return dict(thread, steps=list(thread.get("steps", [])))
+
+    def get_thread_author(self, thread_id: str) -> Optional[str]:
+        with self._lock:
+            thread = self._data["threads"].get(thread_id) or {}
+            return thread.get("userIdentifier") if thread else None
+
+    def upsert_thread(self, thread_id: str, defaults: Dict, updates: Dict) -> None:
+        with self._lock:
+            is_new = thread_id not in self._data["threads"]
+            thread = self._data["threads"].setdefault(thread_id, dict(defaults))
+            old_name = thread.get("name")
+            thread.update(updates)
+            if is_new:
+                self._index.touch(thread_id, thread.get("userIdentifier"), thread.get("createdAt"))
+            if "name" in updates and updates["name"] != old_name:
+                # 改名时去掉旧名称独有的词项，步骤文本中也出现的词项保留
+                stale = search_terms(old_name) - search_terms(updates["name"])
+                if stale:
+                    for step in thread.get("steps", []):
+                        stale -= search_terms(step.get("input"), step.get("output"))
+                    self._index.remove_terms(thread_id, stale)
+            self._index.add_terms(thread_id, search_terms(updates.get("name")))
+            self._mark_dirty()
+
+    def create_step(self, step: Dict) -> bool:
+        with self._lock:
+            thread_id = step["threadId"]
+            thread = self._data["threads"].get(thread_id) or None
+            if not thread:
+                return False
+
+            steps = thread.setdefault("steps", [])
+            steps_by_id = self._steps_by_id.setdefault(thread_id, {})
+            existing = steps_by_id.get(step["id"])
+            if existing is not None:
+                # 重复写入同一步骤时原地覆盖，避免出现重复步骤
+                existing.update(step)
+                stored = existing
+            else:
+                stored = dict(step)
+                steps_by_id[stored["id"]] = stored
+                # 新步骤通常是最新的，直接追加；乱序到达时按创建时间插入
+                if not steps or _step_order(steps[-1]) <= _step_order(stored):
+                    steps.append(stored)
+                else:
+                    insort(steps, stored, key=_step_order)
+            self._index_step(thread_id, thread.get("userIdentifier"), stored)
+            self._mark_dirty()
+            return True
+
+    def update_step(self, thread_id: str, step_id: str, updates: Dict) -> bool:
+        with self._lock:
+            # 使用链式获取,简化多层判断
+            thread = self._data.get("threads", {}).get(thread_id)
+            if not thread:
+                debug_log("test update_step: thread不存在")
+                return False
+
+            target_step = self._steps_by_id.get(thread_id, {}).get(step_id)
+            if not target_step:
+                debug_log(f"test update_step: step {step_id} 不存在")
+                return False
+
+            target_step.update(updates)
+            self._index_step(thread_id, thread.get("userIdentifier"), target_step)
+            self._mark_dirty()
+            return True
+
+    def list_threads(self, query: ThreadQuery) -> ThreadPage:
+        with self._lock:
+            entries = self._index.query(query)
+            page = entries[:query.limit]
+            threads = [self._data["threads"][thread_id] for _, thread_id in page]
+        return ThreadPage(
+            threads=threads,
+            start_cursor=encode_cursor(*page[0]) if page else None,
+            end_cursor=encode_cursor(*page[-1]) if page else None,
+            has_next=len(entries) > query.limit
+        )
+
+    def close(self) -> None:
+        self.flush()
+        atexit.unregister(self.flush)
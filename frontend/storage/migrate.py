@@ -0,0 +1,41 @@
+"""
+将 JSON 数据文件一次性迁移到 SQLite 数据库。
+
+用法（在项目根目录执行）:
+    python -m frontend.storage.migrate [--json 路径] [--db 路径]
+"""
+import argparse
+import json
+from pathlib import Path
+
+from config import config
+from frontend.storage.sqlite_storage import SQLiteStorage
+
+
+def migrate_json_to_sqlite(json_file: str, db_file: str) -> tuple:
+    """读取 JSON 数据文件并写入 SQLite 数据库，返回 (用户数, 对话数, 步骤数)"""
+    with open(json_file, 'r') as f:
+        data = json.load(f)
+
+    storage = SQLiteStorage(db_file)
+    try:
+        return storage.import_document(data)
+    finally:
+        storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将 JSON 会话数据迁移到 SQLite")
+    parser.add_argument("--json", default=config.USER_SESSIONS_FILE, help="JSON 数据文件路径")
+    parser.add_argument("--db", default=config.USER_SESSIONS_DB, help="SQLite 数据库路径")
+    args = parser.parse_args()
+
+    if not Path(args.json).exists():
+        raise SystemExit(f"JSON 数据文件不存在: {args.json}")
+
+    users, threads, steps = migrate_json_to_sqlite(args.json, args.db)
+    print(f"迁移完成: {users} 个用户, {threads} 个对话, {steps} 个步骤 -> {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from backend.text_utils import tokenize
+from frontend.storage.base import (
+    BaseStorage,
+    ThreadPage,
+    ThreadQuery,
+    debug_log,
+    decode_cursor,
+    encode_cursor,
+    feedback_value,
+    search_terms,
+)
+
+# 对话表中以 JSON 文本保存的列
+_THREAD_JSON_COLUMNS = ("metadata", "tags")
+_THREAD_COLUMNS = ("id", "name", "createdAt", "userId", "userIdentifier", "metadata", "tags")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    identifier TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS threads (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    name TEXT,
+    createdAt TEXT,
+    userId TEXT,
+    userIdentifier TEXT,
+    metadata TEXT,
+    tags TEXT,
+    lastActivity TEXT
+);
+CREATE TABLE IF NOT EXISTS steps (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL,
+    threadId TEXT NOT NULL,
+    createdAt TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deleted_threads (
+    id TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS search_terms (
+    term TEXT NOT NULL,
+    threadId TEXT NOT NULL,
+    PRIMARY KEY (term, threadId)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS thread_feedback (
+    threadId TEXT NOT NULL,
+    stepId TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (threadId, stepId)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_threads_user ON threads (userIdentifier);
+CREATE INDEX IF NOT EXISTS idx_threads_created ON threads (createdAt);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_steps_thread_id ON steps (threadId, id);
+CREATE INDEX IF NOT EXISTS idx_steps_thread_created ON steps (threadId, createdAt);
+CREATE INDEX IF NOT EXISTS idx_search_terms_thread ON search_terms (threadId);
+CREATE INDEX IF NOT EXISTS idx_thread_feedback_value ON thread_feedback (value, threadId);
+"""
+
+# 按 PRAGMA user_version 依次执行的结构升级
+_SCHEMA_VERSION = 1
+_ACTIVITY_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_threads_activity ON threads (lastActivity, id);
+CREATE INDEX IF NOT EXISTS idx_threads_user_activity ON threads (userIdentifier, lastActivity, id);
+"""
+
+
+class SQLiteStorage(BaseStorage):
+    """SQLite (WAL) 存储，用户、对话和步骤按行读写"""
+
+    def __init__(self, db_file: str):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        # 数据层在事件循环和迁移脚本中都会被调用，统一用一把锁串行化访问
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+        self._conn.commit()
+        debug_log(f"SQLite 数据库已打开: {self.db_file}")
+
+    def _migrate(self):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            # 1: 增加最近活动时间列、检索词项和反馈索引
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(threads)")}
+            if "lastActivity" not in columns:
+                self._conn.execute("ALTER TABLE threads ADD COLUMN lastActivity TEXT")
+            self._rebuild_indexes()
+        self._conn.executescript(_ACTIVITY_INDEXES)
+        self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    def _rebuild_indexes(self):
+        """根据对话和步骤重新计算最近活动时间、检索词项和反馈索引"""
+        self._conn.execute(
+            "UPDATE threads SET lastActivity = MAX(COALESCE(createdAt, ''), "
+            "COALESCE((SELECT MAX(createdAt) FROM steps WHERE steps.threadId = threads.id), ''))"
+        )
+        self._conn.execute("DELETE FROM search_terms")
+        self._conn.execute("DELETE FROM thread_feedback")
+        for row in self._conn.execute("SELECT id, name FROM threads").fetchall():
+            self._add_terms(row["id"], search_terms(row["name"]))
+        for row in self._conn.execute("SELECT threadId, data FROM steps").fetchall():
+            self._index_step(row["threadId"], json.loads(row["data"]))
+
+    def _add_terms(self, thread_id: str, terms):
+        if terms:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO search_terms (term, threadId) VALUES (?, ?)",
+                [(term, thread_id) for term in terms]
+            )
+
+    def _remove_name_terms(self, thread_id: str, new_name):
+        """改名时删除旧名称独有的词项，步骤文本中也出现的词项保留"""
+        row = self._conn.execute("SELECT name FROM threads WHERE id = ?", (thread_id,)).fetchone()
+        if row is None or row["name"] == new_name:
+            return
+        stale = search_terms(row["name"]) - search_terms(new_name)
+        if not stale:
+            return
+        for step_row in self._conn.execute("SELECT data FROM steps WHERE threadId = ?", (thread_id,)):
+            step = json.loads(step_row["data"])
+            stale -= search_terms(step.get("input"), step.get("output"))
+        self._conn.executemany(
+            "DELETE FROM search_terms WHERE term = ? AND threadId = ?",
+            [(term, thread_id) for term in stale]
+        )
+
+    def _index_step(self, thread_id: str, step: Dict):
+        self._add_terms(thread_id, search_terms(step.get("input"), step.get("output")))
+        value = feedback_value(step)
+        if value is None:
+            self._conn.execute(
+                "DELETE FROM thread_feedback WHERE threadId = ? AND stepId = ?",
+                (thread_id, step["id"])
+            )
+        else:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thread_feedback (threadId, stepId, value) VALUES (?, ?, ?)",
+                (thread_id, step["id"], value)
+            )
+
+    def _thread_from_row(self, row: sqlite3.Row) -> Dict:
+        thread = {}
+        for column in _THREAD_COLUMNS:
+            value = row[column]
+            if value is None:
+                continue
+            thread[column] = json.loads(value) if column in _THREAD_JSON_COLUMNS else value
+        return thread
+
+    def _load_steps(self, thread_id: str) -> List[Dict]:
+        rows = self._conn.execute(
+            "SELECT data FROM steps WHERE threadId = ? ORDER BY createdAt, seq",
+            (thread_id,)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def get_user(self, identifier: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM users WHERE identifier = ?", (identifier,)
+            ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def create_user(self, user: Dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO users (identifier, data) VALUES (?, ?) "
+                "ON CONFLICT(identifier) DO UPDATE SET data = excluded.data",
+                (user["identifier"], json.dumps(user))
+            )
+
+    def get_default_user_identifier(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT identifier FROM users ORDER BY seq LIMIT 1"
+            ).fetchone()
+        return row["identifier"] if row else None
+
+    def is_thread_deleted(self, thread_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM deleted_threads WHERE id = ?", (thread_id,)
+            ).fetchone()
+        return row is not None
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM steps WHERE threadId = ?", (thread_id,))
+            self._conn.execute("DELETE FROM threads WHERE id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM search_terms WHERE threadId = ?", (thread_id,))
+            self._conn.execute("DELETE FROM thread_feedback WHERE threadId = ?", (thread_id,))
+            self._conn.execute(
+                "INSERT OR IGNORE INTO deleted_threads (id) VALUES (?)", (thread_id,)
+            )
+
+    def get_thread(self, thread_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM threads WHERE id = ?", (thread_id,)
+            ).fetchone()
+            if not row:
+                return None
+            thread = self._thread_from_row(row)
+            thread["steps"] = self._load_steps(thread_id)
+        return thread
+
+    def get_thread_author(self, thread_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT userIdentifier FROM threads WHERE id = ?", (thread_id,)
+            ).fetchone()
+        return row["userIdentifier"] if row else None
+
+    def upsert_thread(self, thread_id: str, defaults: Dict, updates: Dict) -> None:
+        columns = {k: v for k, v in updates.items() if k in _THREAD_COLUMNS and k != "id"}
+        values = {
+            k: json.dumps(v) if k in _THREAD_JSON_COLUMNS else v
+            for k, v in columns.items()
+        }
+        with self._lock, self._conn:
+            if "name" in updates:
+                self._remove_name_terms(thread_id, updates["name"])
+            self._conn.execute(
+                "INSERT OR IGNORE INTO threads (id, createdAt, userIdentifier, lastActivity) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    thread_id,
+                    defaults.get("createdAt"),
+                    defaults.get("userIdentifier"),
+                    defaults.get("createdAt") or ""
+                )
+            )
+            self._add_terms(thread_id, search_terms(updates.get("name")))
+            if values:
+                assignments = ", ".join(f"{column} = ?" for column in values)
+                self._conn.execute(
+                    f"UPDATE threads SET {assignments} WHERE id = ?",
+                    (*values.values(), thread_id)
+                )
+
+    def create_step(self, step: Dict) -> bool:
+        with self._lock, self._conn:
+            exists = self._conn.execute(
+                "SELECT 1 FROM threads WHERE id = ?", (step["threadId"],)
+            ).fetchone()
+            if not exists:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO steps (id, threadId, createdAt, data) VALUES (?, ?, ?, ?)",
+                (step["id"], step["threadId"], step.get("createdAt"), json.dumps(step))
+            )
+            self._conn.execute(
+                "UPDATE threads SET lastActivity = ? WHERE id = ? AND lastActivity < ?",
+                (step.get("createdAt") or "", step["threadId"], step.get("createdAt") or "")
+            )
+            self._index_step(step["threadId"], step)
+        return True
+
+    def update_step(self, thread_id: str, step_id: str, updates: Dict) -> bool:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT seq, data FROM steps WHERE threadId = ? AND id = ?",
+                (thread_id, step_id)
+            ).fetchone()
+            if not row:
+                debug_log(f"update_step: step {step_id} 不存在")
+                return False
+            step = json.loads(row["data"])
+            step.update(updates)
+            self._conn.execute(
+                "UPDATE steps SET data = ? WHERE seq = ?", (json.dumps(step), row["seq"])
+            )
+            self._index_step(thread_id, step)
+        return True
+
+    def list_threads(self, query: ThreadQuery) -> ThreadPage:
+        conditions, params = [], []
+        if query.user_identifier is not None:
+            conditions.append("userIdentifier = ?")
+            params.append(query.user_identifier)
+        cursor = decode_cursor(query.cursor)
+        if cursor:
+            conditions.append("(lastActivity, id) < (?, ?)")
+            params.extend(cursor)
+        if query.feedback is not None:
+            conditions.append("id IN (SELECT threadId FROM thread_feedback WHERE value = ?)")
+            params.append(query.feedback)
+        if query.search:
+            terms = sorted(set(tokenize(query.search)))
+            if not terms:
+                return ThreadPage([], None, None, False)
+            conditions.append("id IN (" + " INTERSECT ".join(
+                "SELECT threadId FROM search_terms WHERE term = ?" for _ in terms
+            ) + ")")
+            params.extend(terms)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM threads{where} ORDER BY lastActivity DESC, id DESC LIMIT ?",
+                (*params, query.limit + 1)
+            ).fetchall()
+        page = rows[:query.limit]
+        # 列表页只需要对话概要信息，不加载步骤
+        return ThreadPage(
+            threads=[dict(self._thread_from_row(row), steps=[]) for row in page],
+            start_cursor=encode_cursor(page[0]["lastActivity"], page[0]["id"]) if page else None,
+            end_cursor=encode_cursor(page[-1]["lastActivity"], page[-1]["id"]) if page else None,
+            has_next=len(rows) > query.limit
+        )
+
+    def import_document(self, data: Dict) -> Tuple[int, int, int]:
+        """一次性导入 JSON 数据文件的完整内容，返回 (用户数, 对话数, 步骤数)"""
+        users = data.get("users") or {}
+        threads = data.get("threads") or {}
+        step_count = 0
+        with self._lock, self._conn:
+            for identifier, user in users.items():
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO users (identifier, data) VALUES (?, ?)",
+                    (identifier, json.dumps(user))
+                )
+            for thread_id, thread in threads.items():
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO threads "
+                    "(id, name, createdAt, userId, userIdentifier, metadata, tags) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        thread.get("name"),
+                        thread.get("createdAt"),
+                        thread.get("userId"),
+                        thread.get("userIdentifier"),
+                        json.dumps(thread["metadata"]) if thread.get("metadata") is not None else None,
+                        json.dumps(thread["tags"]) if thread.get("tags") is not None else None,
+                    )
+                )
+                for step in thread.get("steps", []):
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO steps (id, threadId, createdAt, data) VALUES (?, ?, ?, ?)",
+                        (step["id"], thread_id, step.get("createdAt"), json.dumps(step))
+                    )
+                    step_count += 1
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO deleted_threads (id) VALUES (?)",
+                [(thread_id,) for thread_id in data.get("delete_threads") or []]
+            )
+            self._rebuild_indexes()
+        return len(users), len(threads), step_count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,129 @@
+import heapq
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.text_utils import tokenize
+from frontend.storage.base import ThreadQuery, decode_cursor
+
+
+class ThreadIndex:
+    """
+    JSON 存储使用的内存二级索引。
+
+    - 每个用户(以及全部对话)维护一个按 (最近活动时间, 对话ID) 升序的有序列表，
+      分页时从游标位置向前遍历，翻页代价只和页大小有关
+    - 对话名称和步骤文本的倒排索引，用于 thread_filter.search
+    - 每个对话中步骤的反馈值，用于 thread_filter.feedback
+    """
+
+    def __init__(self):
+        # thread_id -> (最近活动时间, 用户标识)
+        self._threads: Dict[str, Tuple[str, Optional[str]]] = {}
+        # 用户标识 -> 有序的 (最近活动时间, thread_id)，None 键保存全部对话
+        self._by_user: Dict[Optional[str], List[Tuple[str, str]]] = {None: []}
+        self._postings: Dict[str, Set[str]] = {}
+        self._thread_terms: Dict[str, Set[str]] = {}
+        # thread_id -> {step_id: 反馈值}
+        self._feedback: Dict[str, Dict[str, int]] = {}
+
+    def touch(self, thread_id: str, user_identifier: Optional[str], activity: Optional[str]) -> None:
+        """记录对话的一次活动，只会把最近活动时间往后推"""
+        activity = activity or ""
+        previous = self._threads.get(thread_id)
+        if previous and previous[0] >= activity:
+            return
+        if previous:
+            self._unlink(thread_id, *previous)
+        self._threads[thread_id] = (activity, user_identifier)
+        insort(self._by_user[None], (activity, thread_id))
+        if user_identifier is not None:
+            insort(self._by_user.setdefault(user_identifier, []), (activity, thread_id))
+
+    def add_terms(self, thread_id: str, terms: Iterable[str]) -> None:
+        known = self._thread_terms.setdefault(thread_id, set())
+        for term in terms:
+            if term not in known:
+                known.add(term)
+                self._postings.setdefault(term, set()).add(thread_id)
+
+    def remove_terms(self, thread_id: str, terms: Iterable[str]) -> None:
+        known = self._thread_terms.get(thread_id)
+        if not known:
+            return
+        for term in terms:
+            if term in known:
+                known.discard(term)
+                posting = self._postings.get(term)
+                if posting is not None:
+                    posting.discard(thread_id)
+                    if not posting:
+                        del self._postings[term]
+
+    def set_feedback(self, thread_id: str, step_id: str, value: Optional[int]) -> None:
+        values = self._feedback.setdefault(thread_id, {})
+        if value is None:
+            values.pop(step_id, None)
+        else:
+            values[step_id] = value
+
+    def remove(self, thread_id: str) -> None:
+        entry = self._threads.pop(thread_id, None)
+        if entry:
+            self._unlink(thread_id, *entry)
+        for term in self._thread_terms.pop(thread_id, ()):
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.discard(thread_id)
+                if not posting:
+                    del self._postings[term]
+        self._feedback.pop(thread_id, None)
+
+    def _unlink(self, thread_id: str, activity: str, user_identifier: Optional[str]) -> None:
+        for key in {None, user_identifier}:
+            entries = self._by_user.get(key)
+            if not entries:
+                continue
+            pos = bisect_left(entries, (activity, thread_id))
+            if pos < len(entries) and entries[pos] == (activity, thread_id):
+                del entries[pos]
+
+    def _has_feedback(self, thread_id: str, value: Optional[int]) -> bool:
+        return value is None or value in self._feedback.get(thread_id, {}).values()
+
+    def query(self, query: ThreadQuery) -> List[Tuple[str, str]]:
+        """按最近活动时间倒序返回最多 limit + 1 条 (最近活动时间, thread_id)"""
+        cursor = decode_cursor(query.cursor)
+        wanted = query.limit + 1
+
+        if query.search:
+            return self._search(query, cursor, wanted)
+
+        entries = self._by_user.get(query.user_identifier, [])
+        pos = bisect_left(entries, cursor) if cursor else len(entries)
+        results = []
+        while pos > 0 and len(results) < wanted:
+            pos -= 1
+            activity, thread_id = entries[pos]
+            if self._has_feedback(thread_id, query.feedback):
+                results.append((activity, thread_id))
+        return results
+
+    def _search(self, query: ThreadQuery, cursor, wanted: int) -> List[Tuple[str, str]]:
+        terms = set(tokenize(query.search))
+        if not terms:
+            return []
+        postings = sorted((self._postings.get(term, set()) for term in terms), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+
+        def matches(thread_id: str) -> bool:
+            activity, user_identifier = self._threads[thread_id]
+            if query.user_identifier is not None and user_identifier != query.user_identifier:
+                return False
+            if cursor and (activity, thread_id) >= cursor:
+                return False
+            return self._has_feedback(thread_id, query.feedback)
+
+        return heapq.nlargest(
+            wanted,
+            ((self._threads[thread_id][0], thread_id) for thread_id in candidates if matches(thread_id))
+        )
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# 测试从项目根目录导入 backend、frontend 和 config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
@@ -0,0 +1,75 @@
+import re
+
+from backend.answer_cache import AnswerCache, chat_context_key
+
+
+class DigitBlindEmbeddings:
+    """把所有数字视为同一个字符的嵌入：字面相近的问题余弦相似度为 1"""
+
+    def embed_query(self, text):
+        text = re.sub(r"\d", "0", text)
+        vector = [0.0] * 64
+        for char in text:
+            vector[ord(char) % 64] += 1.0
+        return vector
+
+
+def make_cache(**kwargs):
+    return AnswerCache(DigitBlindEmbeddings(), threshold=0.95, **kwargs)
+
+
+def test_exact_question_hits_same_context():
+    cache = make_cache()
+    cache.store("系统由哪几部分组成？", "ctx", "三部分")
+    assert cache.lookup("系统由哪几部分组成？", "ctx") == "三部分"
+
+
+def test_contexts_are_isolated():
+    cache = make_cache()
+    doc_a = chat_context_key("model", "文档 A 的内容")
+    doc_b = chat_context_key("model", "文档 B 的内容")
+    cache.store("这份文档讲了什么内容？", doc_a, "回答 A")
+    assert cache.lookup("这份文档讲了什么内容？", doc_b) is None
+    assert cache.lookup("这份文档讲了什么内容？", chat_context_key("other-model", "文档 A 的内容")) is None
+    assert cache.lookup("这份文档讲了什么内容？", doc_a) == "回答 A"
+
+
+def test_repeated_chat_question_hits_with_same_context():
+    cache = make_cache()
+    # 对话历史和会话ID不参与缓存键，后续轮次和其他会话中的相同问题都能命中
+    cache.store("这份文档讲了什么内容？", chat_context_key("model", "共享文档内容"), "回答")
+    assert cache.lookup("这份文档讲了什么内容？", chat_context_key("model", "共享文档内容")) == "回答"
+    assert cache.stats()["hits"] == 1
+
+
+def test_chat_without_knowledge_is_not_cached():
+    assert chat_context_key("model", "") is None
+
+
+def test_short_similar_questions_do_not_hit():
+    cache = make_cache()
+    cache.store("2+3", "ctx", "5")
+    assert cache.lookup("2+4", "ctx") is None
+    cache.store("2+3等于几", "ctx", "5")
+    assert cache.lookup("2+4等于几", "ctx") is None
+
+
+def test_questions_with_different_numbers_do_not_hit():
+    cache = make_cache()
+    cache.store("请问第 3 章第 2 节主要讲了哪些内容", "ctx", "第三章")
+    assert cache.lookup("请问第 4 章第 2 节主要讲了哪些内容", "ctx") is None
+    assert cache.stats()["hits"] == 0
+
+
+def test_semantic_hit_for_long_questions_with_same_numbers():
+    cache = make_cache()
+    cache.store("请问第 3 章第 2 节主要讲了哪些内容", "ctx", "第三章")
+    assert cache.lookup("请问第 3 章第 2 节主要讲了哪些内容？", "ctx") == "第三章"
+
+
+def test_lru_eviction():
+    cache = make_cache(max_entries=2)
+    for i, question in enumerate(["问题一", "问题二", "问题三"]):
+        cache.store(question, "ctx", f"回答{i}")
+    assert cache.lookup("问题一", "ctx") is None
+    assert cache.lookup("问题三", "ctx") == "回答2"
@@ -0,0 +1,17 @@
+from backend.chain_registry import ChainRegistry
+from config import config
+
+
+def test_rebuilds_only_when_config_changes_or_reset(monkeypatch):
+    registry = ChainRegistry()
+    monkeypatch.setattr(ChainRegistry, "_build", lambda self: setattr(self, "_chains", {"qa": object()}))
+    first = registry.get("qa")
+    assert registry.get("qa") is first
+
+    monkeypatch.setattr(config, "TEMPERATURE", config.TEMPERATURE + 0.1)
+    second = registry.get("qa")
+    assert second is not first
+    assert registry.get("qa") is second
+
+    registry.reset()
+    assert registry.get("qa") is not second
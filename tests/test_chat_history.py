@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import pytest
+
+from backend.chat_history import ChatHistoryManager
+from backend.transcript_store import TranscriptStore
+
+
+@pytest.fixture
+def history(tmp_path):
+    # 记录存储非空时不会读取向量存储
+    store = TranscriptStore(str(tmp_path / "chat.db"))
+    store.append("seed", "user", "hello", "2024-01-01T00:00:00")
+    manager = ChatHistoryManager(SimpleNamespace(), store)
+    yield manager
+    store.close()
+
+
+def test_counts_user_messages(history):
+    assert history.count_user_messages("c1") == 0
+    for i in range(3):
+        history.save_message("c1", "user", f"q{i}")
+        history.save_message("c1", "assistant", f"a{i}")
+    assert history.count_user_messages("c1") == 3
+
+
+def test_title_is_persisted(history, tmp_path):
+    assert not history.has_title("c1")
+    history.save_title("c1", "预算讨论")
+    assert history.has_title("c1")
+    # 重启后仍记得已生成标题，不会重复生成
+    reopened = TranscriptStore(str(tmp_path / "chat.db"))
+    assert reopened.get_title("c1") == "预算讨论"
+    reopened.close()
+
+
+def test_cached_counts_are_bounded(tmp_path):
+    store = TranscriptStore(str(tmp_path / "bounded.db"))
+    store.append("seed", "user", "hello", "2024-01-01T00:00:00")
+    manager = ChatHistoryManager(SimpleNamespace(), store, max_cached_counts=2)
+    for conversation_id in ("a", "b", "c"):
+        manager.save_message(conversation_id, "user", "q")
+        assert manager.count_user_messages(conversation_id) == 1
+    assert list(manager._user_counts) == ["b", "c"]
+    # 被淘汰的会话重新从记录存储统计
+    manager.save_message("a", "user", "q2")
+    assert manager.count_user_messages("a") == 2
+    store.close()
@@ -0,0 +1,76 @@
+from langchain_core.documents import Document
+
+from backend.chunking import (
+    Chunker,
+    CSVChunker,
+    MarkdownChunker,
+    PDFChunker,
+    _estimate_tokens,
+    get_chunker,
+)
+
+
+def page(text, **metadata):
+    return Document(page_content=text, metadata=dict(metadata))
+
+
+def test_estimate_tokens():
+    # 中日韩字符每个算一个 token，其余按约 4 个字符一个 token
+    assert _estimate_tokens("中文") == 2
+    assert _estimate_tokens("abcd efghij") == 1 + 2
+    assert _estimate_tokens("错误码 E1234!") == 3 + 2 + 1
+
+
+def test_chunks_never_exceed_token_limit():
+    # 没有换行的长中文文本也要按句切分到窗口之内
+    text = "".join(f"第{i}句话讲的是检索增强生成的一个细节。" for i in range(200))
+    chunker = Chunker(64, 8, _estimate_tokens)
+    chunks = chunker.split(page(text, source="a.txt")) + chunker.flush()
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.metadata["tokens"] == _estimate_tokens(chunk.page_content) <= 64
+        assert chunk.metadata["source"] == "a.txt"
+    assert "第199句话" in chunks[-1].page_content
+    assert chunker.stats.count == len(chunks)
+    assert chunker.stats.max <= 64
+
+
+def test_csv_rows_are_grouped_within_limit():
+    chunker = CSVChunker(20, 0, _estimate_tokens)
+    chunks = []
+    for i in range(10):
+        chunks += chunker.split(page(f"id: {i} name: 产品{i}", row=i))
+    chunks += chunker.split(page("长" * 50, row=10))
+    chunks += chunker.flush()
+    assert all(chunk.metadata["tokens"] <= 20 for chunk in chunks)
+    # 连续的行合并成一组，记录起止行号
+    assert chunks[0].metadata["row"] == 0
+    assert chunks[0].metadata["row_end"] > 0
+    assert chunks[0].page_content.startswith("id: 0 name: 产品0\nid: 1")
+    # 过长的单行单独切分
+    assert "".join(chunk.page_content for chunk in chunks if chunk.metadata["row"] == 10) == "长" * 50
+
+
+def test_pdf_joins_broken_lines():
+    chunker = PDFChunker(200, 0, _estimate_tokens)
+    [chunk] = chunker.split(page("检索增强\n生成把文档切分成块，embed-\nding 之后写入向量库", page=3))
+    assert chunk.page_content == "检索增强生成把文档切分成块，embedding 之后写入向量库"
+    assert chunk.metadata["page"] == 3
+
+
+def test_markdown_splits_at_headings():
+    text = "# 安装\n\n" + "安装步骤。" * 12 + "\n\n## 配置\n\n" + "配置说明。" * 12
+    chunks = MarkdownChunker(70, 0, _estimate_tokens).split(page(text))
+    # 标题标记留在所属章节的开头，不会挂到上一块的末尾
+    assert [chunk.page_content.split("\n")[0] for chunk in chunks] == ["# 安装", "## 配置"]
+    assert chunks[0].page_content.endswith("安装步骤。")
+
+
+def test_get_chunker_by_extension():
+    assert type(get_chunker("notes.MD", 128, 16)) is MarkdownChunker
+    assert type(get_chunker("report.pdf", 128, 16)) is PDFChunker
+    assert type(get_chunker("table.csv", 128, 16)) is CSVChunker
+    chunker = get_chunker("plain.txt", 128, 100)
+    assert type(chunker) is Chunker
+    # 重叠不超过块大小的一半
+    assert chunker.splitter._chunk_overlap == 64
@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+from backend.content_index import ContentIndex, chunk_sha256, vector_id
+from backend.ingestion import IngestionJob, IngestionPipeline
+
+
+class FakeCollection:
+    def __init__(self):
+        self.vectors = {}
+        self.upserts = []
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        self.upserts.append(list(ids))
+        self.vectors.update(zip(ids, embeddings))
+
+    def get(self, ids, include):
+        found = [vid for vid in ids if vid in self.vectors]
+        return {"ids": found, "embeddings": [self.vectors[vid] for vid in found]}
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def docs(texts, conversation_id):
+    return [Document(page_content=text, metadata={"conversation_id": conversation_id}) for text in texts]
+
+
+def ingest(pipeline, texts, conversation_id, file_hash="file"):
+    job = IngestionJob(file_hash, conversation_id, "notes.txt")
+    pipeline.submit(docs(texts, conversation_id), job)
+    return job.wait(5)
+
+
+def test_index_lookups(tmp_path):
+    index = ContentIndex(str(tmp_path / "content.db"))
+    assert not index.has_document("f", "c1")
+    index.add_document("f", "c1", "a.pdf")
+    assert index.has_document("f", "c1")
+    assert not index.has_document("f", "c2")
+
+    # 超过单次查询参数上限时分批查询
+    hashes = [chunk_sha256(str(i)) for i in range(1200)]
+    index.add_chunks((h, "c1", vector_id(h, "c1")) for h in hashes[:700])
+    assert index.linked_chunks(hashes, "c1") == set(hashes[:700])
+    assert index.linked_chunks(hashes, "c2") == set()
+    found = index.find_vectors(hashes + hashes[:10])
+    assert len(found) == 700
+    assert found[hashes[0]] == vector_id(hashes[0], "c1")
+    index.close()
+
+
+def test_pipeline_embeds_each_chunk_once(tmp_path):
+    index = ContentIndex(str(tmp_path / "content.db"))
+    embeddings = CountingEmbeddings()
+    collection = FakeCollection()
+    pipeline = IngestionPipeline(
+        SimpleNamespace(_collection=collection), embeddings,
+        batch_size=8, max_in_flight=1, retry_backoff=0, content_index=index
+    )
+    texts = ["第一段", "第二段", "第一段", "第三段"]
+
+    # 同一批次中重复的文本块只嵌入一次
+    job = ingest(pipeline, texts, "c1")
+    assert sorted(embeddings.texts) == ["第一段", "第三段", "第二段"]
+    assert job.done_chunks == 4
+
+    # 同一会话再次上传：全部跳过，不嵌入也不写入
+    upserts = len(collection.upserts)
+    job = ingest(pipeline, texts, "c1")
+    assert len(embeddings.texts) == 3
+    assert len(collection.upserts) == upserts
+    assert job.reused_chunks == 4
+
+    # 其他会话上传相同内容：复制已有向量，只嵌入新文本块
+    ingest(pipeline, texts + ["新段落"], "c2")
+    assert embeddings.texts[3:] == ["新段落"]
+    first = chunk_sha256("第一段")
+    assert collection.vectors[vector_id(first, "c2")] == collection.vectors[vector_id(first, "c1")]
+    assert index.linked_chunks([first], "c2") == {first}
+    # 文件在任务完成后登记，再次上传到同一会话时可以整体跳过
+    assert index.has_document("file", "c1")
+    index.close()
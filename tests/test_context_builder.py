@@ -0,0 +1,87 @@
+from langchain_core.documents import Document
+
+from backend.chunking import count_tokens
+from backend.context_builder import ContextBuilder
+from backend.lexical_index import LexicalIndex
+
+
+class FakeVectorStore:
+    """记录 MMR 检索参数的假向量存储，按顺序返回 docs 的前 k 个"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = []
+
+    def max_marginal_relevance_search(self, query, k, fetch_k, lambda_mult, filter):
+        self.calls.append({"k": k, "fetch_k": fetch_k, "filter": filter})
+        return self.docs[:k]
+
+
+def chunk(text, chunk_hash=None, tokens=None):
+    metadata = {"chunk_hash": chunk_hash or text}
+    if tokens is not None:
+        metadata["tokens"] = tokens
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_lexical_hits_shrink_vector_k(tmp_path):
+    lexical = LexicalIndex(str(tmp_path / "lexical.db"))
+    lexical.add("c1", [
+        (f"v{i}", chunk(f"错误码 E{i:04d} 表示设备离线")) for i in range(3)
+    ])
+    vector_docs = [chunk(f"语义相近的段落 {i}") for i in range(8)]
+    store = FakeVectorStore(vector_docs)
+    builder = ContextBuilder(store, k=8, fetch_k=24, min_k=4, lexical_index=lexical, lexical_k=8)
+
+    docs = builder.retrieve("E0001 和 E0002 是什么错误", "c1")
+    assert store.calls[-1] == {"k": 6, "fetch_k": 18, "filter": {"conversation_id": "c1"}}
+    # 精确匹配的文本块与向量结果融合，都排在前面
+    assert {doc.page_content for doc in docs[:4]} >= {"错误码 E0001 表示设备离线", "错误码 E0002 表示设备离线"}
+    assert len(docs) == 2 + 6
+
+    # 没有关键词命中时向量检索取满 k 个
+    builder.retrieve("完全无关的问题", "c1")
+    assert store.calls[-1]["k"] == 8
+    lexical.close()
+
+
+def test_vector_k_never_drops_below_min_k():
+    builder = ContextBuilder(FakeVectorStore([]), k=8, fetch_k=24, min_k=4)
+    assert builder.vector_k(0) == (8, 24)
+    assert builder.vector_k(2) == (6, 18)
+    assert builder.vector_k(8) == (4, 12)
+    assert builder.vector_k(20) == (4, 12)
+
+
+def test_pack_keeps_recent_history_within_budget():
+    question = "设备为什么离线"
+    history = [f"用户: 第{i}个问题的内容" for i in range(10)]
+    line_tokens = [count_tokens(line) + 1 for line in history]
+    history_budget = sum(line_tokens[-3:])
+    builder = ContextBuilder(FakeVectorStore([]), token_budget=1000, history_tokens=history_budget)
+    context = builder.pack(question, history, [])
+    # 从最近一条往前取，保持原有顺序
+    assert context.chat_history == "\n".join(history[-3:])
+    assert context.usage["history"] == history_budget
+    assert context.usage["question"] == count_tokens(question)
+
+
+def test_pack_dedups_and_skips_chunks_that_do_not_fit():
+    question = "问题"
+    budget = count_tokens(question) + 100
+    builder = ContextBuilder(FakeVectorStore([]), token_budget=budget, history_tokens=0, dedup_threshold=0.8)
+    candidates = [
+        chunk("alpha beta gamma delta", chunk_hash="h1", tokens=40),
+        # 同一内容哈希的文本块只保留一次
+        chunk("另一份 alpha 拷贝", chunk_hash="h1", tokens=5),
+        # 与已保留文本块词项几乎相同(重叠切分出的相同段落)
+        chunk("alpha beta gamma delta", chunk_hash="h2", tokens=40),
+        # 放不下的长文本块被跳过，后面更短的仍能装入
+        chunk("很长的段落", chunk_hash="h3", tokens=70),
+        chunk("epsilon zeta", chunk_hash="h4", tokens=20),
+    ]
+    context = builder.pack(question, [], candidates)
+    assert [doc.metadata["chunk_hash"] for doc in context.documents] == ["h1", "h4"]
+    assert context.knowledge_text == "alpha beta gamma delta\nepsilon zeta"
+    assert context.usage["knowledge"] == 41 + 21
+    assert context.usage["total"] <= budget
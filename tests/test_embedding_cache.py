@@ -0,0 +1,47 @@
+from backend.embedding_cache import EmbeddingCacheStore
+
+
+def test_hits_do_not_write_until_flush(tmp_path):
+    store = EmbeddingCacheStore(str(tmp_path / "cache.db"), max_bytes=1 << 20, access_flush_size=3)
+    store.put_many({"a": [1.0], "b": [2.0]})
+    written = store._conn.total_changes
+
+    assert store.get_many(["a", "b", "missing"]) == {"a": [1.0], "b": [2.0]}
+    assert store._conn.total_changes == written
+    # 累积到 access_flush_size 条才批量写回
+    store.get_many(["a"])
+    store.get_many(["b"])
+    assert store._conn.total_changes == written
+    store.put_many({"c": [3.0]})
+    store.get_many(["c"])
+    assert store._conn.total_changes == written + 1 + 3
+    assert not store._pending_access
+    store.close()
+
+
+def test_eviction_keeps_recently_hit_entries(tmp_path):
+    # 每条 4 字节，淘汰一次删除最久未访问的 256 条
+    store = EmbeddingCacheStore(str(tmp_path / "cache.db"), max_bytes=300 * 4)
+    store.put_many({"old": [0.0]})
+    store.put_many({f"k{i}": [0.0] for i in range(299)})
+    # 命中只记录在内存中，淘汰前会先写回
+    store.get_many(["old"])
+    store.put_many({"new": [0.0]})
+    keys = {row[0] for row in store._conn.execute("SELECT key FROM embeddings")}
+    assert len(keys) == 301 - 256
+    assert {"old", "new"} <= keys
+    store.close()
+
+
+def test_close_flushes_access_times(tmp_path):
+    db_file = str(tmp_path / "cache.db")
+    store = EmbeddingCacheStore(db_file, max_bytes=1 << 20)
+    store.put_many({"a": [1.0]})
+    with store._conn:
+        store._conn.execute("UPDATE embeddings SET last_access = 0")
+    store.get_many(["a"])
+    store.close()
+
+    reopened = EmbeddingCacheStore(db_file, max_bytes=1 << 20)
+    assert reopened._conn.execute("SELECT last_access FROM embeddings").fetchone()[0] > 0
+    reopened.close()
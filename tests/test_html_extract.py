@@ -0,0 +1,42 @@
+from backend.html_extract import extract_html
+
+FILLER = "正文内容" * 60
+
+
+def test_keeps_tail_and_mixed_text():
+    html = f"""<html><head><title> 标题 </title></head><body><main>
+    <h1>简介</h1><p>第一段 <b>加粗</b> 文字<br>换行</p>段落之后的文字
+    <div>块前文字<p>内层段落</p>块后文字 <a href="#">链接</a> 结尾</div>
+    <h2>第二节</h2><ul><li>一</li><li>二 <em>强调</em> 三</li></ul><p>{FILLER}</p>
+    </main></body></html>""".encode("utf-8")
+    page = extract_html(html, "utf-8")
+    assert page.title == "标题"
+    assert page.sections[0].heading == "简介"
+    assert page.sections[0].text.split("\n") == [
+        "第一段 加粗 文字 换行", "段落之后的文字", "块前文字", "内层段落", "块后文字 链接 结尾"
+    ]
+    assert page.sections[1].heading == "第二节"
+    assert page.sections[1].text.split("\n")[:2] == ["一", "二 强调 三"]
+
+
+def test_boilerplate_names_match_whole_words():
+    html = f"""<html><body>
+    <div class="layout no-sidebar has-comments"><main><p>{FILLER}</p><div class="post has-comments">保留的段落</div>
+    <div class="share-buttons">分享到</div><div class="heading-ads">广告</div></main></div>
+    <div id="site-footer">页脚</div><div class="side-bar">侧栏</div>
+    </body></html>""".encode("utf-8")
+    text = extract_html(html, "utf-8").to_text()
+    assert FILLER in text
+    assert "保留的段落" in text
+    for removed in ("分享到", "广告", "页脚", "侧栏"):
+        assert removed not in text
+
+
+def test_falls_back_to_densest_block():
+    html = f"""<html><body>
+    <div class="links">{'<a href="#">导航链接</a>' * 50}</div>
+    <div class="content"><p>{FILLER}</p><p>{FILLER}</p></div>
+    </body></html>""".encode("utf-8")
+    text = extract_html(html, "utf-8").to_text()
+    assert FILLER in text
+    assert "导航链接" not in text
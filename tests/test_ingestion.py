@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from backend.ingestion import IngestionJob, IngestionPipeline
+
+
+class FakeCollection:
+    def __init__(self):
+        self.ids = []
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        self.ids.extend(ids)
+
+
+class FakeEmbeddings:
+    """gate 未打开前嵌入调用一直阻塞，fail 为真时抛出异常"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.gate = threading.Event()
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.gate.wait(5)
+        if self.fail:
+            raise RuntimeError("embedding service unavailable")
+        return [[float(len(text))] for text in texts]
+
+
+def make_pipeline(embeddings, **kwargs):
+    vector_store = SimpleNamespace(_collection=FakeCollection())
+    return IngestionPipeline(vector_store, embeddings, batch_size=2, max_in_flight=1, retry_backoff=0, **kwargs)
+
+
+def docs(count, conversation_id="c1"):
+    return [Document(page_content=f"chunk {i}", metadata={"conversation_id": conversation_id}) for i in range(count)]
+
+
+def test_job_states_without_pipeline():
+    job = IngestionJob("hash", "c1")
+    assert job.state == IngestionJob.QUEUED
+    job._add_batch(3)
+    job._add_batch(2)
+    job._seal()
+    job._batch_started()
+    assert job.state == IngestionJob.EMBEDDING
+    job._batch_done(3)
+    assert not job.finished
+    assert job.progress() == "3/5"
+    job._batch_done(2, reused=1)
+    assert job.state == IngestionJob.DONE
+    assert job.wait(0) is job
+    assert job.reused_chunks == 1
+    assert job.finished_at is not None
+
+    failed = IngestionJob()
+    failed.fail(ValueError("parse error"))
+    assert failed.state == IngestionJob.FAILED
+    with pytest.raises(ValueError):
+        failed.wait(0)
+
+
+def test_job_waits_for_seal():
+    job = IngestionJob()
+    job._add_batch(1)
+    job._batch_started()
+    job._batch_done(1)
+    # 还有文档块可能在提交，不能提前结束
+    assert job.state == IngestionJob.EMBEDDING
+    job._seal()
+    assert job.state == IngestionJob.DONE
+
+
+def test_pipeline_moves_job_through_states():
+    embeddings = FakeEmbeddings()
+    pipeline = make_pipeline(embeddings)
+    job = pipeline.jobs.create("hash", "c1")
+    pipeline.feed(docs(3), job)
+    # 凑满一个批次的部分立即入队，余下的等 finish
+    assert job.total_chunks == 2
+    pipeline.finish(job)
+    assert job.total_chunks == 3
+    while job.state == IngestionJob.QUEUED:
+        threading.Event().wait(0.01)
+    assert job.state == IngestionJob.EMBEDDING
+    assert pipeline.jobs.for_conversation("c1", active_only=True) == [job]
+
+    embeddings.gate.set()
+    assert job.wait(5) is job
+    assert job.state == IngestionJob.DONE
+    assert job.progress() == "3/3"
+    assert len(pipeline.vector_store._collection.ids) == 3
+    assert pipeline.jobs.for_conversation("c1", active_only=True) == []
+
+
+def test_pipeline_failed_batch_fails_job_after_retries():
+    embeddings = FakeEmbeddings(fail=True)
+    embeddings.gate.set()
+    pipeline = make_pipeline(embeddings, max_retries=2)
+    job = pipeline.submit(docs(4))
+    with pytest.raises(RuntimeError):
+        job.wait(5)
+    assert job.state == IngestionJob.FAILED
+    assert job.failed_batches == 2
+    assert job.done_chunks == 0
+    # 每个批次首次执行加两次重试
+    assert embeddings.calls == 6
+    assert asyncio.run(job.wait_async(1))
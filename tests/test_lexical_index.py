@@ -0,0 +1,80 @@
+from langchain_core.documents import Document
+
+from backend.lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+
+class FakeCollection:
+    """按 limit/offset 分页返回文件文本块的假 Chroma 集合"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get(self, where, include, limit, offset):
+        page = self.rows[offset:offset + limit]
+        return {
+            "ids": [vid for vid, _, _ in page],
+            "documents": [content for _, content, _ in page],
+            "metadatas": [metadata for _, _, metadata in page],
+        }
+
+
+def doc(text, chunk_hash=None):
+    return Document(page_content=text, metadata={"chunk_hash": chunk_hash or text})
+
+
+def test_exact_identifier_ranks_first(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.db"))
+    index.add("c1", [
+        ("v1", doc("设备离线时检查网络连接")),
+        ("v2", doc("错误码 E4031 表示证书过期，需要重新签发")),
+        ("v3", doc("错误码 E4032 表示磁盘已满")),
+        ("v4", doc("部署文档 deploy_guide.md 介绍了安装步骤")),
+    ])
+    assert [d.id for d in index.search("E4031 是什么意思", "c1")][:1] == ["v2"]
+    assert [d.id for d in index.search("deploy_guide.md", "c1")][:1] == ["v4"]
+    found = index.search("E4032", "c1")[0]
+    assert found.page_content == "错误码 E4032 表示磁盘已满"
+    assert found.metadata["chunk_hash"] == "错误码 E4032 表示磁盘已满"
+    assert index.search("完全无关", "c1") == []
+    index.close()
+
+
+def test_search_is_isolated_per_conversation(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.db"))
+    index.add("c1", [("v1", doc("合同编号 HT-2024-001"))])
+    index.add("c2", [("v2", doc("合同编号 HT-2024-002"))])
+    assert [d.id for d in index.search("HT", "c1")] == ["v1"]
+    assert [d.id for d in index.search("HT", "c2")] == ["v2"]
+    assert index.search("HT", "c3") == []
+    index.close()
+
+
+def test_readding_vector_id_replaces_terms(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.db"))
+    assert index.is_empty()
+    index.add("c1", [("v1", doc("旧内容 alpha")), ("v2", doc("其他 beta"))])
+    index.add("c1", [("v1", doc("新内容 gamma"))])
+    assert index.search("alpha", "c1") == []
+    assert [d.page_content for d in index.search("gamma", "c1")] == ["新内容 gamma"]
+    assert not index.is_empty()
+    index.close()
+
+
+def test_rebuild_from_vector_store(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.db"))
+    rows = [(f"v{i}", f"段落 P{i:03d}", {"conversation_id": f"c{i % 2}"}) for i in range(5)]
+    vector_store = type("Store", (), {"_collection": FakeCollection(rows)})()
+    assert index.rebuild_from(vector_store, page_size=2) == 5
+    assert [d.id for d in index.search("P003", "c1")] == ["v3"]
+    assert index.search("P003", "c0") == []
+    index.close()
+
+
+def test_reciprocal_rank_fusion():
+    a, b, c, d = doc("a"), doc("b"), doc("c"), doc("d")
+    # b 在两个列表中都出现，得分最高；同一文本块只返回一次
+    fused = reciprocal_rank_fusion([[a, b, c], [b, d]])
+    assert [x.page_content for x in fused] == ["b", "a", "d", "c"]
+    # 按 chunk_hash 识别同一文本块，保留第一次出现的文档
+    copy = doc("a 的另一份拷贝", chunk_hash="a")
+    assert reciprocal_rank_fusion([[copy], [a]]) == [copy]
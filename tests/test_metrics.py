@@ -0,0 +1,80 @@
+import logging
+
+import pytest
+
+from backend.metrics import DEFAULT_BUCKETS, Histogram, MetricsRegistry, scrape_allowed
+
+
+def test_scrape_requires_token_or_loopback():
+    assert scrape_allowed("Bearer s3cret", "203.0.113.5", "s3cret")
+    assert not scrape_allowed("Bearer wrong", "127.0.0.1", "s3cret")
+    assert not scrape_allowed(None, "127.0.0.1", "s3cret")
+    # 未配置令牌时只允许本机访问
+    assert scrape_allowed(None, "127.0.0.1", "")
+    assert not scrape_allowed("Bearer anything", "203.0.113.5", "")
+
+
+def test_failing_gauge_is_logged_and_skipped(caplog):
+    registry = MetricsRegistry(enabled=True)
+    registry.register_gauges("ok", lambda: {"entries": 3})
+    registry.register_gauges("broken", lambda: 1 / 0)
+    with caplog.at_level(logging.WARNING, logger="backend.metrics"):
+        assert "ai4fs_ok_entries 3" in registry.render_prometheus()
+    assert "reading broken stats failed" in caplog.text
+
+
+def test_histogram_quantile_uses_bucket_upper_bound():
+    histogram = Histogram((0.1, 0.5, 1.0))
+    assert histogram.quantile(0.5) == 0.0
+    for value in [0.05] * 90 + [0.1] * 5 + [0.7] * 4 + [3.0]:
+        histogram.observe(value)
+    # 等于上限的值计入该桶
+    assert histogram.counts == [95, 0, 4, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.95) == 0.1
+    assert histogram.quantile(0.99) == 1.0
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_render_prometheus_format():
+    registry = MetricsRegistry(enabled=True)
+    for value in (0.2, 0.7, 5.0):
+        registry.observe("stage_seconds", value, buckets=(0.5, 1.0), stage="llm")
+    registry.inc("tool_calls_total", tool='say "hi"\n', outcome="ok")
+    registry.inc("tool_calls_total", 2, tool='say "hi"\n', outcome="ok")
+    lines = registry.render_prometheus().splitlines()
+    assert lines == [
+        "# TYPE ai4fs_stage_seconds histogram",
+        'ai4fs_stage_seconds_bucket{stage="llm",le="0.5"} 1',
+        'ai4fs_stage_seconds_bucket{stage="llm",le="1.0"} 2',
+        'ai4fs_stage_seconds_bucket{stage="llm",le="+Inf"} 3',
+        'ai4fs_stage_seconds_sum{stage="llm"} 5.9',
+        'ai4fs_stage_seconds_count{stage="llm"} 3',
+        "# TYPE ai4fs_tool_calls_total counter",
+        'ai4fs_tool_calls_total{outcome="ok",tool="say \\"hi\\"\\n"} 3',
+    ]
+
+
+def test_span_records_duration_and_errors():
+    registry = MetricsRegistry(enabled=True)
+    with registry.span("retrieval"):
+        pass
+    with pytest.raises(ValueError):
+        with registry.span("retrieval"):
+            raise ValueError("boom")
+    snapshot = registry.snapshot()
+    stage = snapshot["histograms"]['stage_seconds{stage="retrieval"}']
+    assert stage["count"] == 2
+    assert stage["p50"] == stage["p95"] == stage["p99"] == DEFAULT_BUCKETS[0]
+    assert snapshot["counters"] == {'stage_errors_total{stage="retrieval"}': 1}
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    with registry.span("llm"):
+        pass
+    registry.observe("stage_seconds", 1.0)
+    registry.inc("tool_calls_total")
+    registry.start_file_exporter("/nonexistent/metrics.jsonl")
+    assert registry.render_prometheus() == "\n"
+    assert registry._exporter is None
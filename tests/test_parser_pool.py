@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.parser_pool import ParserPool
+
+
+@pytest.fixture
+def csv_files(tmp_path):
+    big = tmp_path / "big.csv"
+    big.write_text("id,text\n" + "\n".join(f"{i},row {i} " + "x" * 200 for i in range(300)), encoding="utf-8")
+    small = tmp_path / "small.csv"
+    small.write_text("id,text\n1,hello world\n2,again\n", encoding="utf-8")
+    return str(big), str(small)
+
+
+def test_failed_task_does_not_affect_others(csv_files):
+    big, small = csv_files
+    pool = ParserPool(workers=2, timeout=6, queue_size=1)
+
+    def slow(chunks):
+        time.sleep(1)
+
+    def broken(chunks):
+        raise ValueError("broken")
+
+    async def run():
+        # 一个任务超时、一个任务的 on_chunks 出错，同时进行的解析都应正常完成
+        timed_out, ok = await asyncio.gather(
+            pool.parse(big, {}, 20, slow), pool.parse(small, {}, 20, [].extend), return_exceptions=True
+        )
+        assert isinstance(timed_out, TimeoutError)
+        assert ok.startswith("id: 1")
+        failed, ok = await asyncio.gather(
+            pool.parse(big, {}, 20, broken), pool.parse(small, {}, 20, None), return_exceptions=True
+        )
+        assert isinstance(failed, ValueError)
+        assert ok.startswith("id: 1")
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.close()
+
+
+def test_queued_time_does_not_count_and_wait_is_interruptible(csv_files):
+    _, small = csv_files
+    pool = ParserPool(workers=1, timeout=3.5)
+
+    def slow(chunks):
+        time.sleep(2)
+
+    def busy_for_a_while(chunks):
+        time.sleep(0.5)
+
+    async def run():
+        # 第二个任务排队约 2 秒，自身再用 2 秒，合计超过 timeout 也不应超时
+        first, second = await asyncio.gather(pool.parse(small, {}, 20, slow), pool.parse(small, {}, 20, slow))
+        assert first.startswith("id: 1") and second.startswith("id: 1")
+
+        # 排队中的任务可以被取消，名额不会泄漏
+        busy = asyncio.ensure_future(pool.parse(small, {}, 20, busy_for_a_while))
+        await asyncio.sleep(0.1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.parse(small, {}, 20, None), 0.1)
+        await busy
+        assert (await asyncio.wait_for(pool.parse(small, {}, 20, None), 1)).startswith("id: 1")
+
+        # 关闭进程池时排队的任务立即失败
+        busy = asyncio.ensure_future(pool.parse(small, {}, 20, busy_for_a_while))
+        await asyncio.sleep(0.1)
+        queued = asyncio.ensure_future(pool.parse(small, {}, 20, None))
+        await asyncio.sleep(0.1)
+        pool.close()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(queued, 0.2)
+        await busy
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.close()
@@ -0,0 +1,131 @@
+import sqlite3
+
+import pytest
+
+from frontend.storage import JSONStorage, SQLiteStorage
+from frontend.storage.base import ThreadQuery
+from frontend.storage.migrate import migrate_json_to_sqlite
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "json":
+        store = JSONStorage(str(tmp_path / "sessions.json"))
+    else:
+        store = SQLiteStorage(str(tmp_path / "sessions.db"))
+    yield store
+    store.close()
+
+
+def search(storage, text):
+    page = storage.list_threads(ThreadQuery(limit=10, search=text))
+    return [thread["id"] for thread in page.threads]
+
+
+def test_rename_removes_old_name_terms(storage):
+    storage.upsert_thread("t1", {"id": "t1", "createdAt": "2024-01-01T00:00:00", "userIdentifier": "u"}, {"name": "quarterly budget"})
+    storage.create_step({"id": "s1", "threadId": "t1", "createdAt": "2024-01-01T00:00:01", "input": "budget review"})
+    assert search(storage, "quarterly") == ["t1"]
+
+    storage.upsert_thread("t1", {}, {"name": "travel plan"})
+    assert search(storage, "quarterly") == []
+    assert search(storage, "travel") == ["t1"]
+    # 步骤文本中也出现的词项仍能检索到
+    assert search(storage, "budget") == ["t1"]
+
+
+def add_thread(storage, thread_id, created_at, user="u", name=None, feedback=None):
+    defaults = {"id": thread_id, "createdAt": created_at, "userIdentifier": user}
+    storage.upsert_thread(thread_id, defaults, {"name": name or f"thread {thread_id}"})
+    step = {"id": f"{thread_id}-s", "threadId": thread_id, "createdAt": created_at, "input": "hello"}
+    if feedback is not None:
+        step["feedback"] = {"value": feedback}
+    storage.create_step(step)
+
+
+def all_pages(storage, cursor=None, **kwargs):
+    ids = []
+    while True:
+        page = storage.list_threads(ThreadQuery(limit=3, cursor=cursor, **kwargs))
+        ids.extend(thread["id"] for thread in page.threads)
+        if not page.has_next:
+            return ids
+        cursor = page.end_cursor
+
+
+def test_pagination_is_newest_first_and_stable(storage):
+    for i in range(8):
+        add_thread(storage, f"t{i}", f"2024-01-0{i + 1}T00:00:00")
+    first = storage.list_threads(ThreadQuery(limit=3))
+    assert [thread["id"] for thread in first.threads] == ["t7", "t6", "t5"]
+    assert first.has_next
+
+    # 翻页期间新增对话不会让后续页面重复或遗漏
+    add_thread(storage, "t8", "2024-01-09T00:00:00")
+    assert all_pages(storage, first.end_cursor) == ["t4", "t3", "t2", "t1", "t0"]
+
+
+def test_pagination_filters(storage):
+    for i in range(7):
+        add_thread(storage, f"t{i}", f"2024-01-0{i + 1}T00:00:00",
+                   user="a" if i % 2 else "b", feedback=1 if i < 4 else None)
+    assert all_pages(storage, user_identifier="a") == ["t5", "t3", "t1"]
+    assert all_pages(storage, feedback=1) == ["t3", "t2", "t1", "t0"]
+    assert all_pages(storage, user_identifier="b", feedback=1) == ["t2", "t0"]
+    # 新步骤把对话移到最前
+    storage.create_step({"id": "late", "threadId": "t0", "createdAt": "2024-02-01T00:00:00", "input": "again"})
+    assert all_pages(storage)[:2] == ["t0", "t6"]
+    # 无法识别的旧版游标从头开始
+    page = storage.list_threads(ThreadQuery(limit=2, cursor="3"))
+    assert [thread["id"] for thread in page.threads] == ["t0", "t6"]
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    json_store = JSONStorage(str(tmp_path / "sessions.json"))
+    json_store.create_user({"identifier": "u", "createdAt": "2024-01-01T00:00:00"})
+    for i in range(4):
+        add_thread(json_store, f"t{i}", f"2024-01-0{i + 1}T00:00:00", name=f"report {i}", feedback=0 if i == 2 else None)
+    json_store.delete_thread("t3")
+    json_store.close()
+
+    assert migrate_json_to_sqlite(str(tmp_path / "sessions.json"), str(tmp_path / "sessions.db")) == (1, 3, 3)
+    sqlite_store = SQLiteStorage(str(tmp_path / "sessions.db"))
+    assert sqlite_store.get_default_user_identifier() == "u"
+    assert sqlite_store.is_thread_deleted("t3")
+    assert sqlite_store.get_thread("t1")["steps"][0]["input"] == "hello"
+    assert all_pages(sqlite_store) == ["t2", "t1", "t0"]
+    assert search(sqlite_store, "report") == ["t2", "t1", "t0"]
+    assert all_pages(sqlite_store, feedback=0) == ["t2"]
+    sqlite_store.close()
+
+
+def test_sqlite_upgrades_old_schema(tmp_path):
+    db_file = tmp_path / "old.db"
+    conn = sqlite3.connect(str(db_file))
+    # 版本 0 的数据库没有 lastActivity 列和检索索引
+    conn.executescript("""
+        CREATE TABLE threads (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, name TEXT,
+            createdAt TEXT, userId TEXT, userIdentifier TEXT, metadata TEXT, tags TEXT
+        );
+        CREATE TABLE steps (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, threadId TEXT NOT NULL,
+            createdAt TEXT, data TEXT NOT NULL
+        );
+    """)
+    conn.execute("INSERT INTO threads (id, name, createdAt) VALUES ('old', 'legacy notes', '2024-01-01T00:00:00')")
+    conn.execute("INSERT INTO threads (id, name, createdAt) VALUES ('new', 'other', '2024-01-02T00:00:00')")
+    conn.execute(
+        "INSERT INTO steps (id, threadId, createdAt, data) VALUES ('s', 'old', '2024-03-01T00:00:00', ?)",
+        ('{"id": "s", "threadId": "old", "input": "archived question", "feedback": {"value": 1}}',)
+    )
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(str(db_file))
+    assert storage._conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert all_pages(storage) == ["old", "new"]
+    assert search(storage, "archived") == ["old"]
+    assert search(storage, "legacy") == ["old"]
+    assert all_pages(storage, feedback=1) == ["old"]
+    storage.close()
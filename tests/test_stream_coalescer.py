@@ -0,0 +1,64 @@
+import asyncio
+
+from backend.stream_coalescer import TokenCoalescer
+
+
+async def tokens(parts):
+    # 数字表示生成停顿的秒数
+    for part in parts:
+        if isinstance(part, float):
+            await asyncio.sleep(part)
+        else:
+            yield part
+
+
+def frames(parts, **kwargs):
+    async def collect():
+        coalescer = TokenCoalescer(tokens(parts), **kwargs)
+        return [frame async for frame in coalescer], coalescer
+
+    return asyncio.run(collect())
+
+
+def test_first_token_alone_then_merged_in_order():
+    result, coalescer = frames(["", "你", "好", "，", "世界"], window=10)
+    assert result == ["你", "好，世界"]
+    assert coalescer.token_count == 5
+    assert coalescer.frame_count == 2
+    assert coalescer.byte_count == len("你好，世界".encode("utf-8"))
+
+
+def test_flushes_when_max_chars_reached():
+    result, _ = frames(["a"] + ["bb"] * 5, window=10, max_chars=4)
+    assert result == ["a", "bbbb", "bbbb", "bb"]
+
+
+def test_flushes_when_window_expires_during_pause():
+    result, _ = frames(["a", "b", "c", 0.2, "d", "e"], window=0.05)
+    assert result == ["a", "bc", "de"]
+
+
+def test_zero_window_passes_tokens_through():
+    result, coalescer = frames(["a", "", "b", "c"], window=0)
+    assert result == ["a", "b", "c"]
+    assert coalescer.token_count == 4
+
+
+def test_closing_early_cancels_pending_token():
+    async def run():
+        started = asyncio.Event()
+
+        async def slow():
+            yield "a"
+            yield "b"
+            started.set()
+            await asyncio.sleep(10)
+            yield "c"
+
+        stream = TokenCoalescer(slow(), window=0.01).__aiter__()
+        assert await stream.__anext__() == "a"
+        assert await stream.__anext__() == "b"
+        await asyncio.wait_for(started.wait(), 1)
+        await asyncio.wait_for(stream.aclose(), 1)
+
+    asyncio.run(run())
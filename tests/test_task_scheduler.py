@@ -0,0 +1,96 @@
+import asyncio
+
+from backend.task_scheduler import TaskScheduler
+
+
+class Tracker:
+    """记录同时运行的任务数，release 之前任务一直挂起"""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.done = []
+        self.release = asyncio.Event()
+
+    def task(self, name, error=None):
+        async def run():
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            try:
+                await self.release.wait()
+                if error is not None:
+                    raise error
+                self.done.append(name)
+            finally:
+                self.running -= 1
+        return run
+
+
+def test_workers_bound_concurrency():
+    async def run():
+        scheduler = TaskScheduler(max_workers=2)
+        tracker = Tracker()
+        for i in range(5):
+            assert scheduler.submit(f"title:{i}", tracker.task(i))
+        await asyncio.sleep(0.01)
+        assert tracker.running == 2
+        assert scheduler.stats()["pending"] == 3
+        tracker.release.set()
+        await scheduler.join()
+        assert tracker.peak == 2
+        assert sorted(tracker.done) == list(range(5))
+        assert scheduler.stats() == {"pending": 0, "completed": 5, "failed": 0, "dropped": 0}
+        await scheduler.close()
+
+    asyncio.run(run())
+
+
+def test_duplicate_key_is_ignored_until_finished():
+    async def run():
+        scheduler = TaskScheduler(max_workers=1)
+        tracker = Tracker()
+        assert scheduler.submit("title:c1", tracker.task("first"))
+        # 排队中和执行中都忽略重复提交
+        assert not scheduler.submit("title:c1", tracker.task("queued"))
+        await asyncio.sleep(0.01)
+        assert not scheduler.submit("title:c1", tracker.task("running"))
+        tracker.release.set()
+        await scheduler.join()
+        assert scheduler.submit("title:c1", tracker.task("again"))
+        await scheduler.join()
+        assert tracker.done == ["first", "again"]
+        await scheduler.close()
+
+    asyncio.run(run())
+
+
+def test_full_queue_drops_and_failures_do_not_stop_workers():
+    async def run():
+        scheduler = TaskScheduler(max_workers=1, max_pending=1)
+        tracker = Tracker()
+        assert scheduler.submit("a", tracker.task("a", error=RuntimeError("model unavailable")))
+        assert not scheduler.submit("b", tracker.task("b"))
+        assert scheduler.stats()["dropped"] == 1
+        tracker.release.set()
+        await scheduler.join()
+        # 丢弃的任务可以稍后重新提交，失败的任务不影响后续任务
+        assert scheduler.submit("b", tracker.task("b"))
+        await scheduler.join()
+        assert tracker.done == ["b"]
+        assert scheduler.stats() == {"pending": 0, "completed": 1, "failed": 1, "dropped": 1}
+        await scheduler.close()
+
+    asyncio.run(run())
+
+
+def test_close_cancels_running_tasks():
+    async def run():
+        scheduler = TaskScheduler(max_workers=2)
+        tracker = Tracker()
+        scheduler.submit("a", tracker.task("a"))
+        await asyncio.sleep(0.01)
+        assert tracker.running == 1
+        await scheduler.close()
+        assert tracker.running == 0
+
+    asyncio.run(run())
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from backend.tool_cache import ToolResultCache
+
+
+class Search:
+    """记录调用次数的假搜索工具，release 之前一直挂起"""
+
+    def __init__(self, result="结果", error=None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_calls_share_one_request():
+    async def run():
+        cache = ToolResultCache()
+        search = Search()
+        callers = [
+            asyncio.create_task(cache.get_or_run("search", {"query": query}, search))
+            for query in ("Python  asyncio", "python asyncio", "PYTHON ASYNCIO")
+        ]
+        await asyncio.sleep(0)
+        search.release.set()
+        assert await asyncio.gather(*callers) == ["结果"] * 3
+        assert await cache.get_or_run("search", {"query": "python asyncio"}, search) == "结果"
+        assert search.calls == 1
+        assert cache.stats()["coalesced"] == 2
+        assert cache.stats()["hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_failures_are_shared_but_not_cached():
+    async def run():
+        cache = ToolResultCache()
+        failing = Search(error=RuntimeError("rate limited"))
+        callers = [asyncio.create_task(cache.get_or_run("search", {"query": "q"}, failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        failing.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert [str(result) for result in results] == ["rate limited"] * 2
+        assert failing.calls == 1
+
+        # 失败后再次查询会重新执行
+        retry = Search()
+        retry.release.set()
+        assert await cache.get_or_run("search", {"query": "q"}, retry) == "结果"
+        assert retry.calls == 1
+        assert cache.stats()["entries"] == 1
+
+    asyncio.run(run())
+
+
+def test_caller_timeout_does_not_cancel_request():
+    async def run():
+        cache = ToolResultCache()
+        search = Search()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(cache.get_or_run("search", {"query": "q"}, search), 0.01)
+        # 后到的调用等待同一个仍在执行的请求
+        waiter = asyncio.create_task(cache.get_or_run("search", {"query": "q"}, search))
+        await asyncio.sleep(0)
+        search.release.set()
+        assert await waiter == "结果"
+        assert search.calls == 1
+
+    asyncio.run(run())
+
+
+def test_expired_and_evicted_entries_rerun():
+    async def run():
+        cache = ToolResultCache(ttl_seconds=0, max_entries=1)
+        search = Search()
+        search.release.set()
+        await cache.get_or_run("search", {"query": "q"}, search)
+        await cache.get_or_run("search", {"query": "q"}, search)
+        assert search.calls == 2
+
+        cache = ToolResultCache(max_entries=1)
+        for query in ("a", "b", "a"):
+            await cache.get_or_run("search", {"query": query}, search)
+        assert search.calls == 5
+        assert cache.stats()["entries"] == 1
+
+    asyncio.run(run())
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import time
+
+from backend.qa_chain import run_tool_call
+from backend.tool_cache import ToolResultCache
+
+
+class FakeTool:
+    """记录调用参数的假搜索工具，先等待 delay 秒，error 不为空时抛出异常"""
+
+    def __init__(self, result="结果", delay=0.0, error=None):
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.calls = []
+
+    async def ainvoke(self, args):
+        self.calls.append(args)
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def call(name, query="q"):
+    return {"id": f"call-{name}", "name": name, "arguments": json.dumps({"query": query})}
+
+
+def test_tool_result_is_returned():
+    tool = FakeTool(result=["a", "b"])
+    assert asyncio.run(run_tool_call(call("search"), {"search": tool}, 1)) == (True, "['a', 'b']")
+    assert tool.calls == [{"query": "q"}]
+
+
+def test_rate_limit_falls_back_to_other_tool():
+    limited = FakeTool(error=RuntimeError("202 Ratelimit"))
+    backup = FakeTool(result="备选结果")
+    tool_map = {"duckduckgo": limited, "tavily": backup}
+    assert asyncio.run(run_tool_call(call("duckduckgo"), tool_map, 1)) == (True, "备选结果")
+    assert len(limited.calls) == len(backup.calls) == 1
+
+
+def test_other_errors_and_timeouts_do_not_fall_back():
+    backup = FakeTool()
+    failing = {"search": FakeTool(error=ValueError("bad query")), "backup": backup}
+    success, content = asyncio.run(run_tool_call(call("search"), failing, 1))
+    assert not success and "bad query" in content
+
+    slow = {"search": FakeTool(delay=1), "backup": backup}
+    success, content = asyncio.run(run_tool_call(call("search"), slow, 0.05))
+    assert not success and "超时" in content
+    assert backup.calls == []
+
+
+def test_invalid_arguments_and_unknown_tool():
+    success, content = asyncio.run(run_tool_call({"name": "search", "arguments": "{bad"}, {}, 1))
+    assert not success and "参数解析失败" in content
+    success, content = asyncio.run(run_tool_call(call("missing"), {}, 1))
+    assert not success and "missing" in content
+
+
+def test_concurrent_calls_take_as_long_as_the_slowest():
+    async def run():
+        tools = {name: FakeTool(result=name, delay=0.2) for name in ("a", "b", "c")}
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run_tool_call(call(name), tools, 1) for name in tools))
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(run())
+    assert results == [(True, "a"), (True, "b"), (True, "c")]
+    assert elapsed < 0.5
+
+
+def test_cache_reuses_identical_query():
+    async def run():
+        cache = ToolResultCache()
+        tool = FakeTool(delay=0.05)
+        tool_map = {"search": tool}
+        results = await asyncio.gather(*(run_tool_call(call("search"), tool_map, 1, cache) for _ in range(3)))
+        results.append(await run_tool_call(call("search"), tool_map, 1, cache))
+        return tool, results
+
+    tool, results = asyncio.run(run())
+    assert results == [(True, "结果")] * 4
+    assert len(tool.calls) == 1
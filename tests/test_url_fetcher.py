@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.url_fetcher import FetchError, URLFetcher
+
+
+def make_fetcher(tmp_path, handler, **kwargs):
+    fetcher = URLFetcher(str(tmp_path), **kwargs)
+    fetcher.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return fetcher
+
+
+async def trickle(parts, delay=0.0):
+    for part in parts:
+        if delay:
+            await asyncio.sleep(delay)
+        yield part
+
+
+def test_sniffs_after_buffering_small_blocks(tmp_path):
+    page = b"<html><body>" + b"x" * 2000 + b"</body></html>"
+
+    def handler(request):
+        # 第一个数据块只有两个字节，不足以判断类型
+        return httpx.Response(200, headers={"content-type": "application/octet-stream"},
+                              content=trickle([b"  ", page[:10], page[10:]]))
+
+    fetcher = make_fetcher(tmp_path, handler)
+    result = asyncio.run(fetcher.fetch("https://example.com/page"))
+    assert result.kind == "html"
+    assert result.size == len(page) + 2
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_total_timeout(tmp_path):
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "text/plain"},
+                              content=trickle([b"a" * 100] * 100, delay=0.05))
+
+    fetcher = make_fetcher(tmp_path, handler, total_timeout=0.3)
+    with pytest.raises(FetchError):
+        asyncio.run(fetcher.fetch("https://example.com/slow"))
+    assert not list(tmp_path.glob("*.tmp"))